@@ -0,0 +1,178 @@
+"""
+Buffered writer for the analytics event tables (search_events, click_events).
+
+/compare, /go and /click used to open a fresh psycopg2 connection, INSERT a
+single row and commit on the request path — a Postgres TCP + auth round
+trip on every search and every click-out redirect. Handlers now call
+``record()`` instead, which appends the row to an in-process queue and
+returns immediately. A daemon thread drains the queue every
+``flush_interval`` seconds (or as soon as ``batch_size`` rows are waiting)
+and writes each table with one ``execute_values`` multi-row INSERT over a
+connection borrowed from the shared pool (app/db_pool.py).
+
+Guarantees:
+  * bounded memory — the queue holds at most ``max_events`` rows; when it
+    overflows the OLDEST rows are dropped (counted in ``stats()``)
+  * ``ts`` is captured at enqueue time, so buffering never skews the
+    timestamps the analytics-health dashboard reports
+  * ``close()`` (wired to the FastAPI shutdown hook) stops the thread and
+    flushes whatever is still queued
+
+Analytics are best-effort: a failed flush is logged and its rows are
+dropped rather than retried, matching the old per-request try/except.
+
+Typical usage (see app/main.py):
+
+    from app.analytics_sink import AnalyticsSink
+    sink = AnalyticsSink(get_analytics_conn)
+    sink.record("click_events", retailer=..., cid=..., target_url=...)
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Column order per table. ``ts`` is always written explicitly (enqueue time).
+EVENT_TABLES: Dict[str, Tuple[str, ...]] = {
+    "search_events": (
+        "ts", "brand", "line", "wrapper", "vitola", "size",
+        "zip_prefix", "cid", "ip_hash", "user_agent",
+    ),
+    "click_events": (
+        "ts", "retailer", "cid", "target_url", "ip_hash", "user_agent",
+    ),
+}
+
+
+class AnalyticsSink:
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        *,
+        max_events: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+    ):
+        self._connect = connect
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: Deque[Tuple[str, tuple]] = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped_overflow": 0,
+            "dropped_failed": 0,
+            "flushes": 0,
+            "last_error": None,
+        }
+
+    # ── producer side (request handlers) ───────────────────────────────
+
+    def record(self, table: str, **fields: Any) -> None:
+        """Queue one event row. Never blocks on the database."""
+        columns = EVENT_TABLES[table]
+        fields.setdefault("ts", datetime.now(timezone.utc))
+        row = tuple(fields.get(c) for c in columns)
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self._stats["dropped_overflow"] += 1
+            self._queue.append((table, row))
+            self._stats["enqueued"] += 1
+            pending = len(self._queue)
+        self._ensure_started()
+        if pending >= self._batch_size:
+            self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["queued"] = len(self._queue)
+        return out
+
+    # ── consumer side (background thread) ─────────────────────────────
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None or self._stopping.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="analytics-sink", daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _drain(self) -> List[Tuple[str, tuple]]:
+        with self._lock:
+            batch = list(self._queue)
+            self._queue.clear()
+        return batch
+
+    def flush(self) -> int:
+        """Write everything queued so far. Returns the number of rows written."""
+        with self._flush_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        batch = self._drain()
+        if not batch:
+            return 0
+        by_table: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        conn = None
+        try:
+            from psycopg2.extras import execute_values
+
+            conn = self._connect()
+            cur = conn.cursor()
+            for table, rows in by_table.items():
+                columns = ", ".join(EVENT_TABLES[table])
+                execute_values(
+                    cur,
+                    f"INSERT INTO {table} ({columns}) VALUES %s",
+                    rows,
+                    page_size=self._batch_size,
+                )
+            conn.commit()
+            cur.close()
+        except Exception as e:
+            logger.warning("[analytics] flush of %d event(s) failed: %s", len(batch), e)
+            with self._lock:
+                self._stats["dropped_failed"] += len(batch)
+                self._stats["last_error"] = str(e)
+            return 0
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        with self._lock:
+            self._stats["written"] += len(batch)
+            self._stats["flushes"] += 1
+        return len(batch)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the drain thread and flush anything still queued."""
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
@@ -0,0 +1,102 @@
+"""
+Pre-serialized, pre-compressed response bodies with HTTP validators.
+
+For endpoints whose output only changes when the product cache reloads
+(/options, landing pages, sitemaps) the body is rendered once, gzipped
+once, and served with a strong ETag. Repeat requests are answered from
+memory, and clients that already hold the current version get a bodiless
+304 instead of the payload.
+
+    body = CachedBody.from_json({"brands": brands})
+    return body.respond(request, cache_control="public, max-age=300")
+
+GZipMiddleware leaves responses that already carry ``Content-Encoding``
+alone, so the pre-compressed bytes are never compressed twice.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip (RFC 9110 q-values).
+
+    An explicit ``gzip`` / ``x-gzip`` entry wins over ``*``; ``q=0`` refuses.
+    """
+    explicit = wildcard = None
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if coding in ("gzip", "x-gzip"):
+            explicit = q if explicit is None else max(explicit, q)
+        elif coding == "*":
+            wildcard = q
+    q = explicit if explicit is not None else wildcard
+    return q is not None and q > 0
+
+
+class CachedBody:
+    __slots__ = ("body", "gzipped", "etag", "last_modified", "media_type")
+
+    def __init__(
+        self,
+        body: bytes,
+        media_type: str,
+        last_modified: Optional[float] = None,
+    ):
+        self.body = body
+        # mtime=0 keeps the gzip bytes deterministic for a given body.
+        self.gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.last_modified = (
+            formatdate(last_modified, usegmt=True) if last_modified else None
+        )
+        self.media_type = media_type
+
+    @classmethod
+    def from_json(cls, payload: Any, last_modified: Optional[float] = None) -> "CachedBody":
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return cls(body, "application/json", last_modified)
+
+    @classmethod
+    def from_text(cls, text: str, media_type: str, last_modified: Optional[float] = None) -> "CachedBody":
+        return cls(text.encode("utf-8"), media_type, last_modified)
+
+    def not_modified(self, request: Request) -> bool:
+        inm = request.headers.get("if-none-match")
+        if inm is not None:
+            tags = [t.strip() for t in inm.split(",")]
+            return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+        ims = request.headers.get("if-modified-since")
+        if ims and self.last_modified:
+            try:
+                return parsedate_to_datetime(ims) >= parsedate_to_datetime(self.last_modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def respond(self, request: Request, cache_control: str, status_code: int = 200) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if accepts_gzip(request.headers.get("accept-encoding")):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, status_code=status_code, media_type=self.media_type, headers=headers)
+        return Response(self.body, status_code=status_code, media_type=self.media_type, headers=headers)
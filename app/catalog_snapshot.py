@@ -0,0 +1,297 @@
+"""
+Compiled catalog snapshot: the git-managed catalog, pre-parsed, in one file.
+
+Every web worker used to rebuild the same structures from ~50 retailer CSVs
+and master_cigars.csv on startup (and again in the extension router):
+the master-joined product rows, the master index, the extension's master
+list, hostname -> retailer registry and URL -> CID index, and the /options
+tree. The nightly automation now compiles all of that into
+``data/catalog_snapshot.bin`` (``python -m app.catalog_snapshot``) and the
+web app maps the file instead of parsing CSVs.
+
+Layout::
+
+    b"CATSNAP\\0" | uint32 format | uint32 header length | header JSON | sections
+
+The header records a sha256 for every source file and, per section, its
+byte range and the sources it was compiled from. Sections are marshal
+blobs decoded on demand straight out of the mapping, so a worker only
+pays for the sections it uses, and a section is only used while every one
+of its sources still has the recorded digest. A CSV committed after the
+snapshot was built (extension publisher, manual fix) therefore falls back
+to normal parsing for just the sections it feeds. The code that compiles
+the sections (``PRODUCER_SOURCES``) is a source of every section, so a
+deploy that changes how rows are built invalidates the snapshot too. A
+snapshot from another format version or marshal version is ignored.
+
+    snap = open_snapshot()
+    rows = snap.section("master_index") if snap else None
+    if rows is None:
+        rows = parse_the_csv()
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import marshal
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SNAPSHOT_PATH = PROJECT_ROOT / "data" / "catalog_snapshot.bin"
+STATIC_DATA = PROJECT_ROOT / "static" / "data"
+MASTER_DB = PROJECT_ROOT / "data" / "master_cigars.db"
+# Pseudo-source for the set of CSV names, so a newly added retailer CSV
+# invalidates the registry / URL index even though no recorded file changed.
+STATIC_CSV_LISTING = "static/data/*.csv"
+# Modules whose code shapes the section values; recorded for every section.
+PRODUCER_SOURCES = [
+    PROJECT_ROOT / "app" / "main.py",
+    PROJECT_ROOT / "app" / "cid_matcher.py",
+    PROJECT_ROOT / "app" / "catalog_snapshot.py",
+]
+
+MAGIC = b"CATSNAP\0"
+# Bump whenever the meaning of a section changes.
+FORMAT_VERSION = 2
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _rel(path) -> str:
+    p = Path(path).resolve()
+    try:
+        return p.relative_to(PROJECT_ROOT).as_posix()
+    except ValueError:
+        return p.as_posix()
+
+
+_digest_cache: Dict[str, tuple] = {}
+_digest_lock = threading.Lock()
+
+
+def source_digest(path) -> Optional[str]:
+    """sha256 of the file's bytes (None if missing), cached per mtime/size.
+
+    Content rather than mtime, because a git checkout rewrites mtimes.
+    """
+    path = Path(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = str(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        cached = _digest_cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+    with _digest_lock:
+        _digest_cache[key] = (stamp, digest)
+    return digest
+
+
+def static_csv_paths() -> List[Path]:
+    """Every CSV the registry and URL index scan (see cid_matcher)."""
+    return sorted(STATIC_DATA.glob("*.csv")) if STATIC_DATA.exists() else []
+
+
+def _current_digest(rel: str) -> Optional[str]:
+    if rel == STATIC_CSV_LISTING:
+        names = "\n".join(p.name for p in static_csv_paths())
+        return hashlib.sha256(names.encode("utf-8")).hexdigest()
+    return source_digest(PROJECT_ROOT / rel)
+
+
+def products_digest(rows: Iterable[tuple]) -> str:
+    """Stable fingerprint of a product list given as field tuples."""
+    h = hashlib.sha256()
+    for row in rows:
+        h.update(repr(row).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+class CatalogSnapshot:
+    """A mapped snapshot file; ``section()`` decodes one section if it is fresh."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = _PREAMBLE.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a catalog snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has format {version}, expected {FORMAT_VERSION}")
+        start = _PREAMBLE.size
+        header = json.loads(bytes(self._map[start:start + header_len]))
+        if header.get("marshal") != marshal.version:
+            raise ValueError(f"{self.path} was written with marshal v{header.get('marshal')}")
+        self.header = header
+        self._base = start + header_len
+
+    def names(self) -> List[str]:
+        return list(self.header["sections"])
+
+    def is_fresh(self, name: str) -> bool:
+        meta = self.header["sections"].get(name)
+        if meta is None:
+            return False
+        sources = self.header["sources"]
+        return all(_current_digest(rel) == sources.get(rel) for rel in meta["sources"])
+
+    def section(self, name: str) -> Optional[Any]:
+        """Decoded section, or None when absent or any of its sources changed.
+
+        Every call decodes a new object, so callers may mutate the result.
+        """
+        if not self.is_fresh(name):
+            return None
+        meta = self.header["sections"][name]
+        offset = self._base + meta["offset"]
+        return marshal.loads(memoryview(self._map)[offset:offset + meta["length"]])
+
+
+_snapshot_cache: Dict[str, Any] = {"signature": None, "snapshot": None}
+_snapshot_lock = threading.Lock()
+
+
+def open_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[CatalogSnapshot]:
+    """The process-wide mapping of ``path``, re-opened when the file is replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+    with _snapshot_lock:
+        if _snapshot_cache["signature"] != signature:
+            try:
+                snapshot = CatalogSnapshot(path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("catalog snapshot %s unusable: %s", path, e)
+                snapshot = None
+            _snapshot_cache.update({"signature": signature, "snapshot": snapshot})
+        return _snapshot_cache["snapshot"]
+
+
+# ── Writer (nightly automation) ────────────────────────────────────────
+
+def build_sections() -> Dict[str, tuple]:
+    """``{name: (value, [source paths])}`` compiled from the current tree."""
+    # Imported here: app.main imports this module.
+    from app.main import (  # type: ignore
+        RETAILERS,
+        Product,
+        _PRODUCT_FIELDS,
+        _master_csv_path,
+        build_options_tree,
+        load_csv,
+        load_master_index,
+    )
+    from app.cid_matcher import build_retailer_registry, load_master_cigars, load_retailer_url_index
+
+    master_csv = _master_csv_path()
+    master_index = load_master_index()
+    sections: Dict[str, tuple] = {
+        "master_index": (master_index, [master_csv]),
+        "master_cigars": (load_master_cigars(master_csv), [master_csv]),
+    }
+
+    csv_products = []
+    for retailer in RETAILERS:
+        if retailer.get("extractor_status") == "dormant":
+            continue
+        rows = load_csv(retailer["csv"], retailer["key"], retailer["name"], master_index=master_index)
+        csv_products.extend(rows)
+        sections[f"products/{retailer['key']}"] = (
+            {
+                "fields": list(Product.__slots__),
+                "retailer_name": retailer["name"],
+                "rows": [_PRODUCT_FIELDS(p) for p in rows],
+            },
+            [retailer["csv"], master_csv],
+        )
+
+    # Hostnames of blocked retailers come from code, not CSVs, so they are
+    # merged in by the reader (cid_matcher.merge_extra_hosts).
+    static_csvs = [STATIC_CSV_LISTING, *static_csv_paths()]
+    sections["retailer_registry"] = (build_retailer_registry(STATIC_DATA), static_csvs)
+    sections["url_index"] = (load_retailer_url_index(STATIC_DATA), static_csvs)
+
+    # Valid for a live product list identical to the CSV rows alone, i.e.
+    # while no overlay or community rows are merged on top; the digest
+    # covers the products, master_cigars.db supplies the wrapper aliases.
+    sections["options"] = (
+        {
+            "products_digest": products_digest(map(_PRODUCT_FIELDS, csv_products)),
+            "brands": build_options_tree(csv_products),
+        },
+        [MASTER_DB],
+    )
+    return {name: (value, [*deps, *PRODUCER_SOURCES]) for name, (value, deps) in sections.items()}
+
+
+def write_snapshot(path: Path = SNAPSHOT_PATH) -> bool:
+    """Compile and write the snapshot atomically. Returns False if unchanged."""
+    path = Path(path)
+    sources: Dict[str, Optional[str]] = {}
+    meta: Dict[str, dict] = {}
+    blobs: List[bytes] = []
+    offset = 0
+    for name, (value, deps) in build_sections().items():
+        rels = []
+        for dep in deps:
+            rel = dep if dep == STATIC_CSV_LISTING else _rel(dep)
+            sources[rel] = _current_digest(rel)
+            rels.append(rel)
+        blob = marshal.dumps(value)
+        meta[name] = {"offset": offset, "length": len(blob), "sources": rels}
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps(
+        {"marshal": marshal.version, "sources": sources, "sections": meta},
+        sort_keys=True, separators=(",", ":"),
+    ).encode("utf-8")
+    data = b"".join([_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)), header, *blobs])
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    sys.path.insert(0, str(PROJECT_ROOT))
+    parser = argparse.ArgumentParser(description="Compile data/catalog_snapshot.bin from the catalog CSVs.")
+    parser.add_argument("--out", default=str(SNAPSHOT_PATH), help="snapshot path (default: data/catalog_snapshot.bin)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LANDING_PAGE_WARM", "0")
+    started = time.time()
+    changed = write_snapshot(Path(args.out))
+    size = os.path.getsize(args.out)
+    print(
+        f"Catalog snapshot {'written' if changed else 'unchanged'}: {args.out} "
+        f"({size / 1024:.0f} KB, {time.time() - started:.1f}s)"
+    )
@@ -16,15 +16,18 @@ Public surface:
     load_master_cigars(csv_path)         -> list[dict]
     find_unique_metadata_match(brand, line, vitola, box_qty, wrapper_bucket, master) -> dict | None
     find_top_candidates(url, title, master, limit=5) -> list[dict]
+    find_top_candidates_many([(url, title), ...], master, limit=5) -> list[list[dict]]
+    CidTokenIndex(cid_parts_list)        -> inverted index behind the above
     hostname_to_retailer_key(hostname, registry) -> str | None
 """
 from __future__ import annotations
 
 import csv
 import re
+import sys
 import unicodedata
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
 # Query parameters we strip from URLs before any URL-index lookup or
@@ -327,7 +330,13 @@ def _size_match(
     only when the length matches to the tenth of an inch (so callers can
     still distinguish 5.5x52 vs 5x52 if they want to).
     """
-    cid_parsed = _parse_size(cid_size)
+    return _parsed_size_match(_parse_size(cid_size), haystack)
+
+
+def _parsed_size_match(
+    cid_parsed: Optional[Tuple[float, int]],
+    haystack: str,
+) -> Tuple[bool, bool]:
     if not cid_parsed:
         return False, False
     cid_len, cid_ring = cid_parsed
@@ -345,30 +354,68 @@ def _size_match(
     return False, False
 
 
-def programmatic_score(
-    cid_parts: Dict[str, str],
-    url: str,
-    title: Optional[str] = None,
-) -> Tuple[float, Dict[str, bool]]:
-    """Score how well a URL (and optional scraped title) matches a CID.
+# Vitola is what physically defines a cigar (Robusto vs Toro vs Torpedo).
+# Retailers often round the printed size (5.5"x52 vs 5"x52) for the same
+# SKU, so we weight vitola higher than size and treat size as a tiebreaker
+# rather than a primary signal.
+_SCORE_WEIGHTS = {
+    "brand": 0.25,
+    "line": 0.30,
+    "vitola": 0.22,
+    "wrapper": 0.10,
+    "box_qty": 0.07,
+    "size": 0.06,
+}
 
-    Returns (score 0-1, details dict with per-component booleans). ``details``
-    also includes ``size_exact`` to distinguish exact size matches from
-    tolerance matches; ``size_match`` remains True for either case so the
-    confidence buckets pick up both.
-    """
-    slug_text = slug_from_url(url)
-    haystack = slug_text + " " + _normalize_text(title or "")
-
-    brand = (cid_parts.get("brand") or "").lower().replace("_", " ")
-    line_raw = (cid_parts.get("line") or "").lower().replace("_", " ")
-    line_spaced = re.sub(r"(\d+)([a-z])", r"\1 \2", line_raw, flags=re.I)
-    line_spaced = re.sub(r"([a-z])([A-Z])", r"\1 \2", line_spaced).lower()
-    vitola = (cid_parts.get("vitola") or "").lower().replace("_", " ")
-    wrapper_code = cid_parts.get("wrapper_code") or ""
-    box_qty_str = cid_parts.get("box_qty_str") or ""
-    size = (cid_parts.get("size") or "").lower()
 
+class _CidFeatures:
+    """Everything ``programmatic_score`` derives from a CID, computed once."""
+
+    __slots__ = ("brand_words", "line_words", "vitola_words", "wrapper_code",
+                 "wrapper_names", "box_qty_res", "size", "ring")
+
+    def __init__(self, cid_parts: Dict[str, str]):
+        brand = (cid_parts.get("brand") or "").lower().replace("_", " ")
+        line_raw = (cid_parts.get("line") or "").lower().replace("_", " ")
+        line_spaced = re.sub(r"(\d+)([a-z])", r"\1 \2", line_raw, flags=re.I)
+        line_spaced = re.sub(r"([a-z])([A-Z])", r"\1 \2", line_spaced).lower()
+        vitola = (cid_parts.get("vitola") or "").lower().replace("_", " ")
+        self.brand_words = [w for w in brand.split() if w]
+        self.line_words = [w for w in line_spaced.split() if len(w) > 2]
+        self.vitola_words = [w for w in vitola.split() if len(w) > 2]
+        self.wrapper_code = cid_parts.get("wrapper_code") or ""
+        self.wrapper_names = WRAPPER_CODE_TO_NAMES.get(self.wrapper_code, [])
+        box_qty_num = re.search(r"\d+", cid_parts.get("box_qty_str") or "")
+        if box_qty_num:
+            qty = box_qty_num.group()
+            self.box_qty_res = (
+                re.compile(rf"\bbox(?: of)? {qty}\b"),
+                re.compile(rf"\b{qty}[ -]?(count|pack|ct)\b"),
+            )
+        else:
+            self.box_qty_res = None
+        self.size = _parse_size((cid_parts.get("size") or "").lower())
+        self.ring = self.size[1] if self.size else None
+
+    def anchor_words(self) -> Set[str]:
+        """Words of which at least one must occur for a brand, line or vitola hit.
+
+        A full brand match needs every brand word (so the longest one), a
+        partial one a word longer than 3; line and vitola credit needs at
+        least one of their words.
+        """
+        words = set(self.line_words) | set(self.vitola_words)
+        words.update(w for w in self.brand_words if len(w) > 3)
+        if self.brand_words:
+            words.add(max(self.brand_words, key=len))
+        return words
+
+
+def _match_haystack(url: str, title: Optional[str]) -> str:
+    return slug_from_url(url) + " " + _normalize_text(title or "")
+
+
+def _score_features(f: _CidFeatures, haystack: str) -> Tuple[float, Dict[str, bool]]:
     details = {
         "brand_match": False,
         "line_match": False,
@@ -380,20 +427,9 @@ def programmatic_score(
     }
 
     score = 0.0
-    # Vitola is what physically defines a cigar (Robusto vs Toro vs Torpedo).
-    # Retailers often round the printed size (5.5"x52 vs 5"x52) for the same
-    # SKU, so we weight vitola higher than size and treat size as a tiebreaker
-    # rather than a primary signal.
-    weights = {
-        "brand": 0.25,
-        "line": 0.30,
-        "vitola": 0.22,
-        "wrapper": 0.10,
-        "box_qty": 0.07,
-        "size": 0.06,
-    }
+    weights = _SCORE_WEIGHTS
 
-    brand_words = [w for w in brand.split() if w]
+    brand_words = f.brand_words
     if brand_words:
         if all(w in haystack for w in brand_words):
             score += weights["brand"]
@@ -402,7 +438,7 @@ def programmatic_score(
             score += weights["brand"] * 0.5
             details["brand_match"] = True
 
-    line_words = [w for w in line_spaced.split() if len(w) > 2]
+    line_words = f.line_words
     if line_words:
         matched = sum(1 for w in line_words if w in haystack)
         ratio = matched / len(line_words)
@@ -413,7 +449,7 @@ def programmatic_score(
             score += weights["line"] * 0.5
             details["line_match"] = True
 
-    vitola_words = [w for w in vitola.split() if len(w) > 2]
+    vitola_words = f.vitola_words
     if vitola_words:
         if all(w in haystack for w in vitola_words):
             score += weights["vitola"]
@@ -422,17 +458,13 @@ def programmatic_score(
             score += weights["vitola"] * 0.5
             details["vitola_match"] = True
 
-    wrapper_names = WRAPPER_CODE_TO_NAMES.get(wrapper_code, [])
-    if any(name in haystack for name in wrapper_names):
+    if any(name in haystack for name in f.wrapper_names):
         score += weights["wrapper"]
         details["wrapper_match"] = True
 
-    box_qty_num = re.search(r"\d+", box_qty_str)
-    if box_qty_num:
-        qty = box_qty_num.group()
-        if re.search(rf"\bbox(?: of)? {qty}\b", haystack) or re.search(
-            rf"\b{qty}[ -]?(count|pack|ct)\b", haystack
-        ):
+    if f.box_qty_res:
+        box_re, count_re = f.box_qty_res
+        if box_re.search(haystack) or count_re.search(haystack):
             score += weights["box_qty"]
             details["box_qty_match"] = True
 
@@ -440,7 +472,7 @@ def programmatic_score(
     # SIZE_LENGTH_TOLERANCE_IN. Exact length matches get full weight; tolerance
     # matches get 60% so they still help but don't fully outweigh a vitola
     # mismatch on a near-duplicate.
-    matched, exact = _size_match(size, haystack)
+    matched, exact = _parsed_size_match(f.size, haystack)
     if matched:
         score += weights["size"] if exact else weights["size"] * 0.6
         details["size_match"] = True
@@ -449,6 +481,106 @@ def programmatic_score(
     return min(score, 1.0), details
 
 
+def programmatic_score(
+    cid_parts: Dict[str, str],
+    url: str,
+    title: Optional[str] = None,
+) -> Tuple[float, Dict[str, bool]]:
+    """Score how well a URL (and optional scraped title) matches a CID.
+
+    Returns (score 0-1, details dict with per-component booleans). ``details``
+    also includes ``size_exact`` to distinguish exact size matches from
+    tolerance matches; ``size_match`` remains True for either case so the
+    confidence buckets pick up both.
+    """
+    return _score_features(_CidFeatures(cid_parts), _match_haystack(url, title))
+
+
+class CidTokenIndex:
+    """Inverted index from brand / line / vitola words to CIDs.
+
+    ``programmatic_score`` credits a word when it occurs anywhere in the
+    URL slug + title, so lookups enumerate the substrings of each haystack
+    token (bounded by the vocabulary's word lengths) instead of scoring
+    every CID. A CID none of whose anchor words occur can still collect
+    wrapper + box + size credit; ``candidates`` adds those through small
+    wrapper-code and ring-gauge indexes whenever that could reach
+    ``min_score``. Scoring the returned positions gives exactly the same
+    hits as scoring the whole list.
+    """
+
+    def __init__(self, cid_parts_list: Iterable[Optional[Dict[str, str]]]):
+        self.features: List[Optional[_CidFeatures]] = []
+        self._by_word: Dict[str, List[int]] = {}
+        self._by_wrapper: Dict[str, List[int]] = {}
+        self._by_ring: Dict[int, List[int]] = {}
+        # CIDs without anchor words can't be pruned by them.
+        self._always: List[int] = []
+        for pos, parts in enumerate(cid_parts_list):
+            f = _CidFeatures(parts) if parts else None
+            self.features.append(f)
+            if f is None:
+                continue
+            words = f.anchor_words()
+            if not f.brand_words:
+                self._always.append(pos)
+            for w in words:
+                self._by_word.setdefault(w, []).append(pos)
+            if f.wrapper_names:
+                self._by_wrapper.setdefault(f.wrapper_code, []).append(pos)
+            if f.ring is not None:
+                self._by_ring.setdefault(f.ring, []).append(pos)
+        lengths = [len(w) for w in self._by_word]
+        self._min_len = min(lengths, default=1)
+        self._max_len = max(lengths, default=0)
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def anchored(self, haystack: str) -> Set[int]:
+        """Positions with at least one anchor word in ``haystack``."""
+        hits: Set[int] = set(self._always)
+        by_word = self._by_word
+        lo, hi = self._min_len, self._max_len
+        for tok in set(haystack.split()):
+            n = len(tok)
+            for i in range(n - lo + 1):
+                for j in range(i + lo, min(n, i + hi) + 1):
+                    found = by_word.get(tok[i:j])
+                    if found:
+                        hits.update(found)
+        return hits
+
+    def candidates(self, haystack: str, min_score: float) -> List[int]:
+        """Positions that could score ``min_score`` or more, in list order."""
+        w = _SCORE_WEIGHTS
+        if w["box_qty"] >= min_score:
+            # Box quantity alone clears the bar; nothing can be pruned.
+            return [pos for pos, f in enumerate(self.features) if f is not None]
+        hits = self.anchored(haystack)
+        if w["wrapper"] + w["box_qty"] + w["size"] >= min_score:
+            codes = {
+                code for code in self._by_wrapper
+                if any(name in haystack for name in WRAPPER_CODE_TO_NAMES[code])
+            }
+            rings = {int(m.group(2)) for m in _SIZE_RE.finditer(haystack)}
+            extra: Set[int] = set()
+            for code in codes:
+                extra.update(self._by_wrapper[code])
+            for ring in rings:
+                extra.update(self._by_ring.get(ring, ()))
+            for pos in extra - hits:
+                f = self.features[pos]
+                bound = w["box_qty"]
+                if f.wrapper_code in codes:
+                    bound += w["wrapper"]
+                if f.ring in rings:
+                    bound += w["size"]
+                if bound + 1e-9 >= min_score:
+                    hits.add(pos)
+        return sorted(hits)
+
+
 def _confidence_label(score: float, details: Dict[str, bool]) -> str:
     """Bucket a numeric score into HIGH / MEDIUM / LOW for UI use."""
     strong = details.get("brand_match") and details.get("line_match")
@@ -466,29 +598,36 @@ def load_master_cigars(csv_path: Path) -> List[Dict[str, str]]:
 
     Returns rows with normalized keys (lowercased, spaces -> underscores) plus
     the original CID parsed into convenient fields. Safe to cache.
+
+    Field strings are interned: a few hundred brands / lines / wrappers
+    repeat across thousands of rows, and the same values also sit in
+    app.main's master index.
     """
     if not csv_path.exists():
         return []
+    intern = sys.intern
     out: List[Dict[str, str]] = []
     with csv_path.open("r", newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            cid = (row.get("cigar_id") or "").strip()
+            cid = intern((row.get("cigar_id") or "").strip())
             if not cid:
                 continue
             parts = parse_cid(cid)
             if not parts:
                 continue
+            parts = {k: intern(v) for k, v in parts.items()}
+            parts["raw"] = cid
             box_qty_str = parts["box_qty_str"]
             box_qty_int: Optional[int]
             m = re.search(r"\d+", box_qty_str)
             box_qty_int = int(m.group()) if m else None
             out.append({
                 "cigar_id": cid,
-                "brand": (row.get("Brand") or "").strip(),
-                "line": (row.get("Line") or "").strip(),
-                "vitola": (row.get("Vitola") or "").strip(),
-                "wrapper": (row.get("Wrapper") or "").strip(),
+                "brand": intern((row.get("Brand") or "").strip()),
+                "line": intern((row.get("Line") or "").strip()),
+                "vitola": intern((row.get("Vitola") or "").strip()),
+                "wrapper": intern((row.get("Wrapper") or "").strip()),
                 "wrapper_code": parts["wrapper_code"],
                 "size": parts["size"],
                 "box_qty": box_qty_int,
@@ -593,6 +732,22 @@ def find_unique_metadata_match(
     }
 
 
+# (master list, its length, CidTokenIndex) for the last master list seen.
+_token_index_cache: Dict[str, Any] = {"entry": None}
+
+
+def master_token_index(master: Sequence[Dict[str, str]]) -> CidTokenIndex:
+    """CidTokenIndex over ``master`` rows; rebuilt only for a different list."""
+    entry = _token_index_cache["entry"]
+    if entry is not None and entry[0] is master and entry[1] == len(master):
+        return entry[2]
+    index = CidTokenIndex(
+        row.get("_parts") or parse_cid(row.get("cigar_id", "")) for row in master
+    )
+    _token_index_cache["entry"] = (master, len(master), index)
+    return index
+
+
 def find_top_candidates(
     url: str,
     title: Optional[str],
@@ -600,19 +755,58 @@ def find_top_candidates(
     limit: int = 5,
     min_score: float = 0.20,
 ) -> List[Dict[str, object]]:
-    """Score every master row against the URL+title and return the top N.
+    """Score the master rows against the URL+title and return the top N.
 
+    Only rows the token index can't rule out are scored.
     Output items have: cigar_id, score, confidence, details, brand, line,
     vitola, wrapper, wrapper_code, size, box_qty.
     """
+    if not isinstance(master, (list, tuple)):
+        master = list(master)
+    index = master_token_index(master)
+    return _top_candidates(index, master, _match_haystack(url, title), limit, min_score)
+
+
+def find_top_candidates_many(
+    queries: Iterable[Tuple[str, Optional[str]]],
+    master: Iterable[Dict[str, str]],
+    limit: int = 5,
+    min_score: float = 0.20,
+) -> List[List[Dict[str, object]]]:
+    """``find_top_candidates`` for many (url, title) pairs against one index."""
+    if not isinstance(master, (list, tuple)):
+        master = list(master)
+    index = master_token_index(master)
+    return [
+        _top_candidates(index, master, _match_haystack(url, title), limit, min_score)
+        for url, title in queries
+    ]
+
+
+def _af_anejo_reserva_penalty(cid: str) -> int:
+    pp = parse_cid(cid)
+    if not pp:
+        return 0
+    if _ascii_ident_token(pp.get("brand")) != "ARTUROFUENTE":
+        return 0
+    if _ascii_ident_token(pp.get("line")) == "ANEJORESERVA":
+        return 1
+    return 0
+
+
+def _top_candidates(
+    index: CidTokenIndex,
+    master: Sequence[Dict[str, str]],
+    haystack: str,
+    limit: int,
+    min_score: float,
+) -> List[Dict[str, object]]:
     scored: List[Tuple[float, Dict[str, object]]] = []
-    for row in master:
-        parts = row.get("_parts") or parse_cid(row.get("cigar_id", ""))
-        if not parts:
-            continue
-        score, details = programmatic_score(parts, url, title)
+    for pos in index.candidates(haystack, min_score):
+        score, details = _score_features(index.features[pos], haystack)
         if score < min_score:
             continue
+        row = master[pos]
         scored.append((score, {
             "cigar_id": row["cigar_id"],
             "score": round(score, 3),
@@ -627,16 +821,6 @@ def find_top_candidates(
             "box_qty": row.get("box_qty"),
         }))
 
-    def _af_anejo_reserva_penalty(cid: str) -> int:
-        pp = parse_cid(cid)
-        if not pp:
-            return 0
-        if _ascii_ident_token(pp.get("brand")) != "ARTUROFUENTE":
-            return 0
-        if _ascii_ident_token(pp.get("line")) == "ANEJORESERVA":
-            return 1
-        return 0
-
     scored.sort(
         key=lambda x: (-x[0], _af_anejo_reserva_penalty(str(x[1].get("cigar_id") or "")), str(x[1].get("cigar_id") or "")),
     )
@@ -769,19 +953,27 @@ def build_retailer_registry(
                         break
             except Exception:
                 continue
-    # Merge explicit blocked-retailer hostnames. setdefault() means CSV
-    # entries win on conflict — defensive choice in case an extractor
-    # comes online later and the CSV has data we should trust.
     if extra_hosts:
-        for host, key in extra_hosts.items():
-            h = (host or "").strip().lower()
-            if not h or not key:
-                continue
-            registry.setdefault(h, key)
-            if h.startswith("www."):
-                registry.setdefault(h[4:], key)
-            else:
-                registry.setdefault("www." + h, key)
+        merge_extra_hosts(registry, extra_hosts)
+    return registry
+
+
+def merge_extra_hosts(registry: Dict[str, str], extra_hosts: Dict[str, str]) -> Dict[str, str]:
+    """Merge explicit ``{hostname: retailer_key}`` entries into ``registry``.
+
+    setdefault() means CSV entries win on conflict — defensive choice in
+    case an extractor comes online later and the CSV has data we should
+    trust.
+    """
+    for host, key in extra_hosts.items():
+        h = (host or "").strip().lower()
+        if not h or not key:
+            continue
+        registry.setdefault(h, key)
+        if h.startswith("www."):
+            registry.setdefault(h[4:], key)
+        else:
+            registry.setdefault("www." + h, key)
     return registry
 
 
@@ -11,6 +11,8 @@ review still happens through the admin endpoints in extension_endpoints.
 Tables created here:
 
   * observed_prices            — every per-URL price reading we capture
+  * latest_observed            — newest counted reading per (retailer, CID),
+                                 kept in step with observed_prices
   * community_url_proposals    — consumer-suggested metadata for URLs not
                                  yet mapped to a CID (operator approves
                                  and turns it into a real CID)
@@ -43,8 +45,8 @@ import logging
 import re
 import time
 import unicodedata
-from collections import defaultdict, deque
-from typing import Any, Deque, Dict, List, Optional
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Query, Request
@@ -58,6 +60,8 @@ from app.cid_matcher import (
     merge_cid_into_url_index,
     url_index_entry_cids,
 )
+from app.rate_limit import RateLimiter
+from app.token_automaton import TokenAutomaton
 
 logger = logging.getLogger(__name__)
 
@@ -65,36 +69,17 @@ router = APIRouter(prefix="/api/community", tags=["community"])
 
 
 # ── Rate limiting ──────────────────────────────────────────────────────
-# Simple per-observer sliding window. Railway runs single-instance today,
-# so an in-process bucket is fine. If we move to multi-instance we'll
-# switch to a Postgres-backed counter or Redis.
+# Fixed-memory GCRA limiters (app/rate_limit.py). State is per process
+# unless COMMUNITY_RATE_LIMIT_BACKEND points every Uvicorn worker at the
+# same SQLite file or Postgres table.
 
 _OBSERVE_MAX_PER_MIN = 60
 _OBSERVE_MAX_PER_DAY = 5_000
 _PROPOSE_MAX_PER_HOUR = 30
 
-_obs_minute: Dict[str, Deque[float]] = defaultdict(deque)
-_obs_day:    Dict[str, Deque[float]] = defaultdict(deque)
-_prop_hour:  Dict[str, Deque[float]] = defaultdict(deque)
-
-
-def _rate_limit(bucket: Dict[str, Deque[float]], key: str, window_s: float, cap: int) -> bool:
-    """Return True if a hit is allowed; False if the bucket is full.
-
-    Works with either a defaultdict(deque) or a plain dict; missing keys
-    are auto-created.
-    """
-    now = time.time()
-    q = bucket.get(key)
-    if q is None:
-        q = deque()
-        bucket[key] = q
-    while q and (now - q[0]) > window_s:
-        q.popleft()
-    if len(q) >= cap:
-        return False
-    q.append(now)
-    return True
+_obs_minute = RateLimiter("observe_minute", 60, _OBSERVE_MAX_PER_MIN)
+_obs_day    = RateLimiter("observe_day", 86_400, _OBSERVE_MAX_PER_DAY)
+_prop_hour  = RateLimiter("propose_hour", 3600, _PROPOSE_MAX_PER_HOUR)
 
 
 def _observer_id(body_observer_id: Optional[str], request: Request) -> str:
@@ -281,6 +266,30 @@ def init_community_tables() -> None:
             CREATE INDEX IF NOT EXISTS community_retailer_requests_hostname_idx
                 ON community_retailer_requests (hostname)
         """)
+        # One row per (retailer_key, cigar_id): the newest counted ('box',
+        # priced, CID-mapped) observation plus a running report count.
+        # Maintained by record_latest_observed() next to every insert, so
+        # the observed overlay never has to scan observed_prices.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS latest_observed (
+                retailer_key TEXT NOT NULL,
+                cigar_id TEXT NOT NULL,
+                price_cents INTEGER NOT NULL,
+                in_stock BOOLEAN,
+                box_qty INTEGER,
+                scraped_title TEXT,
+                url TEXT NOT NULL,
+                observed_at TIMESTAMPTZ NOT NULL,
+                -- Reports since count_since; restarts once the pair has
+                -- gone LATEST_OBSERVED_COUNT_DAYS without a report.
+                observation_count INTEGER NOT NULL DEFAULT 1,
+                count_since TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (retailer_key, cigar_id)
+            )
+        """)
+        cur.execute("SELECT 1 FROM latest_observed LIMIT 1")
+        if cur.fetchone() is None:
+            rebuild_latest_observed(cur)
         conn.commit()
         conn.close()
         logger.info("Community tables initialized")
@@ -293,6 +302,13 @@ def _get_conn():
     return get_analytics_conn()
 
 
+async def _get_conn_async():
+    # Pool checkout that waits in a worker thread when every connection is
+    # busy, so a saturated pool doesn't stall the event loop.
+    from app.db_pool import get_analytics_conn_async
+    return await get_analytics_conn_async()
+
+
 # ── Pydantic bodies ────────────────────────────────────────────────────
 
 _VALID_QTY_TYPES = {"box", "pack5", "pack10", "pack20", "single", "unknown"}
@@ -319,6 +335,16 @@ class ObserveBody(BaseModel):
     observer_source: Optional[str] = "consumer"
 
 
+# Enough for a category page full of product tiles.
+_OBSERVE_BATCH_MAX = 50
+
+
+class ObserveBatchBody(BaseModel):
+    """Several observations from one observer (category / search pages)."""
+    observer_id: Optional[str] = None
+    observations: List[ObserveBody] = Field(default_factory=list)
+
+
 class ProposeMetadataBody(BaseModel):
     url: str = Field(..., min_length=1, max_length=2048)
     observer_id: Optional[str] = None
@@ -389,15 +415,20 @@ class RequestRetailerBody(BaseModel):
 
 # ── Helpers ────────────────────────────────────────────────────────────
 
-def _resolve_retailer_key(url: str) -> Optional[str]:
-    """Map a URL host to a known retailer_key using the extension's cache."""
+def _resolve_retailer_key(url: str, refresh: bool = True) -> Optional[str]:
+    """Map a URL host to a known retailer_key using the extension's cache.
+
+    ``refresh=False`` skips the cache TTL check, for callers resolving a
+    batch after refreshing once themselves.
+    """
     try:
         from app.extension_endpoints import _cache_state, _refresh_cache  # type: ignore
         from app.cid_matcher import hostname_to_retailer_key  # type: ignore
     except Exception:
         return None
     try:
-        _refresh_cache()
+        if refresh:
+            _refresh_cache()
         host = (urlparse(url).hostname or "").lower()
         return hostname_to_retailer_key(host, _cache_state.get("retailers", {}))
     except Exception:
@@ -487,8 +518,266 @@ def _to_price_cents(price: Optional[float]) -> Optional[int]:
         return None
 
 
+# ── Latest observation per (retailer, CID) ────────────────────────────
+
+# Observation counts ("based on N reports") cover the current run of
+# reports with no gap longer than this; matches the overlay window.
+LATEST_OBSERVED_COUNT_DAYS = 14
+
+
+def record_latest_observed(
+    cur,
+    retailer_key: Optional[str],
+    cigar_id: Optional[str],
+    quantity_type: Optional[str],
+    price_cents: Optional[int],
+    in_stock: Optional[bool],
+    box_qty: Optional[int],
+    scraped_title: Optional[str],
+    url: str,
+) -> None:
+    """Fold an observation just inserted on ``cur`` into ``latest_observed``.
+
+    Call in the same transaction as the observed_prices INSERT: both use
+    the transaction's NOW(), so the row mirrors what a DISTINCT ON scan
+    would pick. Observations the overlay ignores are skipped.
+    """
+    record_latest_observed_many(cur, [(
+        retailer_key, cigar_id, quantity_type, price_cents, in_stock,
+        box_qty, scraped_title, url,
+    )])
+
+
+def record_latest_observed_many(cur, observations: List[tuple]) -> None:
+    """``record_latest_observed`` for several observations in one statement.
+
+    ``observations`` are ``(retailer_key, cigar_id, quantity_type,
+    price_cents, in_stock, box_qty, scraped_title, url)`` tuples in insert
+    order; for a repeated pair the last one wins and each one counts.
+    """
+    latest: Dict[tuple, list] = {}
+    for (retailer_key, cigar_id, quantity_type, price_cents, in_stock,
+         box_qty, scraped_title, url) in observations:
+        if not (retailer_key and cigar_id and price_cents and quantity_type == "box"):
+            continue
+        prev = latest.pop((retailer_key, cigar_id), None)
+        latest[(retailer_key, cigar_id)] = [
+            retailer_key, cigar_id, price_cents, in_stock, box_qty,
+            scraped_title, url, (prev[-1] if prev else 0) + 1,
+        ]
+    if not latest:
+        return
+    from psycopg2.extras import execute_values
+
+    window = f"INTERVAL '{int(LATEST_OBSERVED_COUNT_DAYS)} days'"
+    # NOW() is the transaction start, so a transaction that began earlier
+    # can commit after a newer one: it still counts, but must not replace
+    # the newer values.
+    newer = "EXCLUDED.observed_at >= lo.observed_at"
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO latest_observed AS lo
+          (retailer_key, cigar_id, price_cents, in_stock, box_qty,
+           scraped_title, url, observation_count, observed_at, count_since)
+        VALUES %s
+        ON CONFLICT (retailer_key, cigar_id) DO UPDATE SET
+            price_cents = CASE WHEN {newer} THEN EXCLUDED.price_cents ELSE lo.price_cents END,
+            in_stock = CASE WHEN {newer} THEN EXCLUDED.in_stock ELSE lo.in_stock END,
+            box_qty = CASE WHEN {newer} THEN EXCLUDED.box_qty ELSE lo.box_qty END,
+            scraped_title = CASE WHEN {newer} THEN EXCLUDED.scraped_title ELSE lo.scraped_title END,
+            url = CASE WHEN {newer} THEN EXCLUDED.url ELSE lo.url END,
+            observed_at = GREATEST(lo.observed_at, EXCLUDED.observed_at),
+            observation_count = CASE
+                WHEN lo.observed_at > EXCLUDED.observed_at - {window}
+                    THEN lo.observation_count + EXCLUDED.observation_count
+                ELSE EXCLUDED.observation_count
+            END,
+            count_since = CASE
+                WHEN lo.observed_at > EXCLUDED.observed_at - {window}
+                    THEN lo.count_since
+                ELSE EXCLUDED.observed_at
+            END
+        """,
+        list(latest.values()),
+        template="(%s,%s,%s,%s,%s,%s,%s,%s,NOW(),NOW())",
+        page_size=len(latest),
+    )
+
+
+def rebuild_latest_observed(cur, pairs: Optional[List[tuple]] = None) -> int:
+    """Recompute ``latest_observed`` from observed_prices.
+
+    ``pairs`` limits the rebuild to those (retailer_key, cigar_id) pairs,
+    for paths that UPDATE or DELETE observations; None rebuilds the whole
+    table (first deploy, bulk cleanups). Returns the number of rows written.
+    """
+    if pairs is not None:
+        pairs = sorted({(rk, cid) for rk, cid in pairs if rk and cid})
+        if not pairs:
+            return 0
+        pair_filter = "AND (retailer_key, cigar_id) IN (SELECT * FROM unnest(%s::text[], %s::text[]))"
+        pair_params: tuple = ([p[0] for p in pairs], [p[1] for p in pairs])
+        cur.execute(
+            "DELETE FROM latest_observed "
+            "WHERE (retailer_key, cigar_id) IN (SELECT * FROM unnest(%s::text[], %s::text[]))",
+            pair_params,
+        )
+    else:
+        pair_filter = ""
+        pair_params = ()
+        cur.execute("DELETE FROM latest_observed")
+    window = str(LATEST_OBSERVED_COUNT_DAYS)
+    cur.execute(
+        f"""
+        WITH recent AS (
+            SELECT retailer_key, cigar_id, price_cents, in_stock, box_qty,
+                   scraped_title, url, observed_at
+              FROM observed_prices
+             WHERE retailer_key IS NOT NULL
+               AND cigar_id IS NOT NULL
+               AND quantity_type = 'box'
+               AND price_cents IS NOT NULL
+               AND observed_at > NOW() - (%s || ' days')::interval
+               {pair_filter}
+        ),
+        counts AS (
+            SELECT retailer_key, cigar_id, COUNT(*) AS n, MIN(observed_at) AS since
+              FROM recent
+             GROUP BY retailer_key, cigar_id
+        )
+        INSERT INTO latest_observed
+          (retailer_key, cigar_id, price_cents, in_stock, box_qty,
+           scraped_title, url, observed_at, observation_count, count_since)
+        SELECT DISTINCT ON (r.retailer_key, r.cigar_id)
+               r.retailer_key, r.cigar_id, r.price_cents, r.in_stock, r.box_qty,
+               r.scraped_title, r.url, r.observed_at, c.n, c.since
+          FROM recent r
+          JOIN counts c USING (retailer_key, cigar_id)
+         ORDER BY r.retailer_key, r.cigar_id, r.observed_at DESC
+        """,
+        (window, *pair_params),
+    )
+    return cur.rowcount or 0
+
+
 # ── POST /api/community/observe ────────────────────────────────────────
 
+def _prepare_observation(body: ObserveBody, refresh: bool = True) -> Dict[str, Any]:
+    """Canonicalize one observation and resolve its retailer / CID."""
+    # Canonicalize at the boundary so we never write a ?variant=… URL to
+    # observed_prices and so cigar_id resolution against the (already
+    # canonical) url_index hits.
+    url = canonicalize_url(body.url)
+    retailer_key = _resolve_retailer_key(url, refresh=refresh)
+    cigar_id = _resolve_cigar_id_from_url(
+        url, retailer_key, body.box_qty, _trim(body.cigar_id) or None,
+    )
+    source = (body.observer_source or "consumer").lower()
+    if source not in {"operator", "consumer"}:
+        source = "consumer"
+    return {
+        "url": url,
+        "retailer_key": retailer_key,
+        "cigar_id": cigar_id,
+        "quantity_type": _coerce_quantity_type(body.quantity_type, body.box_qty),
+        "box_qty": body.box_qty,
+        "price_cents": _to_price_cents(body.price),
+        "currency": (body.currency or "USD")[:8].upper(),
+        "in_stock": body.in_stock,
+        "scraped_title": body.scraped_title,
+        "jsonld": _safe_jsonb(body.jsonld),
+        "observer_source": source,
+    }
+
+
+def _suppress_stale_out_of_stock(cur, observations: List[Dict[str, Any]]) -> None:
+    """Blank ``in_stock=False`` on passive consumer scrapes of corrected URLs.
+
+    Shopper may report in-stock via report-correction while the PDP
+    scrape still reads OOS. A subsequent passive /observe must not
+    overwrite that with another false from the same stale scrape.
+    """
+    candidates = [
+        o for o in observations
+        if o["in_stock"] is False
+        and o["cigar_id"]
+        and o["retailer_key"]
+        and o["observer_source"] == "consumer"
+    ]
+    if not candidates:
+        return
+    try:
+        cur.execute(
+            """
+            SELECT DISTINCT url, retailer_key, cigar_id FROM observed_prices
+             WHERE (url, retailer_key, cigar_id) IN (
+                     SELECT * FROM unnest(%s::text[], %s::text[], %s::text[]))
+               AND in_stock IS TRUE
+               AND observer_source = %s
+               AND observed_at > NOW() - INTERVAL '7 days'
+            """,
+            (
+                [o["url"] for o in candidates],
+                [o["retailer_key"] for o in candidates],
+                [o["cigar_id"] for o in candidates],
+                _CORRECTION_OBSERVER_SOURCE,
+            ),
+        )
+        corrected = set(cur.fetchall())
+    except Exception:
+        return
+    for o in candidates:
+        if (o["url"], o["retailer_key"], o["cigar_id"]) in corrected:
+            o["in_stock"] = None
+
+
+def _insert_observations(cur, observer: str, observations: List[Dict[str, Any]]) -> List[int]:
+    """Write observations with one multi-row INSERT; returns ids in order."""
+    from psycopg2.extras import execute_values
+
+    rows = execute_values(
+        cur,
+        """
+        INSERT INTO observed_prices
+          (url, retailer_key, cigar_id, quantity_type, box_qty,
+           price_cents, currency, in_stock, scraped_title, jsonld,
+           observer_id, observer_source)
+        VALUES %s
+        RETURNING id
+        """,
+        [
+            (
+                o["url"], o["retailer_key"], o["cigar_id"], o["quantity_type"],
+                o["box_qty"], o["price_cents"], o["currency"], o["in_stock"],
+                o["scraped_title"], o["jsonld"], observer, o["observer_source"],
+            )
+            for o in observations
+        ],
+        template="(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s)",
+        page_size=len(observations),
+        fetch=True,
+    )
+    record_latest_observed_many(cur, [
+        (
+            o["retailer_key"], o["cigar_id"], o["quantity_type"], o["price_cents"],
+            o["in_stock"], o["box_qty"], o["scraped_title"], o["url"],
+        )
+        for o in observations
+    ])
+    return [r[0] for r in rows]
+
+
+def _observation_ack(obs: Dict[str, Any], obs_id: Optional[int]) -> Dict[str, Any]:
+    return {
+        "id": obs_id,
+        "retailer_key": obs["retailer_key"],
+        "cigar_id": obs["cigar_id"],
+        "quantity_type": obs["quantity_type"],
+        "counted": obs["quantity_type"] == "box" and obs["cigar_id"] is not None,
+    }
+
+
 @router.post("/observe")
 async def observe(request: Request, body: ObserveBody):
     """Record a per-URL price observation.
@@ -499,87 +788,91 @@ async def observe(request: Request, body: ObserveBody):
     the client can show "contributing" UX.
     """
     observer = _observer_id(body.observer_id, request)
-    if not _rate_limit(_obs_minute, observer, 60, _OBSERVE_MAX_PER_MIN):
+    if not await _obs_minute.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_minute"}, status_code=429)
-    if not _rate_limit(_obs_day, observer, 86_400, _OBSERVE_MAX_PER_DAY):
+    if not await _obs_day.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_day"}, status_code=429)
 
-    # Canonicalize at the boundary so we never write a ?variant=… URL to
-    # observed_prices and so cigar_id resolution against the (already
-    # canonical) url_index hits.
-    body.url = canonicalize_url(body.url)
-
-    retailer_key = _resolve_retailer_key(body.url)
-    cigar_id = _resolve_cigar_id_from_url(
-        body.url, retailer_key, body.box_qty, _trim(body.cigar_id) or None,
-    )
-    qty_type = _coerce_quantity_type(body.quantity_type, body.box_qty)
-    price_cents = _to_price_cents(body.price)
-    source = (body.observer_source or "consumer").lower()
-    if source not in {"operator", "consumer"}:
-        source = "consumer"
-    currency = (body.currency or "USD")[:8].upper()
-
+    obs = _prepare_observation(body)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
+        _suppress_stale_out_of_stock(cur, [obs])
+        ids = _insert_observations(cur, observer, [obs])
+        conn.commit()
+        conn.close()
+        return {"ok": True, **_observation_ack(obs, ids[0] if ids else None)}
+    except Exception as e:
+        logger.exception("observe failed: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
 
-        stock_to_write = body.in_stock
-        if (
-            stock_to_write is False
-            and cigar_id
-            and retailer_key
-            and source == "consumer"
-        ):
-            # Shopper may report in-stock via report-correction while the PDP
-            # scrape still reads OOS. A subsequent passive /observe must not
-            # overwrite that with another false from the same stale scrape.
-            try:
-                cur.execute(
-                    """
-                    SELECT 1 FROM observed_prices
-                     WHERE url = %s
-                       AND retailer_key = %s
-                       AND cigar_id = %s
-                       AND in_stock IS TRUE
-                       AND observer_source = %s
-                       AND observed_at > NOW() - INTERVAL '7 days'
-                     LIMIT 1
-                    """,
-                    (body.url, retailer_key, cigar_id, _CORRECTION_OBSERVER_SOURCE),
-                )
-                if cur.fetchone():
-                    stock_to_write = None
-            except Exception:
-                pass
 
-        cur.execute("""
-            INSERT INTO observed_prices
-              (url, retailer_key, cigar_id, quantity_type, box_qty,
-               price_cents, currency, in_stock, scraped_title, jsonld,
-               observer_id, observer_source)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s,%s)
-            RETURNING id
-        """, (
-            body.url, retailer_key, cigar_id, qty_type, body.box_qty,
-            price_cents, currency, stock_to_write, body.scraped_title,
-            _safe_jsonb(body.jsonld), observer, source,
-        ))
-        row = cur.fetchone()
+# ── POST /api/community/observe-batch ──────────────────────────────────
+
+@router.post("/observe-batch")
+async def observe_batch(request: Request, body: ObserveBatchBody):
+    """Record several observations from one observer in one round trip.
+
+    Same per-item semantics as /observe: each item spends one hit of the
+    observer's per-minute and per-day limits, and items past the limit
+    are answered with ``rate_limited`` while earlier ones are kept. The
+    accepted items are written with a single multi-row INSERT. Results
+    come back in request order.
+    """
+    items = body.observations
+    if not items:
+        return JSONResponse({"error": "observations required"}, status_code=400)
+    if len(items) > _OBSERVE_BATCH_MAX:
+        return JSONResponse(
+            {"error": f"at most {_OBSERVE_BATCH_MAX} observations per batch"},
+            status_code=413,
+        )
+    observer = _observer_id(body.observer_id, request)
+
+    # One charge per limiter for the whole batch: the day limit is only
+    # charged for the items the minute limit let through.
+    limited_scope = None
+    allowed = await _obs_minute.allow_n_async(observer, len(items))
+    if allowed < len(items):
+        limited_scope = "per_minute"
+    day_allowed = await _obs_day.allow_n_async(observer, allowed)
+    if day_allowed < allowed:
+        allowed, limited_scope = day_allowed, "per_day"
+    if not allowed:
+        return JSONResponse({"error": "rate_limited", "scope": limited_scope}, status_code=429)
+
+    # Refresh the extension's indexes once; every item then resolves
+    # against the same cached registry / url_index.
+    try:
+        from app.extension_endpoints import _refresh_cache  # type: ignore
+        _refresh_cache()
+    except Exception:
+        pass
+    accepted = [_prepare_observation(item, refresh=False) for item in items[:allowed]]
+
+    try:
+        conn = await _get_conn_async()
+        cur = conn.cursor()
+        _suppress_stale_out_of_stock(cur, accepted)
+        ids = _insert_observations(cur, observer, accepted)
         conn.commit()
         conn.close()
-        return {
-            "ok": True,
-            "id": row[0] if row else None,
-            "retailer_key": retailer_key,
-            "cigar_id": cigar_id,
-            "quantity_type": qty_type,
-            "counted": qty_type == "box" and cigar_id is not None,
-        }
     except Exception as e:
-        logger.exception("observe failed: %s", e)
+        logger.exception("observe_batch failed: %s", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+    results = [{"ok": True, **_observation_ack(o, i)} for o, i in zip(accepted, ids)]
+    results += [
+        {"ok": False, "error": "rate_limited", "scope": limited_scope}
+        for _ in items[allowed:]
+    ]
+    return {
+        "ok": True,
+        "accepted": len(accepted),
+        "rate_limited": len(items) - allowed,
+        "results": results,
+    }
+
 
 # ── POST /api/community/propose-metadata ───────────────────────────────
 
@@ -617,7 +910,7 @@ async def propose_metadata(request: Request, body: ProposeMetadataBody):
     row + CID to master first, then approve with that exact key.
     """
     observer = _observer_id(body.observer_id, request)
-    if not _rate_limit(_prop_hour, observer, 3600, _PROPOSE_MAX_PER_HOUR):
+    if not await _prop_hour.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_hour"}, status_code=429)
 
     body.url = canonicalize_url(body.url)
@@ -630,7 +923,7 @@ async def propose_metadata(request: Request, body: ProposeMetadataBody):
 
     confirmed_cents = _to_price_cents(body.confirmed_price)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO community_url_proposals
@@ -812,7 +1105,7 @@ async def preview_candidate(request: Request, body: ProposeMetadataBody):
     observer = _observer_id(body.observer_id, request)
     # Reuses the propose-metadata bucket: this endpoint is one of two
     # required hops in the submit flow, so it should share the cap.
-    if not _rate_limit(_prop_hour, observer, 3600, _PROPOSE_MAX_PER_HOUR):
+    if not await _prop_hour.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_hour"}, status_code=429)
 
     body.url = canonicalize_url(body.url)
@@ -870,7 +1163,7 @@ async def confirm_candidate(request: Request, body: ConfirmCandidateBody):
     operator approval path (UNIQUE on retailer_key, url, cid).
     """
     observer = _observer_id(body.observer_id, request)
-    if not _rate_limit(_prop_hour, observer, 3600, _PROPOSE_MAX_PER_HOUR):
+    if not await _prop_hour.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_hour"}, status_code=429)
 
     body.url = canonicalize_url(body.url)
@@ -916,7 +1209,7 @@ async def confirm_candidate(request: Request, body: ConfirmCandidateBody):
     )
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             """
@@ -1192,6 +1485,10 @@ def _append_correction_observation(
             _CORRECTION_OBSERVER_SOURCE,
         ),
     )
+    record_latest_observed(
+        cur, retailer_key, obs_cid, qty_type, obs_cents, instock, bq_obs,
+        _trim(body.scraped_title), body.url,
+    )
     return True
 
 
@@ -1230,7 +1527,7 @@ async def report_correction(request: Request, body: ReportCorrectionBody):
     operator review. Larger price swings or metadata disagreements still queue.
     """
     observer = _observer_id(body.observer_id, request)
-    if not _rate_limit(_prop_hour, observer, 3600, _PROPOSE_MAX_PER_HOUR):
+    if not await _prop_hour.allow_async(observer):
         return JSONResponse({"error": "rate_limited", "scope": "per_hour"}, status_code=429)
 
     body.url = canonicalize_url(body.url)
@@ -1353,7 +1650,7 @@ async def report_correction(request: Request, body: ReportCorrectionBody):
     )
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         if auto_apply:
             if _append_correction_observation(
@@ -1528,8 +1825,8 @@ async def public_retailer_registry():
 # client can't hammer it.
 _PUBLIC_STATUS_MAX_PER_MIN = 60
 _PUBLIC_STATUS_MAX_PER_DAY = 10_000
-_status_minute: Dict[str, Deque[float]] = defaultdict(deque)
-_status_day:    Dict[str, Deque[float]] = defaultdict(deque)
+_status_minute = RateLimiter("url_status_minute", 60, _PUBLIC_STATUS_MAX_PER_MIN)
+_status_day    = RateLimiter("url_status_day", 86_400, _PUBLIC_STATUS_MAX_PER_DAY)
 
 # /api/public/guess-metadata is even cheaper than url-status (read-only,
 # cached in-memory) so we let it run a little hotter — covers the case
@@ -1537,8 +1834,8 @@ _status_day:    Dict[str, Deque[float]] = defaultdict(deque)
 # refetches per-keystroke. Still capped to keep a runaway client honest.
 _PUBLIC_GUESS_MAX_PER_MIN = 120
 _PUBLIC_GUESS_MAX_PER_DAY = 20_000
-_guess_minute: Dict[str, Deque[float]] = defaultdict(deque)
-_guess_day:    Dict[str, Deque[float]] = defaultdict(deque)
+_guess_minute = RateLimiter("guess_metadata_minute", 60, _PUBLIC_GUESS_MAX_PER_MIN)
+_guess_day    = RateLimiter("guess_metadata_day", 86_400, _PUBLIC_GUESS_MAX_PER_DAY)
 
 
 def _public_ip_key(request: Request) -> str:
@@ -1562,9 +1859,9 @@ async def public_url_status(
     top-3 cheapest in one round-trip.
     """
     ip = _public_ip_key(request)
-    if not _rate_limit(_status_minute, ip, 60, _PUBLIC_STATUS_MAX_PER_MIN):
+    if not await _status_minute.allow_async(ip):
         return JSONResponse({"error": "rate_limited", "scope": "per_minute"}, status_code=429)
-    if not _rate_limit(_status_day, ip, 86_400, _PUBLIC_STATUS_MAX_PER_DAY):
+    if not await _status_day.allow_async(ip):
         return JSONResponse({"error": "rate_limited", "scope": "per_day"}, status_code=429)
 
     if not url or len(url) > 2048:
@@ -1615,7 +1912,7 @@ async def public_url_status(
     seen_status: Optional[str] = None
     proposed_metadata: Optional[Dict[str, Any]] = None
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             "SELECT status FROM extension_staged_approvals "
@@ -1831,8 +2128,8 @@ def _build_comparison_for_cid(
 ) -> Optional[Dict[str, Any]]:
     """Top-N cheapest retailers for one canonical ``cigar_id``.
 
-    Loads the same ``Product`` list as the site (``load_all_products()``) and
-    uses the same shipping/tax helpers. **Rows are included only when**
+    Reads the same ``Product`` snapshot as the site (via the per-CID bucket
+    of ``get_product_index()``) and uses the same shipping/tax helpers. **Rows are included only when**
     ``canonical_cigar_id_for_comparison(product.cigar_id)`` equals the
     canonical CID for the URL — no looser brand/line/vitola matching here.
 
@@ -1843,7 +2140,7 @@ def _build_comparison_for_cid(
     """
     try:
         from app.main import (  # type: ignore
-            load_all_products,
+            get_product_index,
             zip_to_state,
             estimate_shipping_cents,
             estimate_tax_cents,
@@ -1856,13 +2153,8 @@ def _build_comparison_for_cid(
 
     try:
         state = zip_to_state(zip) if zip else "OR"
-        all_products = load_all_products()
         canon_cid = canonical_cigar_id_for_comparison(cid)
-        matches = [
-            p for p in all_products
-            if canonical_cigar_id_for_comparison(getattr(p, "cigar_id", None) or "")
-            == canon_cid
-        ]
+        matches = list(get_product_index().by_cigar_id(canon_cid))
         distinct_retailers = {p.retailer_key for p in matches}
         if len(distinct_retailers) < MIN_RETAILERS_FOR_COMPARISON:
             sparse: Dict[str, Any] = {
@@ -2020,7 +2312,7 @@ async def request_retailer(request: Request, body: RequestRetailerBody):
         return JSONResponse({"error": "hostname could not be derived"}, status_code=400)
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             """
@@ -2075,7 +2367,7 @@ async def my_requests(observer_id: str):
         live_hosts = set()
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         if live_hosts:
             cur.execute(
@@ -2135,10 +2427,16 @@ async def delete_my_observations(body: DeleteObservationsBody):
     if not observer:
         return JSONResponse({"error": "observer_id required"}, status_code=400)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
-        cur.execute("DELETE FROM observed_prices WHERE observer_id=%s", (observer,))
-        obs_deleted = cur.rowcount
+        cur.execute(
+            "DELETE FROM observed_prices WHERE observer_id=%s "
+            "RETURNING retailer_key, cigar_id",
+            (observer,),
+        )
+        touched = cur.fetchall()
+        obs_deleted = len(touched)
+        rebuild_latest_observed(cur, touched)
         cur.execute("DELETE FROM community_url_proposals WHERE observer_id=%s", (observer,))
         prop_deleted = cur.rowcount
         cur.execute("DELETE FROM community_retailer_requests WHERE observer_id=%s", (observer,))
@@ -2272,21 +2570,22 @@ def _get_catalog_match_index() -> Dict[str, Any]:
       brands_sorted: list[str]
           All catalog brands, sorted alphabetically — for the form's
           <datalist>.
-      brand_match_pairs: list[tuple[str, str]]
-          (normalized_brand, canonical_brand) sorted by normalized
-          length desc. The matcher walks this list and picks the
-          first normalized brand that appears in the scraped text —
-          length-desc ordering means "Arturo Fuente" wins over
-          "Fuente" when both could match.
+      match_automaton: TokenAutomaton
+          Every normalized brand, line and vitola name, compiled once.
+          One pass over the scraped text yields all names present as
+          whole tokens.
+      brand_by_norm: dict[str, str]
+          normalized_brand -> canonical_brand. Of the brands found in
+          the text the longest normalized form wins, so "Arturo Fuente"
+          beats "Fuente" when both could match.
       lines_by_brand: dict[brand, list[str]]
           Lines for each brand, sorted alphabetically — for the form's
           line <datalist> that updates when brand changes.
-      line_match_pairs: dict[brand, list[tuple[str, str]]]
-          Per-brand version of brand_match_pairs for line matching.
-      vitolas_by_brand_line: dict[(brand, line), list[str]]
-          Vitolas for each (brand, line) — both for matching the
-          scraped text AND for the vitola <datalist>.
-      vitola_match_pairs: dict[(brand, line), list[tuple[str, str]]]
+      line_by_norm: dict[brand, dict[str, str]]
+          Per-brand version of brand_by_norm for line matching.
+      vitolas_by_brand_line: dict["brand|line", list[str]]
+          Vitolas for each (brand, line) — for the vitola <datalist>.
+      vitola_by_norm: dict[(brand, line), dict[str, str]]
       buckets_by_brand_line: dict["brand|line", list[str]]
           Distinct wrapper buckets that appear on any vitola for that
           brand+line (legacy cascade; vitola-first UI prefers
@@ -2409,22 +2708,31 @@ def _get_catalog_match_index() -> Dict[str, Any]:
             if blv_key not in buckets_by_blv:
                 vitolas_by_brand_line_bucket[f"{bl_key}|{UNBUCKETED}"].add(v)
 
-    def _match_pairs(values) -> list:
-        # (normalized, canonical) sorted by normalized length desc so
-        # the longest viable match wins ("Arturo Fuente" beats "Fuente").
-        # Ties broken alphabetically for determinism.
-        return sorted(
-            [(_normalize_for_match(v).strip(), v) for v in values if v],
-            key=lambda p: (-len(p[0]), p[1]),
-        )
+    def _by_norm(values) -> Dict[str, str]:
+        # normalized -> canonical. When two names normalize alike the
+        # alphabetically first one wins, for determinism.
+        out: Dict[str, str] = {}
+        for v in sorted(v for v in values if v):
+            norm = _normalize_for_match(v).strip()
+            if norm and norm not in out:
+                out[norm] = v
+        return out
+
+    brand_by_norm = _by_norm(brands)
+    line_by_norm = {b: _by_norm(ls) for b, ls in lines_by_brand.items()}
+    vitola_by_norm = {(b, l): _by_norm(vs) for (b, l), vs in vitolas_by_bl.items()}
+    patterns = set(brand_by_norm)
+    for group in (*line_by_norm.values(), *vitola_by_norm.values()):
+        patterns.update(group)
 
     data = {
         "brands_sorted": sorted(brands),
-        "brand_match_pairs": _match_pairs(brands),
+        "match_automaton": TokenAutomaton(sorted(patterns)),
+        "brand_by_norm": brand_by_norm,
         "lines_by_brand": {b: sorted(ls) for b, ls in lines_by_brand.items()},
-        "line_match_pairs": {b: _match_pairs(ls) for b, ls in lines_by_brand.items()},
+        "line_by_norm": line_by_norm,
         "vitolas_by_brand_line": {f"{b}|{l}": sorted(vs) for (b, l), vs in vitolas_by_bl.items()},
-        "vitola_match_pairs": {(b, l): _match_pairs(vs) for (b, l), vs in vitolas_by_bl.items()},
+        "vitola_by_norm": vitola_by_norm,
         "boxes_by_brand_line_vitola": {
             k: sorted(vs) for k, vs in boxes_by_blv.items() if vs
         },
@@ -2446,27 +2754,22 @@ def _get_catalog_match_index() -> Dict[str, Any]:
     return data
 
 
-def _find_in_text(text_norm: str, match_pairs) -> Optional[str]:
-    """Walk `match_pairs` (already sorted by length desc) and return the
-    canonical form of the first whole-token match in `text_norm`.
+def _best_catalog_match(found: set, by_norm: Dict[str, str]) -> Optional[str]:
+    """Canonical name for the longest of the ``found`` names in ``by_norm``.
 
-    `text_norm` is already wrapped in leading/trailing spaces by
-    _normalize_for_match, and each candidate's normalized form is
-    trimmed — so `" arturo fuente "` is in `" arturo fuente cigars
-    hemingway "` (substring match) but `" fuente "` would not match
-    `" arturoofuente "` because of the surrounding spaces. We
-    additionally require the candidate to be preceded/followed by a
-    space in the haystack to enforce a whole-token boundary.
+    ``found`` holds the normalized names the automaton saw in the text as
+    whole tokens — "fuente" is found in "arturo fuente cigars" but not in
+    "arturofuente". Ties on length go to the alphabetically first
+    canonical name.
     """
-    if not text_norm:
-        return None
-    for norm, canon in match_pairs:
-        if not norm:
-            continue
-        needle = f" {norm} "
-        if needle in text_norm:
-            return canon
-    return None
+    best = None
+    for norm in found:
+        canon = by_norm.get(norm)
+        if canon is not None:
+            key = (-len(norm), canon)
+            if best is None or key < best:
+                best = key
+    return best[1] if best else None
 
 
 def _match_scraped_to_catalog(
@@ -2489,20 +2792,21 @@ def _match_scraped_to_catalog(
         return out
 
     catalog = _get_catalog_match_index()
+    # One pass finds every brand / line / vitola name in the text; the
+    # brand then picks which lines count, and brand + line the vitolas.
+    found = catalog["match_automaton"].matches(text_norm.split())
 
-    brand = _find_in_text(text_norm, catalog["brand_match_pairs"])
+    brand = _best_catalog_match(found, catalog["brand_by_norm"])
     if not brand:
         return out
     out["brand"] = brand
 
-    line_pairs = catalog["line_match_pairs"].get(brand) or []
-    line = _find_in_text(text_norm, line_pairs)
+    line = _best_catalog_match(found, catalog["line_by_norm"].get(brand) or {})
     if not line:
         return out
     out["line"] = line
 
-    vitola_pairs = catalog["vitola_match_pairs"].get((brand, line)) or []
-    vitola = _find_in_text(text_norm, vitola_pairs)
+    vitola = _best_catalog_match(found, catalog["vitola_by_norm"].get((brand, line)) or {})
     if vitola:
         out["vitola"] = vitola
 
@@ -2545,9 +2849,9 @@ async def public_guess_metadata(request: Request, body: GuessMetadataBody):
     rather than fall back to the raw scrape.
     """
     ip = _public_ip_key(request)
-    if not _rate_limit(_guess_minute, ip, 60, _PUBLIC_GUESS_MAX_PER_MIN):
+    if not await _guess_minute.allow_async(ip):
         return JSONResponse({"error": "rate_limited", "scope": "per_minute"}, status_code=429)
-    if not _rate_limit(_guess_day, ip, 86_400, _PUBLIC_GUESS_MAX_PER_DAY):
+    if not await _guess_day.allow_async(ip):
         return JSONResponse({"error": "rate_limited", "scope": "per_day"}, status_code=429)
 
     try:
@@ -0,0 +1,325 @@
+"""
+Process-wide Postgres connection pool for the analytics / community DB.
+
+Every handler in app/main.py, app/extension_endpoints.py and
+app/community_endpoints.py follows the same shape:
+
+    conn = get_analytics_conn()   # or the modules' _get_conn()
+    cur = conn.cursor()
+    ...
+    conn.commit()
+    conn.close()
+
+Until now each of those calls paid a fresh TCP + TLS + auth handshake to
+Railway Postgres, which dominated latency on the extension popup routes
+(/public/url-status, /observe). ``get_analytics_conn()`` now checks a
+connection out of this pool instead and returns a ``PooledConnection``
+proxy whose ``close()`` hands it back — so the two dozen existing call
+sites keep working unchanged.
+
+Behaviour:
+  * bounded — at most ``max_size`` live connections; checkouts beyond that
+    wait up to ``checkout_timeout`` seconds, then raise ``PoolExhausted``
+  * health-checked — a connection idle for longer than
+    ``health_check_after`` seconds is pinged (``SELECT 1``) before reuse;
+    broken connections are discarded and replaced transparently
+  * clean hand-back — uncommitted work is rolled back on return, and a
+    proxy that is garbage-collected without ``close()`` (an exception path
+    that skipped it) is returned automatically
+  * observable — ``stats()`` reports per-checkout wait / hold times, slow
+    checkouts are logged, and the counters surface in
+    /api/admin/analytics-health
+
+Async routes should use ``await get_analytics_conn_async()``: it takes a
+ready idle connection without blocking (``try_getconn``) and otherwise
+does the blocking checkout in a worker thread.
+
+Tunables (env): ANALYTICS_DB_POOL_MAX (10), ANALYTICS_DB_POOL_TIMEOUT (5s).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Checkouts that wait / hold longer than this are logged at WARNING.
+_SLOW_CHECKOUT_S = 0.5
+
+
+class PoolExhausted(RuntimeError):
+    """No connection became free within the checkout timeout."""
+
+
+class ConnectionReleased(RuntimeError):
+    """A PooledConnection was used after ``close()`` handed it back."""
+
+
+class PooledConnection:
+    """psycopg2 connection proxy; ``close()`` returns it to the pool."""
+
+    __slots__ = ("_pool", "_raw", "_checked_out_at", "_released")
+
+    def __init__(self, pool: "ConnectionPool", raw: Any):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_checked_out_at", time.monotonic())
+        object.__setattr__(self, "_released", False)
+
+    def _live(self) -> Any:
+        # After close() the raw connection may already belong to another
+        # borrower; touching it here would run inside their transaction.
+        if self._released:
+            raise ConnectionReleased("connection already returned to the pool")
+        return self._raw
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._live(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # e.g. ``conn.autocommit = True`` must reach the real connection.
+        setattr(self._live(), name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same semantics as a psycopg2 connection context manager: commit
+        # or roll back, but leave the connection open.
+        if exc_type is None:
+            self._live().commit()
+        else:
+            self._live().rollback()
+
+    def close(self) -> None:
+        if self._released:
+            return
+        object.__setattr__(self, "_released", True)
+        self._pool._release(self._raw, time.monotonic() - self._checked_out_at)
+
+    def __del__(self):
+        try:
+            if not self._released:
+                self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        *,
+        max_size: int = 10,
+        checkout_timeout: float = 5.0,
+        health_check_after: float = 30.0,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        # (raw_conn, returned_at_monotonic); LIFO so hot connections stay hot.
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats: Dict[str, float] = {
+            "checkouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "wait_total_s": 0.0,
+            "wait_max_s": 0.0,
+            "hold_total_s": 0.0,
+            "hold_max_s": 0.0,
+            "slow_checkouts": 0,
+        }
+
+    # ── checkout ──────────────────────────────────────────────────────
+
+    def getconn(self, timeout: Optional[float] = None) -> PooledConnection:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            raw, idle_since = self._reserve(deadline)
+            if raw is None:
+                # Reserved a new slot: open outside the lock.
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif not self._healthy(raw, idle_since):
+                self._discard(raw)
+                continue
+            break
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_total_s"] += waited
+            self._stats["wait_max_s"] = max(self._stats["wait_max_s"], waited)
+        if waited > _SLOW_CHECKOUT_S:
+            logger.warning("db_pool: checkout waited %.2fs (size=%d)", waited, self._size)
+        return PooledConnection(self, raw)
+
+    def try_getconn(self) -> Optional[PooledConnection]:
+        """Non-blocking checkout: an idle connection that needs no health
+        check, or None. Never connects, pings or waits, so it is safe to
+        call on the event loop."""
+        with self._cond:
+            if not self._idle:
+                return None
+            raw, idle_since = self._idle[-1]
+            if getattr(raw, "closed", 0) or time.monotonic() - idle_since >= self.health_check_after:
+                return None
+            self._idle.pop()
+            self._stats["checkouts"] += 1
+        return PooledConnection(self, raw)
+
+    def _reserve(self, deadline: float) -> Tuple[Optional[Any], float]:
+        """Pop an idle connection, or reserve a slot for a new one (None)."""
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, 0.0
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolExhausted(
+                        f"no Postgres connection free within {self.checkout_timeout:.1f}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+    def _healthy(self, raw: Any, idle_since: float) -> bool:
+        if getattr(raw, "closed", 0):
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            cur = raw.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            raw.rollback()
+            return True
+        except Exception as e:
+            logger.info("db_pool: dropping stale connection: %s", e)
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    # ── return ────────────────────────────────────────────────────────
+
+    def _release(self, raw: Any, held: float) -> None:
+        reusable = not getattr(raw, "closed", 0)
+        if reusable:
+            try:
+                # Drop any uncommitted work (SELECT-only handlers never
+                # commit) so the next borrower starts clean.
+                raw.rollback()
+            except Exception:
+                reusable = False
+        with self._cond:
+            self._stats["hold_total_s"] += held
+            self._stats["hold_max_s"] = max(self._stats["hold_max_s"], held)
+            if held > _SLOW_CHECKOUT_S:
+                self._stats["slow_checkouts"] += 1
+            if reusable:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(raw)
+
+    def _discard(self, raw: Any) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    # ── introspection / lifecycle ─────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            out["size"] = self._size
+            out["idle"] = len(self._idle)
+            out["in_use"] = self._size - len(self._idle)
+            out["max_size"] = self.max_size
+        n = out["checkouts"] or 1
+        out["wait_avg_ms"] = round(out.pop("wait_total_s") / n * 1000, 2)
+        out["hold_avg_ms"] = round(out.pop("hold_total_s") / n * 1000, 2)
+        out["wait_max_ms"] = round(out.pop("wait_max_s") * 1000, 2)
+        out["hold_max_ms"] = round(out.pop("hold_max_s") * 1000, 2)
+        return out
+
+    def closeall(self) -> None:
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """The process-wide pool for ANALYTICS_DB_URL (created on first use)."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    db_url = os.getenv("ANALYTICS_DB_URL")
+    if not db_url:
+        raise RuntimeError("ANALYTICS_DB_URL is not set")
+    with _pool_lock:
+        if _pool is None:
+            import psycopg2
+
+            _pool = ConnectionPool(
+                lambda: psycopg2.connect(db_url),
+                max_size=int(os.getenv("ANALYTICS_DB_POOL_MAX", "10")),
+                checkout_timeout=float(os.getenv("ANALYTICS_DB_POOL_TIMEOUT", "5")),
+            )
+    return _pool
+
+
+def get_analytics_conn() -> PooledConnection:
+    return get_pool().getconn()
+
+
+async def get_analytics_conn_async() -> PooledConnection:
+    """Checkout for ``async def`` routes without blocking the event loop."""
+    pool = get_pool()
+    conn = pool.try_getconn()
+    if conn is not None:
+        return conn
+    # Connecting, health-checking or waiting for a slot all block.
+    return await asyncio.to_thread(pool.getconn)
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    return _pool.stats() if _pool is not None else None
+
+
+def close_pool() -> None:
+    if _pool is not None:
+        _pool.closeall()
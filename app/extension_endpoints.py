@@ -45,6 +45,7 @@ from fastapi import APIRouter, Query, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
+from app.catalog_snapshot import open_snapshot
 from app.cid_matcher import (
     build_cid,
     build_retailer_registry,
@@ -52,10 +53,12 @@ from app.cid_matcher import (
     canonicalize_url,
     dedupe_cid_list_preserve_order,
     find_top_candidates,
+    find_top_candidates_many,
     hostname_to_retailer_key,
     load_master_cigars,
     load_retailer_url_index,
     merge_cid_into_url_index,
+    merge_extra_hosts,
     parse_cid,
     url_index_entry_cids,
 )
@@ -114,12 +117,19 @@ def _load_staged_approval_url_overlay() -> List[Tuple[str, str, str]]:
 
 
 def _refresh_cache(force: bool = False) -> None:
-    """(Re)load master CSV + retailer registry + per-retailer URL index."""
+    """(Re)load master CSV + retailer registry + per-retailer URL index.
+
+    Each piece comes from the compiled catalog snapshot while the CSVs it
+    was built from are unchanged, and is parsed from the CSVs otherwise.
+    """
     now = time.time()
     if not force and (now - _cache_state["loaded_at"]) < _CACHE_TTL_SECONDS:
         return
     try:
-        master = load_master_cigars(MASTER_CSV)
+        snapshot = open_snapshot()
+        master = snapshot.section("master_cigars") if snapshot else None
+        if master is None:
+            master = load_master_cigars(MASTER_CSV)
         # Blocked retailers (anti-bot, no extractor) won't have any sample
         # URL in their CSV to derive a hostname from. Pull explicit hostnames
         # from RETAILERS so the consumer extension still recognizes the
@@ -129,8 +139,14 @@ def _refresh_cache(force: bool = False) -> None:
             extra_hosts = get_blocked_retailer_hosts()
         except Exception:
             extra_hosts = {}
-        retailers = build_retailer_registry(STATIC_DATA, extra_hosts=extra_hosts)
-        url_index = load_retailer_url_index(STATIC_DATA)
+        retailers = snapshot.section("retailer_registry") if snapshot else None
+        if retailers is None:
+            retailers = build_retailer_registry(STATIC_DATA, extra_hosts=extra_hosts)
+        else:
+            merge_extra_hosts(retailers, extra_hosts)
+        url_index = snapshot.section("url_index") if snapshot else None
+        if url_index is None:
+            url_index = load_retailer_url_index(STATIC_DATA)
         # Layer pending operator approvals on top so just-approved URLs
         # are immediately matchable, without waiting for the publisher
         # to drain to CSV. CSV wins on collision (already-published
@@ -279,6 +295,13 @@ def _get_conn():
     return get_analytics_conn()
 
 
+async def _get_conn_async():
+    # Pool checkout that waits in a worker thread when every connection is
+    # busy, so a saturated pool doesn't stall the event loop.
+    from app.db_pool import get_analytics_conn_async
+    return await get_analytics_conn_async()
+
+
 # ── Pydantic request bodies ────────────────────────────────────────────
 
 class CIDParts(BaseModel):
@@ -384,18 +407,15 @@ def _pick_matched_cid(cids: List[str], cid_query: Optional[str]) -> Optional[str
     if len(cids) == 1:
         return cids[0]
     try:
-        from app.main import load_all_products  # type: ignore
+        from app.main import get_product_index  # type: ignore
     except Exception:
         return cids[0]
     try:
-        all_products = load_all_products()
+        product_index = get_product_index()
 
         def distinct_retailers_for(canonical_target: str) -> int:
             return len({
-                p.retailer_key
-                for p in all_products
-                if canonical_cigar_id_for_comparison(getattr(p, "cigar_id", None) or "")
-                == canonical_target
+                p.retailer_key for p in product_index.by_cigar_id(canonical_target)
             })
 
         ranked: List[Tuple[int, str]] = []
@@ -1153,7 +1173,7 @@ async def stage_approval(request: Request, body: StageApprovalBody):
     box_qty_int = int(parts_dict.get("box_qty") or 0)
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
 
         if body.force:
@@ -1233,6 +1253,8 @@ async def stage_approval(request: Request, body: StageApprovalBody):
         except Exception as e:
             logger.warning("inbox match close-on-approve failed: %s", e)
 
+        from app.community_endpoints import record_latest_observed  # type: ignore
+
         # Blocked/dormant retailers: mirror manual price to observed_prices so
         # /compare and the consumer extension reflect the operator entry
         # immediately (CSV is still updated by the local publisher).
@@ -1273,6 +1295,10 @@ async def stage_approval(request: Request, body: StageApprovalBody):
                             "operator_extension",
                         ),
                     )
+                    record_latest_observed(
+                        cur, body.retailer_key, cid, "box", _pc, _instock, _bq,
+                        (body.title or "")[:500], body.url,
+                    )
                 except Exception as obs_e:
                     logger.warning(
                         "stage_approval observed_prices mirror (active) failed: %s",
@@ -1309,6 +1335,10 @@ async def stage_approval(request: Request, body: StageApprovalBody):
                             "operator_extension",
                         ),
                     )
+                    record_latest_observed(
+                        cur, body.retailer_key, cid, "box", _pc, _instock, _bq,
+                        (body.title or "")[:500], body.url,
+                    )
                 except Exception as obs_e:
                     logger.warning(
                         "stage_approval observed_prices mirror failed: %s", obs_e,
@@ -1420,7 +1450,7 @@ async def skip_url(request: Request, body: SkipUrlBody):
         return auth
     body.url = canonicalize_url(body.url)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO url_skip_list (url, retailer_key, reason)
@@ -1475,7 +1505,7 @@ async def queue_new_retailer(request: Request, body: QueueNewRetailerBody):
     if not host:
         return JSONResponse({"error": "hostname could not be derived"}, status_code=400)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO pending_new_retailers (hostname, url)
@@ -1512,7 +1542,7 @@ async def pending_extension_approvals(
     if auth:
         return auth
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, cid, retailer_key, url, is_new_cid,
@@ -1569,7 +1599,7 @@ async def supersede_extension_staged(request: Request, body: IdsBody):
     if not body.ids:
         return {"superseded": 0}
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             """
@@ -1611,8 +1641,10 @@ async def mark_extension_published(request: Request, body: IdsBody):
         return auth
     if not body.ids:
         return {"published": 0, "observations_attached": 0}
+    from app.community_endpoints import rebuild_latest_observed  # type: ignore
+
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
 
         # Capture (url, retailer_key, cid, box_qty) BEFORE we flip the status
@@ -1633,6 +1665,7 @@ async def mark_extension_published(request: Request, body: IdsBody):
         updated = cur.rowcount
 
         observations_attached = 0
+        attached_pairs = []
         for url, retailer_key, cid, box_qty in triples:
             if not (url and retailer_key and cid):
                 continue
@@ -1652,7 +1685,11 @@ async def mark_extension_published(request: Request, body: IdsBody):
                    AND retailer_key = %s
                    AND cigar_id IS NULL
             """, (cid, box_qty, url, retailer_key))
-            observations_attached += cur.rowcount
+            if cur.rowcount:
+                observations_attached += cur.rowcount
+                attached_pairs.append((retailer_key, cid))
+
+        rebuild_latest_observed(cur, attached_pairs)
 
         conn.commit()
         conn.close()
@@ -1672,7 +1709,7 @@ async def pending_new_retailers(request: Request):
     if auth:
         return auth
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, hostname, url, created_at
@@ -1705,7 +1742,7 @@ async def retailer_requests(request: Request):
     if auth:
         return auth
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT hostname,
@@ -1748,7 +1785,7 @@ async def mark_retailer_queued(request: Request, body: IdsBody):
     if not body.ids:
         return {"processed": 0}
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             "UPDATE pending_new_retailers SET status='processed', processed_at=NOW() "
@@ -1786,7 +1823,7 @@ async def revoke_staged_url_mapping(request: Request, body: RevokeStagedUrlMappi
     cid = body.cid.strip()
     statuses = ["pending", "published"] if body.include_published else ["pending"]
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             """
@@ -1970,7 +2007,7 @@ async def observed_prices_recent(
     if auth:
         return auth
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         where = []
         params: List = []
@@ -2087,8 +2124,10 @@ async def cleanup_orphan_observations(
         return auth
 
     import re
+    from app.community_endpoints import rebuild_latest_observed  # type: ignore
+
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
 
         # ── Bucket 1: non-product paths ──────────────────────────────
@@ -2164,6 +2203,8 @@ async def cleanup_orphan_observations(
             d2 = cur.rowcount
             cur.execute(f"DELETE FROM observed_prices WHERE {empty_where}")
             d3 = cur.rowcount
+            if d1 or d2:
+                rebuild_latest_observed(cur)
             conn.commit()
             # Re-report the actual deleted counts (may differ slightly
             # from the COUNT(*) above if rows overlap multiple buckets).
@@ -2192,6 +2233,30 @@ async def cleanup_orphan_observations(
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+@router.post("/rebuild-latest-observed")
+async def rebuild_latest_observed_table(request: Request):
+    """Recompute ``latest_observed`` from observed_prices.
+
+    The table is maintained alongside every observation write; this is the
+    backfill / repair path (e.g. after editing observed_prices by hand).
+    """
+    auth = _check_admin(request)
+    if auth:
+        return auth
+    from app.community_endpoints import rebuild_latest_observed  # type: ignore
+
+    try:
+        conn = await _get_conn_async()
+        cur = conn.cursor()
+        rows = rebuild_latest_observed(cur)
+        conn.commit()
+        conn.close()
+        return {"ok": True, "rows": rows}
+    except Exception as e:
+        logger.exception("rebuild_latest_observed failed: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
 @router.get("/retailer-registry")
 async def retailer_registry(request: Request, refresh: bool = Query(False)):
     """List known retailer hostnames + keys. Extension uses this to know which
@@ -2294,7 +2359,7 @@ async def community_prices_recent(
     if auth:
         return auth
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, cid, url, price_cents, retailer_name,
@@ -2332,7 +2397,7 @@ async def observer_counts(request: Request, observer_id: str = Query(...)):
     if not obs:
         return JSONResponse({"error": "observer_id required"}, status_code=400)
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         counts = {}
         for table in ("observed_prices", "community_url_proposals", "community_retailer_requests"):
@@ -2370,7 +2435,7 @@ async def community_proposals(
         return auth
     try:
         _refresh_cache()
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, url, retailer_key, proposed_brand, proposed_line,
@@ -2393,6 +2458,7 @@ async def community_proposals(
 
         if include_candidates and rows:
             master = _cache_state.get("master") or []
+            queries = []
             for row in rows:
                 # Synthesize a title from the proposed metadata so the
                 # matcher has the same signal an extractor would feed it.
@@ -2403,20 +2469,13 @@ async def community_proposals(
                     row.get("proposed_size"),
                 ]
                 synth_title = " ".join(b for b in bits if b)
-                title = row.get("scraped_title") or synth_title
-                try:
-                    cands = find_top_candidates(
-                        row.get("url") or "",
-                        title,
-                        master,
-                        limit=3,
-                    )
-                except Exception as e:
-                    logger.warning(
-                        "candidate match failed for proposal %s: %s",
-                        row.get("id"), e,
-                    )
-                    cands = []
+                queries.append((row.get("url") or "", row.get("scraped_title") or synth_title))
+            try:
+                all_cands = find_top_candidates_many(queries, master, limit=3)
+            except Exception as e:
+                logger.warning("candidate match failed for %d proposal(s): %s", len(rows), e)
+                all_cands = [[] for _ in rows]
+            for row, cands in zip(rows, all_cands):
                 # Filter to candidates whose box_qty matches the
                 # proposal's — wrong box quantity is the single
                 # most-common reason a HIGH-confidence text match
@@ -2470,7 +2529,7 @@ async def resolve_community_proposal(request: Request, body: ResolveProposalBody
     _refresh_cache()
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, url, retailer_key, proposed_brand, proposed_line,
@@ -2709,7 +2768,7 @@ async def auto_publish_report(
         return auth
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         params: List[Any] = [days]
         sql = """
@@ -2776,7 +2835,7 @@ async def reject_auto_publish(request: Request, body: RejectAutoPublishBody):
         return auth
 
     try:
-        conn = _get_conn()
+        conn = await _get_conn_async()
         cur = conn.cursor()
         cur.execute(
             """
@@ -4,8 +4,12 @@ from fastapi.responses import HTMLResponse, FileResponse, Response, RedirectResp
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.gzip import GZipMiddleware
 from pathlib import Path
+import asyncio
+import copy
 import csv
+import operator
 import re
+import sys
 import time
 import uuid
 from typing import Dict, Optional
@@ -22,6 +26,17 @@ from urllib.parse import quote_plus, urlparse, urlunparse, parse_qsl, urlencode
 
 import subprocess
 import logging
+import threading
+
+from app import catalog_snapshot, db_pool
+from app.analytics_sink import AnalyticsSink
+from app.cached_response import CachedBody
+from app.product_index import ProductIndex
+from tools.historical.price_archive import archived_daily_rows
+from tools.historical.price_history_db import (
+    MIN_PEERS_FOR_OUTLIER, is_price_outlier, median_price, refresh_price_series,
+)
+from tools.promotions.promo_manager import PromotionEngine
 
 # Import your working shipping/tax functions
 try:
@@ -271,60 +286,50 @@ BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 
 def get_analytics_conn():
-    """Connect to Postgres using ANALYTICS_DB_URL from Railway."""
-    db_url = os.getenv("ANALYTICS_DB_URL")
-    if not db_url:
-        raise RuntimeError("ANALYTICS_DB_URL is not set")
-    return psycopg2.connect(db_url)  
+    """Check out a pooled Postgres connection (ANALYTICS_DB_URL from Railway).
+
+    ``conn.close()`` returns it to the shared pool in app/db_pool.py.
+    """
+    return db_pool.get_analytics_conn()
+
+# Search/click events are queued here and batch-inserted off the request path.
+analytics_sink = AnalyticsSink(get_analytics_conn)
 
 def load_promotions():
     """Load active, non-expired promotions from promotions.json"""
-    try:
-        promo_file = PROJECT_ROOT / "tools" / "promotions" / "promotions.json"
-        if not promo_file.exists():
-            logger.warning(f"Promotions file not found at {promo_file}")
-            return {}
-        
-        with open(promo_file, 'r') as f:
-            promotions = json.load(f)
-        
-        today = datetime.now().strftime('%Y-%m-%d')
-        active_promos = {}
-        for retailer, promos in promotions.items():
-            active_promos[retailer] = [
-                p for p in promos
-                if p.get('active', False) and p.get('end_date', '9999-12-31') >= today
-            ]
-        
-        return active_promos
-    except Exception as e:
-        logger.error(f"Failed to load promotions: {e}")
-        return {}
+    return {
+        retailer: [p.raw for p in PROMOTIONS.active_promos(retailer)]
+        for retailer in PROMOTIONS.promotions()
+    }
 
-def apply_promotion(base_price_cents, retailer_key):
-    """Apply applicable promotion to base price"""
-    promotions = load_promotions()
-    
-    if retailer_key not in promotions or not promotions[retailer_key]:
+def apply_promotion(base_price_cents, retailer_key, brand=None, line=None):
+    """Apply the best applicable promotion to a single base price"""
+    (promo_price_cents, promo_code, discount_percent), = PROMOTIONS.apply_best(
+        [base_price_cents], [retailer_key], [brand], [line],
+    )
+    if promo_code is None:
         return base_price_cents, None, None
-    
-    # Get the first active promotion (you can enhance this logic)
-    promo = promotions[retailer_key][0]
-    discount_percent = promo['discount']
-    promo_code = promo['code']
-    
-    # Calculate discounted price
-    discount_amount = int(base_price_cents * (discount_percent / 100))
-    promo_price_cents = base_price_cents - discount_amount
-    
     return promo_price_cents, promo_code, discount_percent
 
+def apply_promotions(products):
+    """Batch apply_promotion() for a list of Products (one engine call)."""
+    return PROMOTIONS.apply_best(
+        [p.price_cents for p in products],
+        [p.retailer_key for p in products],
+        [p.brand for p in products],
+        [p.line for p in products],
+    )
+
 # Dynamic path resolution for local vs Railway deployment
 import os
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 STATIC_PATH = str(PROJECT_ROOT / "static")
 CSV_PATH_PREFIX = str(PROJECT_ROOT / "static" / "data")
 
+# Compiled promotions.json, shared with tools/promotions/apply_promos.py.
+# Re-read only when the file's mtime changes.
+PROMOTIONS = PromotionEngine(PROJECT_ROOT / "tools" / "promotions" / "promotions.json")
+
 app = FastAPI()
 
 # SEO Fix: WWW to non-WWW redirect middleware
@@ -507,6 +512,17 @@ def startup_event():
         logger.info("✓ Community staging tables initialized")
     except Exception as e:
         logger.warning(f"⚠ Community tables init skipped: {e}")
+    # Load the product snapshot and render the SEO landing pages before
+    # the first visitor / crawler asks for them.
+    _start_product_refresh()
+    _start_landing_page_warm()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush buffered analytics events before the worker exits."""
+    analytics_sink.close()
+    db_pool.close_pool()
 
 
 # Mount the Chrome-extension router. All routes are admin-gated and additive;
@@ -668,22 +684,39 @@ def get_active_retailer_keys() -> set:
     }
 
 # Enhanced CSV loader with wrapper and vitola support
+def _intern(value):
+    """Share one copy of strings that repeat across thousands of rows."""
+    return sys.intern(value) if type(value) is str else value
+
+
 class Product:
+    # Every CSV, overlay and community row becomes a Product and the whole
+    # list lives in _product_cache (plus the parsed-CSV cache behind it), so
+    # per-instance size matters: slots drop the per-object __dict__, and the
+    # low-cardinality text fields are interned.
+    __slots__ = (
+        "retailer_key", "retailer_name", "title", "url", "brand", "line",
+        "wrapper", "vitola", "size", "box_qty", "price_cents", "in_stock",
+        "current_promotions_applied", "cigar_id", "community_id",
+        "price_source", "observed_at", "observation_count", "strength",
+        "country",
+    )
+
     def __init__(self, retailer_key, retailer_name, title, url, brand, line, wrapper, vitola, size, box_qty, price, in_stock=True, current_promotions_applied='', cigar_id='', community_id=None, price_source='csv', observed_at=None, observation_count=0, strength='', country=''):
-        self.retailer_key = retailer_key
-        self.retailer_name = retailer_name
+        self.retailer_key = _intern(retailer_key)
+        self.retailer_name = _intern(retailer_name)
         self.title = title
         self.url = url
-        self.brand = brand
-        self.line = line
-        self.wrapper = wrapper
-        self.vitola = vitola
-        self.size = size
+        self.brand = _intern(brand)
+        self.line = _intern(line)
+        self.wrapper = _intern(wrapper)
+        self.vitola = _intern(vitola)
+        self.size = _intern(size)
         self.box_qty = int(box_qty) if box_qty else 25
         self.price_cents = int(float(price) * 100) if price else 0
         self.in_stock = str(in_stock).lower() not in ('false', '0', 'no', '')
-        self.current_promotions_applied = current_promotions_applied
-        self.cigar_id = cigar_id
+        self.current_promotions_applied = _intern(current_promotions_applied)
+        self.cigar_id = _intern(cigar_id)
         self.community_id = community_id
         # Provenance for the consumer extension's "Last observed …" badge
         # and the operator's data-quality view:
@@ -699,8 +732,21 @@ class Product:
         # from master_cigars.csv (canonical) when the row's cigar_id resolves
         # there; empty when no master entry exists yet (e.g. a brand-new CID
         # in flight before master propagation).
-        self.strength = strength
-        self.country = country
+        self.strength = _intern(strength)
+        self.country = _intern(country)
+
+    def __copy__(self):
+        # Every snapshot rebuild copies each cached row (see
+        # _load_retailer_csv_products); going through the slot descriptors
+        # is about twice as fast as the generic copy protocol.
+        clone = Product.__new__(Product)
+        for set_field, value in zip(_PRODUCT_SETTERS, _PRODUCT_FIELDS(self)):
+            set_field(clone, value)
+        return clone
+
+
+_PRODUCT_FIELDS = operator.attrgetter(*Product.__slots__)
+_PRODUCT_SETTERS = tuple(getattr(Product, name).__set__ for name in Product.__slots__)
 
 
 # ── Gap 3: master-first metadata index ────────────────────────────────
@@ -719,7 +765,7 @@ class Product:
 # Also exposes strength + country_of_origin — fields master has had all
 # along but were never read by the loader.
 
-_master_index_cache = {"data": None, "timestamp": 0}
+_master_index_cache = {"data": None, "timestamp": 0, "signature": None}
 
 
 # Shopper-facing wrapper categories. When pairing with a botanical/varietal
@@ -863,20 +909,28 @@ def load_master_index() -> Dict[str, Dict[str, str]]:
 
     Returns dict: cigar_id -> {brand, line, wrapper, vitola, size, box_qty,
                                strength, country}.
-    Cached for 5 minutes alongside the product cache.
+    Cached until master_cigars.csv changes on disk (mtime/size), so the
+    incremental product refresh can tell when enrichment must be redone.
     """
     now = time.time()
+    csv_path = _master_csv_path()
+    signature = _file_signature(csv_path)
     if (_master_index_cache["data"] is not None
-            and (now - _master_index_cache["timestamp"]) < CACHE_TTL_SECONDS):
+            and _master_index_cache.get("signature") == signature):
         return _master_index_cache["data"]
 
     index: Dict[str, Dict[str, str]] = {}
-    csv_path = _master_csv_path()
     if not csv_path.exists():
         logger.warning("master_cigars.csv not found at %s; load_master_index returning empty", csv_path)
-        _master_index_cache.update({"data": index, "timestamp": now})
+        _master_index_cache.update({"data": index, "timestamp": now, "signature": signature})
         return index
 
+    snapshot = catalog_snapshot.open_snapshot()
+    compiled = snapshot.section("master_index") if snapshot else None
+    if compiled is not None:
+        _master_index_cache.update({"data": compiled, "timestamp": now, "signature": signature})
+        return compiled
+
     try:
         with open(csv_path, 'r', newline='', encoding='utf-8') as f:
             reader = csv.DictReader(f)
@@ -897,26 +951,35 @@ def load_master_index() -> Dict[str, Dict[str, str]]:
                 # Display strings use _format_wrapper_display so the colloquial
                 # term always lands on the RIGHT: "Ecuadorian Habano (Natural)".
                 # Both fields are also exposed separately for that helper.
-                wrapper_alias = (row.get('Wrapper_Alias') or '').strip()
-                wrapper_canon = (row.get('Wrapper') or '').strip()
-                index[cid] = {
-                    'brand':    (row.get('Brand') or '').strip(),
-                    'line':     (row.get('Line') or '').strip(),
+                wrapper_alias = _intern((row.get('Wrapper_Alias') or '').strip())
+                wrapper_canon = _intern((row.get('Wrapper') or '').strip())
+                index[_intern(cid)] = {
+                    'brand':    _intern((row.get('Brand') or '').strip()),
+                    'line':     _intern((row.get('Line') or '').strip()),
                     'wrapper':  wrapper_alias or wrapper_canon,
                     'wrapper_alias': wrapper_alias,
                     'wrapper_canon': wrapper_canon,
-                    'vitola':   (row.get('Vitola') or '').strip(),
-                    'size':     size,
+                    'vitola':   _intern((row.get('Vitola') or '').strip()),
+                    'size':     _intern(size),
                     'box_qty':  box_qty,
-                    'strength': (row.get('Strength') or '').strip(),
-                    'country':  (row.get('country_of_origin') or '').strip(),
+                    'strength': _intern((row.get('Strength') or '').strip()),
+                    'country':  _intern((row.get('country_of_origin') or '').strip()),
                 }
     except Exception as e:
         logger.warning("load_master_index failed: %s", e)
-    _master_index_cache.update({"data": index, "timestamp": now})
+    _master_index_cache.update({"data": index, "timestamp": now, "signature": signature})
     return index
 
 
+def _file_signature(path) -> Optional[tuple]:
+    """(path, mtime_ns, size) — changes whenever the file is rewritten."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
 def _enrich_from_master(field: str, csv_value: str, master_row: Optional[Dict[str, str]]) -> str:
     """master-first preference. master wins when populated; CSV fallback."""
     if master_row:
@@ -996,10 +1059,23 @@ def load_csv(csv_path, retailer_key, retailer_name, master_index: Optional[Dict[
 
     return items
 
-# In-memory product cache (refreshes every 5 minutes instead of reading 35+ CSVs per request)
-_product_cache = {"data": None, "timestamp": 0}
+# In-memory product cache (refreshes every 5 minutes instead of reading 35+ CSVs per request).
+# Once loaded, an expired snapshot keeps being served while a background
+# thread rebuilds it; see load_all_products().
+_product_cache = {"data": None, "timestamp": 0, "index": None}
 CACHE_TTL_SECONDS = 300  # 5 minutes
 
+# Parsed per-retailer CSV rows: key -> (file signature + master signature, products).
+# Only retailers whose CSV (or master_cigars.csv) changed are re-parsed.
+_csv_products_cache: Dict[str, tuple] = {}
+# Last overlay query results and the source watermarks they were read at.
+_overlay_cache: Dict[str, object] = {
+    "watermarks": None, "observed": [], "staged": [], "community": [],
+}
+_product_refresh_lock = threading.Lock()
+_product_refresh_state = {"running": False}
+_product_refresh_state_lock = threading.Lock()
+
 # Last-run dedup stats. Surfaces in the smoke-test dashboard so the
 # operator can see whether a fresh website-form submission was caught
 # by the dedup logic in load_all_products(). Updated on every cache
@@ -1099,7 +1175,7 @@ def _load_observed_overlay(window_days: int = 14) -> list:
     Sprint 3 brief):
       * window: last ``window_days`` days of quantity_type='box' rows
       * one row per (retailer_key, cigar_id) — newest observation wins
-        for price + in_stock + observed_at
+        for price + in_stock + observed_at (read from latest_observed)
       * skips rows where the operator hasn't approved the URL yet
         (cigar_id IS NULL)
       * skips rows where the latest observation is older than the window
@@ -1115,41 +1191,23 @@ def _load_observed_overlay(window_days: int = 14) -> list:
     rows = []
     try:
         cur = conn.cursor()
+        # latest_observed holds one row per pair, kept current by every
+        # observation write (app/community_endpoints.record_latest_observed),
+        # so this read is bounded by the catalog, not by observation volume.
         cur.execute(
             """
-            SELECT DISTINCT ON (retailer_key, cigar_id)
-                   retailer_key, cigar_id, price_cents, in_stock,
-                   box_qty, scraped_title, url, observed_at
-            FROM observed_prices
+            SELECT retailer_key, cigar_id, price_cents, in_stock,
+                   box_qty, scraped_title, url, observed_at, observation_count
+            FROM latest_observed
             WHERE retailer_key = ANY(%s)
-              AND cigar_id IS NOT NULL
-              AND quantity_type = 'box'
-              AND price_cents IS NOT NULL
               AND observed_at > NOW() - (%s || ' days')::interval
-            ORDER BY retailer_key, cigar_id, observed_at DESC
+            ORDER BY retailer_key, cigar_id
             """,
             (list(blocked_keys), str(window_days)),
         )
         rows = cur.fetchall()
-        # Pull per-pair observation counts so the popup can show "based on
-        # N reports". Cheap secondary query keyed by the same window.
-        cur.execute(
-            """
-            SELECT retailer_key, cigar_id, COUNT(*)
-            FROM observed_prices
-            WHERE retailer_key = ANY(%s)
-              AND cigar_id IS NOT NULL
-              AND quantity_type = 'box'
-              AND price_cents IS NOT NULL
-              AND observed_at > NOW() - (%s || ' days')::interval
-            GROUP BY retailer_key, cigar_id
-            """,
-            (list(blocked_keys), str(window_days)),
-        )
-        counts = {(r[0], r[1]): int(r[2]) for r in cur.fetchall()}
     except Exception as e:
         print(f"_load_observed_overlay: query failed: {e}")
-        counts = {}
     finally:
         try:
             conn.close()
@@ -1161,7 +1219,7 @@ def _load_observed_overlay(window_days: int = 14) -> list:
     products = []
     for r in rows:
         (retailer_key, cigar_id, price_cents, in_stock,
-         box_qty, scraped_title, url, observed_at) = r
+         box_qty, scraped_title, url, observed_at, observation_count) = r
         try:
             # Master-first metadata (Gap 3). For observed rows, master is
             # the ONLY source of human-readable metadata — the previous
@@ -1207,7 +1265,7 @@ def _load_observed_overlay(window_days: int = 14) -> list:
                 cigar_id=cigar_id or "",
                 price_source="observed",
                 observed_at=observed_at.isoformat() if observed_at else None,
-                observation_count=counts.get((retailer_key, cigar_id), 1),
+                observation_count=observation_count or 1,
                 strength=strength,
                 country=country,
             ))
@@ -1369,6 +1427,9 @@ def _merge_blocked_overlay_onto_csv_products(
     Returns a set of ``(retailer_key, canonical_cigar_id)`` keys for overlay
     rows that were merged into at least one CSV product (so the caller can
     avoid appending duplicates).
+
+    Rows in ``all_products`` are shared with the parse/overlay caches, so a
+    merged row is replaced in place by a copy rather than mutated.
     """
     if not overlay_products:
         return set()
@@ -1388,7 +1449,7 @@ def _merge_blocked_overlay_onto_csv_products(
             continue
         ou = canonicalize_url(getattr(op, "url", "") or "") if getattr(op, "url", None) else ""
         candidates = [
-            p for p in all_products
+            i for i, p in enumerate(all_products)
             if getattr(p, "retailer_key", None) == rk
             and canonical_cigar_id_for_comparison(getattr(p, "cigar_id", None) or "") == ocid
         ]
@@ -1397,15 +1458,16 @@ def _merge_blocked_overlay_onto_csv_products(
         targets = []
         if ou:
             targets = [
-                p for p in candidates
-                if canonicalize_url(getattr(p, "url", "") or "") == ou
+                i for i in candidates
+                if canonicalize_url(getattr(all_products[i], "url", "") or "") == ou
             ]
         if not targets and len(candidates) == 1:
             targets = candidates
         if not targets:
             continue
         opc = int(getattr(op, "price_cents", 0) or 0)
-        for p in targets:
+        for i in targets:
+            p = all_products[i] = copy.copy(all_products[i])
             if opc > 0:
                 p.price_cents = opc
             p.in_stock = bool(getattr(op, "in_stock", True))
@@ -1520,30 +1582,213 @@ def _resolve_community_retailer_key(retailer_name: str, url: str) -> Optional[st
 
 
 def load_all_products():
-    """Load all products from all retailer CSV files + community submissions, with in-memory caching"""
-    now = time.time()
-    if _product_cache["data"] is not None and (now - _product_cache["timestamp"]) < CACHE_TTL_SECONDS:
+    """All products from every retailer CSV + overlays + community submissions.
+
+    Stale-while-revalidate: once a snapshot exists it is always returned
+    immediately; after CACHE_TTL_SECONDS a background thread rebuilds it
+    and swaps the new list in. Only a missing snapshot (first load, or a
+    router nulling ``_product_cache["data"]`` after a write) is built
+    inline — and even then unchanged CSVs are not re-parsed.
+    """
+    data = _product_cache["data"]
+    if data is not None:
+        if time.time() - _product_cache["timestamp"] >= CACHE_TTL_SECONDS:
+            _start_product_refresh()
+        return data
+    with _product_refresh_lock:
+        if _product_cache["data"] is None:
+            # Explicit invalidation means a write just happened: re-query
+            # every overlay rather than trusting the watermarks.
+            _refresh_products(force_overlays=True)
         return _product_cache["data"]
 
-    # Build the master metadata index ONCE per cache refresh and pass it
-    # into every per-retailer load_csv call. This avoids re-parsing
-    # master_cigars.csv 35+ times (once per retailer) on a cold cache.
+
+def _start_product_refresh():
+    """Kick off a background rebuild unless one is already running."""
+    with _product_refresh_state_lock:
+        if _product_refresh_state["running"]:
+            return
+        _product_refresh_state["running"] = True
+    threading.Thread(target=_background_product_refresh, name="product-refresh", daemon=True).start()
+
+
+def _background_product_refresh():
+    try:
+        with _product_refresh_lock:
+            _refresh_products(force_overlays=_product_cache["data"] is None)
+    except Exception as e:
+        # Keep serving the previous snapshot; the next request retries.
+        logger.error(f"Background product refresh failed: {e}")
+    finally:
+        with _product_refresh_state_lock:
+            _product_refresh_state["running"] = False
+
+
+def _refresh_products(force_overlays: bool = False) -> None:
+    """Rebuild the snapshot incrementally and swap it in. Caller holds the lock."""
+    started = time.time()
+    previous = _product_cache["data"]
     master_index = load_master_index()
+    csv_products, csv_changed = _load_retailer_csv_products(master_index)
+    overlays, overlays_changed = _load_overlays(force_overlays)
+
+    if _product_cache["data"] is not previous:
+        # A router invalidated the cache mid-build; what we read may predate
+        # its write. Leave the rebuild to the next request.
+        return
+    if previous is not None and not csv_changed and not overlays_changed:
+        # Nothing moved: keep the same list so everything keyed on its
+        # identity (index, /options, landing pages, sitemaps) stays warm.
+        _product_cache["timestamp"] = time.time()
+        return
+
+    all_products = _assemble_products(csv_products, overlays)
+    # Build the index before publishing the list so readers never pair a
+    # new snapshot with an old index.
+    _product_cache["index"] = _build_product_index(all_products)
+    _product_cache["data"] = all_products
+    _product_cache["timestamp"] = time.time()
+    logger.info(
+        "Product snapshot rebuilt in %.2fs (%d products; CSVs re-parsed: %d/%d; overlays re-queried: %s)",
+        time.time() - started, len(all_products), len(csv_changed), len(_csv_products_cache),
+        ", ".join(overlays_changed) or "none",
+    )
+
 
-    all_products = []
+def _load_retailer_csv_products(master_index) -> tuple:
+    """Per-retailer CSV rows, re-parsing only files whose mtime/size changed.
+
+    A changed file is taken from the compiled catalog snapshot when the
+    snapshot was built from identical bytes, and parsed otherwise.
+    Returns (products, reloaded retailer keys). The Product objects are the
+    cached ones, shared with the published snapshot; overlay merges copy a
+    row before changing it, so they are never mutated.
+    """
+    master_sig = _master_index_cache.get("signature")
+    snapshot = catalog_snapshot.open_snapshot()
+    products = []
+    changed = []
     for retailer in RETAILERS:
         # Dormant retailers stay in RETAILERS for config/history but must not
         # appear on /compare or feed automation (see get_active_retailer_keys).
         if retailer.get("extractor_status") == "dormant":
             continue
-        products = load_csv(retailer["csv"], retailer["key"], retailer["name"], master_index=master_index)
-        all_products.extend(products)
+        key = retailer["key"]
+        signature = (_file_signature(retailer["csv"]), master_sig)
+        cached = _csv_products_cache.get(key)
+        if cached is None or cached[0] != signature:
+            rows = _compiled_csv_products(snapshot, retailer)
+            if rows is None:
+                rows = load_csv(retailer["csv"], key, retailer["name"], master_index=master_index)
+            _csv_products_cache[key] = (signature, rows)
+            changed.append(key)
+        else:
+            rows = cached[1]
+        products.extend(rows)
+    return products, changed
+
+
+def _compiled_csv_products(snapshot, retailer) -> Optional[list]:
+    """One retailer's master-joined rows from the catalog snapshot, if still valid."""
+    section = snapshot.section(f"products/{retailer['key']}") if snapshot else None
+    if (section is None
+            or section["fields"] != list(Product.__slots__)
+            or section["retailer_name"] != retailer["name"]):
+        return None
+    rows = []
+    for values in section["rows"]:
+        product = Product.__new__(Product)
+        for set_field, value in zip(_PRODUCT_SETTERS, values):
+            set_field(product, value)
+        rows.append(product)
+    return rows
+
+
+def _overlay_watermarks() -> Optional[Dict[str, tuple]]:
+    """Cheap change markers for each overlay source, or None if unreadable.
+
+    Counts catch deletions, status flips, rows ageing out of the observe
+    window and cigar_id being set on existing rows; MAX timestamps / ids
+    catch inserts.
+    """
+    try:
+        conn = get_analytics_conn()
+    except Exception:
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT
+              (SELECT MAX(observed_at) FROM observed_prices
+                WHERE quantity_type = 'box' AND price_cents IS NOT NULL
+                  AND observed_at > NOW() - INTERVAL '14 days'),
+              (SELECT COUNT(*) FROM observed_prices
+                WHERE cigar_id IS NOT NULL AND quantity_type = 'box'
+                  AND price_cents IS NOT NULL
+                  AND observed_at > NOW() - INTERVAL '14 days'),
+              (SELECT MAX(created_at) FROM extension_staged_approvals WHERE status = 'pending'),
+              (SELECT COUNT(*) FROM extension_staged_approvals
+                WHERE status = 'pending' AND cid IS NOT NULL AND url IS NOT NULL),
+              (SELECT MAX(id) FROM community_prices WHERE active = 1),
+              (SELECT COUNT(*) FROM community_prices WHERE active = 1)
+            """
+        )
+        obs_max, obs_n, staged_max, staged_n, comm_max, comm_n = cur.fetchone()
+    except Exception as e:
+        logger.info(f"Overlay watermark query failed: {e}")
+        return None
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    master_sig = _master_index_cache.get("signature")
+    return {
+        "observed": (obs_max, obs_n, master_sig),
+        # Staged rows for active retailers fall back to observed prices.
+        "staged": (staged_max, staged_n, obs_max, obs_n, master_sig),
+        "community": (comm_max, comm_n),
+    }
+
+
+_OVERLAY_LOADERS = {
+    "observed": lambda: _load_observed_overlay(),
+    "staged": lambda: _load_staged_approval_overlay(),
+    "community": lambda: _load_community_products(),
+}
+
+
+def _load_overlays(force: bool) -> tuple:
+    """Overlay products, re-querying only sources whose watermark advanced.
+
+    Returns ({name: products}, re-queried names). Without readable
+    watermarks (DB down, local dev) every source is queried, as before.
+    The lists are fresh but the Products are the cached ones; treat them
+    as read-only.
+    """
+    c = _overlay_cache
+    watermarks = _overlay_watermarks()
+    previous = c["watermarks"] or {}
+    changed = []
+    for name, loader in _OVERLAY_LOADERS.items():
+        mark = watermarks.get(name) if watermarks else None
+        if force or mark is None or previous.get(name) != mark:
+            c[name] = loader()
+            changed.append(name)
+    c["watermarks"] = watermarks
+    return {name: list(c[name]) for name in _OVERLAY_LOADERS}, changed
+
+
+def _assemble_products(csv_products: list, overlays: Dict[str, list]) -> list:
+    """Merge overlays and community rows onto the CSV products."""
+    all_products = csv_products
 
     # Overlay consumer observations on top of CSV data for blocked retailers.
     # Rows in ``observed_prices`` must *merge into* existing CSV Products when
     # the same (retailer_key, cigar_id) already exists — otherwise stale CSV
     # in_stock/price would never reflect extension observations or corrections.
-    observed_products = _load_observed_overlay()
+    observed_products = overlays["observed"]
     if observed_products:
         merged_obs = _merge_blocked_overlay_onto_csv_products(
             all_products, observed_products, price_source="observed",
@@ -1563,7 +1808,7 @@ def load_all_products():
     # Pending operator approvals: merge over CSV (and over observed fields)
     # for blocked retailers so manual approvals and community resolutions
     # refresh price/stock immediately on /compare.
-    staged_approval_products = _load_staged_approval_overlay()
+    staged_approval_products = overlays["staged"]
     if staged_approval_products:
         merged_staged = _merge_blocked_overlay_onto_csv_products(
             all_products, staged_approval_products, price_source="operator_approved",
@@ -1580,7 +1825,7 @@ def load_all_products():
             if key not in merged_staged:
                 all_products.append(sp)
 
-    community_products = _load_community_products()
+    community_products = overlays["community"]
 
     # Backfill missing size/CID on community products from CSV data
     if community_products:
@@ -1590,10 +1835,11 @@ def load_all_products():
                 key = (p.brand.lower(), p.line.lower(), p.wrapper.lower(), p.vitola.lower(), p.box_qty)
                 if key not in csv_lookup:
                     csv_lookup[key] = p
-        for cp in community_products:
+        for i, cp in enumerate(community_products):
             key = (cp.brand.lower(), cp.line.lower(), cp.wrapper.lower(), cp.vitola.lower(), cp.box_qty)
             match = csv_lookup.get(key)
-            if match:
+            if match and (not cp.size or not cp.cigar_id):
+                cp = community_products[i] = copy.copy(cp)
                 if not cp.size:
                     cp.size = match.size
                 if not cp.cigar_id:
@@ -1645,12 +1891,42 @@ def load_all_products():
     _dedup_stats["last_dropped"] = dropped
     _dedup_stats["last_total_community"] = len(community_products)
     _dedup_stats["last_run_at"] = datetime.now().isoformat()
-    
-    _product_cache["data"] = all_products
-    _product_cache["timestamp"] = now
     return all_products
 
 
+def _build_product_index(products) -> ProductIndex:
+    try:
+        from app.cid_matcher import canonical_cigar_id_for_comparison  # type: ignore
+    except Exception:
+        canonical_cigar_id_for_comparison = None  # type: ignore
+    return ProductIndex(
+        products,
+        brand_slug=_landing_brand_slug,
+        line_slug=normalize_line_slug,
+        canonical_cid=canonical_cigar_id_for_comparison,
+    )
+
+
+def get_product_index() -> ProductIndex:
+    """Keyed view over ``load_all_products()``; rebuilt once per cache refresh.
+
+    Several routers invalidate the cache by nulling ``_product_cache["data"]``
+    directly, so the index is tied to the identity of the product list rather
+    than trusted blindly.
+    """
+    products = load_all_products()
+    index = _product_cache.get("index")
+    if index is None or index.products is not products:
+        index = _build_product_index(products)
+        _product_cache["index"] = index
+    return index
+
+
+def _landing_brand_slug(brand: str) -> str:
+    """Brand segment of ``/cigars/{brand}/{line}`` URLs."""
+    return brand.lower().replace(' ', '-').replace('&', 'and')
+
+
 _sitemap_cigar_pairs_cache = {"pairs": None, "_prod_ts": None}
 
 
@@ -1710,7 +1986,7 @@ def _get_valid_landing_pages():
     for (brand, line), products in by_line.items():
         if not _line_has_comparable_variation(products):
             continue
-        brand_slug = brand.lower().replace(' ', '-').replace('&', 'and')
+        brand_slug = _landing_brand_slug(brand)
         line_slug = normalize_line_slug(line)
         pages.append({
             'brand': brand,
@@ -1910,15 +2186,13 @@ def generate_faq_answers(brand, line, seo_data):
     
     # FAQ 2: What wrappers are available?
     # Try to extract wrapper info from products database
-    all_products = load_all_products()
     wrappers = set()
     vitolas = set()
-    for p in all_products:
-        if p.brand.lower() == brand.lower() and p.line.lower() == line.lower():
-            if p.wrapper:
-                wrappers.add(p.wrapper)
-            if p.vitola:
-                vitolas.add(p.vitola)
+    for p in get_product_index().by_brand_line(brand, line):
+        if p.wrapper:
+            wrappers.add(p.wrapper)
+        if p.vitola:
+            vitolas.add(p.vitola)
     
     if wrappers:
         wrapper_list = sorted(list(wrappers))
@@ -1954,7 +2228,7 @@ def generate_faq_answers(brand, line, seo_data):
 
 MIN_RETAILERS_FOR_COMPARISON = 3
 
-def build_options_tree():
+def build_options_tree(products=None):
     """Build the brand -> line -> wrapper -> vitola/size tree for dropdowns with wrapper alias support.
     
     Only includes brand/line combinations carried by at least MIN_RETAILERS_FOR_COMPARISON
@@ -1962,7 +2236,8 @@ def build_options_tree():
     Variation-level filtering ensures individual wrapper/vitola/box_qty combos also
     meet the retailer threshold before appearing in dropdowns.
     """
-    products = load_all_products()
+    if products is None:
+        products = load_all_products()
     wrapper_aliases = load_master_wrapper_aliases()
     
     print(f"Building options tree with {len(products)} products and {len(wrapper_aliases)} wrapper aliases")
@@ -2002,12 +2277,12 @@ def build_options_tree():
         if product.line not in tree[product.brand]:
             tree[product.brand][product.line] = {}
         
-        wrapper_alias = get_wrapper_alias(product.wrapper, product.brand, product.line, wrapper_aliases)
-        if wrapper_alias:
-            aliases_used += 1
-        
         wrapper_key = product.wrapper or "No Wrapper Specified"
         if wrapper_key not in tree[product.brand][product.line]:
+            # Alias depends only on (brand, line, wrapper): look it up once per node.
+            wrapper_alias = get_wrapper_alias(product.wrapper, product.brand, product.line, wrapper_aliases)
+            if wrapper_alias:
+                aliases_used += 1
             tree[product.brand][product.line][wrapper_key] = {
                 'vitolas': set(),
                 'sizes': set(),
@@ -2079,6 +2354,40 @@ def build_options_tree():
     
     return brands
 
+
+_options_cache = {"products": None, "brands": None, "body": None}
+
+
+def get_options_tree():
+    """``build_options_tree()`` computed once per product-cache generation.
+
+    Also keeps the serialized + gzipped ``/options`` body, so the most-hit
+    API never re-walks the catalog or re-encodes JSON between reloads.
+    Keyed on the product list's identity, like ``get_product_index``.
+    """
+    products = load_all_products()
+    c = _options_cache
+    if c["brands"] is None or c["products"] is not products:
+        brands = _compiled_options_tree(products)
+        if brands is None:
+            brands = build_options_tree(products)
+        c["brands"] = brands
+        c["body"] = CachedBody.from_json({"brands": brands})
+        c["products"] = products
+    return c["brands"]
+
+def _compiled_options_tree(products) -> Optional[list]:
+    """The catalog snapshot's tree, when ``products`` are exactly the CSV rows it saw."""
+    if any(p.price_source != 'csv' for p in products):
+        return None  # overlays merged on top; the compiled tree doesn't cover them
+    snapshot = catalog_snapshot.open_snapshot()
+    compiled = snapshot.section("options") if snapshot else None
+    if compiled is None:
+        return None
+    if compiled["products_digest"] != catalog_snapshot.products_digest(map(_PRODUCT_FIELDS, products)):
+        return None
+    return compiled["brands"]
+
 # Routes
 @app.get("/", response_class=HTMLResponse)
 def home():
@@ -2089,9 +2398,14 @@ def health():
     return {"ok": True}
 
 @app.get("/options")
-def options():
+def options(request: Request):
     """Return brand -> line -> wrapper -> vitola/size tree for dropdowns"""
-    return {"brands": build_options_tree()}
+    get_options_tree()
+    # ETag is a hash of the body, so a product reload that changes nothing
+    # still answers 304.
+    return _options_cache["body"].respond(
+        request, cache_control="public, max-age=60, must-revalidate",
+    )
 
 @app.get("/api/retailers")
 def api_retailers():
@@ -2126,29 +2440,18 @@ def compare(
         ip_hash = hashlib.sha256(ip.encode()).hexdigest() if ip else None
         zip_prefix = zip[:3] if zip else None
 
-        conn = get_analytics_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO search_events
-            (brand, line, wrapper, vitola, size, zip_prefix, cid, ip_hash, user_agent)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                brand,
-                line,
-                wrapper,
-                vitola,
-                size,
-                zip_prefix,
-                None,       # cid placeholder for now
-                ip_hash,
-                ua,
-            ),
+        analytics_sink.record(
+            "search_events",
+            brand=brand,
+            line=line,
+            wrapper=wrapper,
+            vitola=vitola,
+            size=size,
+            zip_prefix=zip_prefix,
+            cid=None,       # cid placeholder for now
+            ip_hash=ip_hash,
+            user_agent=ua,
         )
-
-        conn.commit()
-        conn.close()
     except Exception as e:
         print(f"[analytics] Search log failed: {e}")
 
@@ -2156,17 +2459,12 @@ def compare(
     # Get state from ZIP for shipping/tax calculations
     state = zip_to_state(zip) if zip else 'OR'
     
-    # Load all products and filter by criteria
-    all_products = load_all_products()
+    # Brand/line bucket from the product index, then apply optional filters
     master_index = load_master_index()
 
     matching_products = []
     
-    for p in all_products:
-        # Brand and line must match
-        if p.brand.lower() != brand.lower() or p.line.lower() != line.lower():
-            continue
-        
+    for p in get_product_index().by_brand_line(brand, line):
         # Wrapper filter (optional) — accepts display "Specific (Colloquial)",
         # either half, or raw Product.wrapper / master fields.
         if wrapper and wrapper.strip():
@@ -2241,7 +2539,10 @@ def compare(
     results = []
     in_stock_prices = []
     
-    for product in matching_products:
+    # ``zip`` is the ZIP-code query param here, so index into the batch result.
+    promos = apply_promotions(matching_products)
+    for i, product in enumerate(matching_products):
+        promo_price_cents, promo_code, promo_discount = promos[i]
         # Calculate costs
         base_cents = product.price_cents
         shipping_cents = estimate_shipping_cents(base_cents, product.retailer_key, state)
@@ -2251,10 +2552,7 @@ def compare(
         tax_cents = tax_cents or 0
         delivered_cents = base_cents + shipping_cents + tax_cents
         
-        # Apply promotions
-        # Apply promotions
-        promo_price_cents, promo_code, promo_discount = apply_promotion(base_cents, product.retailer_key)
-        print(f"DEBUG: {product.retailer_key} - Base: {base_cents}, Promo: {promo_price_cents}, Code: {promo_code}, Discount: {promo_discount}")
+        # Apply promotions (computed for the whole result set above)
         if promo_price_cents and promo_price_cents != base_cents:
             promo_shipping_cents = estimate_shipping_cents(promo_price_cents, product.retailer_key, state) or 0
             promo_tax_cents = estimate_tax_cents(promo_price_cents + promo_shipping_cents, product.retailer_key, state) or 0
@@ -2381,16 +2679,8 @@ def compare_all(
     # Get state from ZIP for shipping/tax calculations
     state = zip_to_state(zip) if zip else 'OR'
     
-    # Load all products and filter by brand/line only
-    all_products = load_all_products()
-    matching_products = []
-    
-    for p in all_products:
-        # Brand and line must match
-        if p.brand.lower() != brand.lower() or p.line.lower() != line.lower():
-            continue
-        
-        matching_products.append(p)
+    # All variations of the brand/line, straight from the product index
+    matching_products = list(get_product_index().by_brand_line(brand, line))
 
     # Filter by authorized dealers if requested
     if authorized_only:
@@ -2557,27 +2847,114 @@ def compare_all(
 RETAILER_KEY_TO_NAME = {r["key"]: r["name"] for r in RETAILERS}
 
 
-def _median_price(values: list[float]) -> float:
-    s = sorted(values)
-    n = len(s)
-    if n % 2:
-        return s[n // 2]
-    return (s[n // 2 - 1] + s[n // 2]) / 2
+HISTORICAL_DB_PATH = PROJECT_ROOT / "data" / "historical_prices.db"
 
+# /api/price-history switches to weekly / monthly rollups past these spans.
+PRICE_HISTORY_DAILY_MAX_DAYS = 180
+PRICE_HISTORY_WEEKLY_MAX_DAYS = 730
 
-def _price_history_is_outlier(price: float, peer_median: float) -> bool:
-    """Drop bogus homepage scrapes and obvious typos from chart series."""
-    if peer_median < 100:
-        return False
-    if price <= 75 and peer_median >= 150:
-        return True
-    if price < peer_median * 0.25:
-        return True
-    if price > 2000:
-        return True
-    if price > peer_median * 5 and price > 500:
-        return True
-    return False
+_historical_ro = {"conn": None, "file_id": None}
+_historical_ro_lock = threading.Lock()
+
+
+def _historical_fetchall(sql: str, params=()) -> list:
+    """Run a read on the shared read-only historical_prices.db connection.
+
+    One connection serves every request (serialized by a lock; reads are
+    index range scans). It is reopened when the file is replaced, e.g. by a
+    deploy that pulls the nightly DB. Returns [] when the DB is missing.
+    """
+    try:
+        st = os.stat(HISTORICAL_DB_PATH)
+    except OSError:
+        return []
+    file_id = (st.st_dev, st.st_ino)
+    with _historical_ro_lock:
+        c = _historical_ro
+        if c["conn"] is None or c["file_id"] != file_id:
+            if c["conn"] is not None:
+                c["conn"].close()
+            c["conn"] = sqlite3.connect(
+                f"file:{HISTORICAL_DB_PATH}?mode=ro", uri=True, check_same_thread=False,
+            )
+            c["file_id"] = file_id
+        return c["conn"].execute(sql, params).fetchall()
+
+
+def _price_history_resolution(cids: list) -> str:
+    placeholders = ",".join("?" for _ in cids)
+    # Rollups outlive the daily rows the prune script trims, so the span
+    # starts at whichever table reaches further back.
+    rows = _historical_fetchall(f"""
+        SELECT
+            (SELECT MIN(day) FROM price_daily WHERE cigar_id IN ({placeholders})),
+            (SELECT MAX(day) FROM price_daily WHERE cigar_id IN ({placeholders})),
+            (SELECT MIN(period_start) FROM price_rollup
+             WHERE period = 'month' AND cigar_id IN ({placeholders}))
+    """, cids * 3)
+    if not rows or not rows[0][1]:
+        return "day"
+    first_day, last_day, first_month = rows[0]
+    first = min(d for d in (first_day, first_month) if d)
+    span = (datetime.strptime(last_day, "%Y-%m-%d") - datetime.strptime(first, "%Y-%m-%d")).days
+    if span <= PRICE_HISTORY_DAILY_MAX_DAYS:
+        return "day"
+    if span <= PRICE_HISTORY_WEEKLY_MAX_DAYS:
+        return "week"
+    return "month"
+
+
+def _price_history_series(cids: list, resolution: str) -> list:
+    """(retailer, date, price) rows from the pre-aggregated series tables."""
+    placeholders = ",".join("?" for _ in cids)
+    if resolution == "day":
+        rows = _historical_fetchall(f"""
+            SELECT retailer, day, price FROM price_daily
+            WHERE cigar_id IN ({placeholders}) AND is_outlier = 0
+            ORDER BY day ASC
+        """, cids)
+        # Days the prune script moved out of the DB come from the archive.
+        first_live = rows[0][1] if rows else None
+        archived = [
+            (retailer, day, price)
+            for _cid, day, retailer, price, _median, _peers, is_outlier in archived_daily_rows(cids, first_live)
+            if not is_outlier
+        ]
+        return archived + rows
+    rows = _historical_fetchall(f"""
+        SELECT retailer, period_start, avg_price FROM price_rollup
+        WHERE cigar_id IN ({placeholders}) AND period = ?
+        ORDER BY period_start ASC
+    """, [*cids, resolution])
+    return [(r, d, round(p, 2)) for r, d, p in rows]
+
+
+def _price_history_rows_legacy(cids: list) -> list:
+    """Raw price_history scan for DBs that predate the price_daily table."""
+    placeholders = ",".join("?" for _ in cids)
+    rows = _historical_fetchall(f"""
+        SELECT retailer, date, price
+        FROM price_history
+        WHERE cigar_id IN ({placeholders}) AND price > 0
+        ORDER BY date ASC
+    """, cids)
+
+    # Drop per-day outliers (bogus $59 homepage scrapes, $8499 typos) before charting.
+    from collections import defaultdict as _dd
+    by_date: dict[str, list[tuple[str, float]]] = _dd(list)
+    for retailer_key, date_str, price in rows:
+        by_date[date_str].append((retailer_key, float(price)))
+
+    filtered_rows: list[tuple[str, str, float]] = []
+    for date_str, peers in by_date.items():
+        if len(peers) < MIN_PEERS_FOR_OUTLIER:
+            filtered_rows.extend((rk, date_str, p) for rk, p in peers)
+            continue
+        peer_median = median_price([p for _, p in peers])
+        for retailer_key, price in peers:
+            if not is_price_outlier(price, peer_median):
+                filtered_rows.append((retailer_key, date_str, price))
+    return filtered_rows
 
 
 @app.get("/api/price-history")
@@ -2586,15 +2963,17 @@ def price_history(
     line: str = Query(...),
     wrapper: str = Query(""),
     vitola: str = Query(""),
+    resolution: str = Query("auto"),
 ):
-    """Return historical price data for a specific cigar variation, grouped by retailer."""
-    all_products = load_all_products()
+    """Return historical price data for a specific cigar variation, grouped by retailer.
+
+    ``resolution`` is day / week / month; ``auto`` picks by the span of
+    history on record so long ranges come from the rollup table.
+    """
     master_index = load_master_index()
     matching_cids = set()
 
-    for p in all_products:
-        if p.brand.lower() != brand.lower() or p.line.lower() != line.lower():
-            continue
+    for p in get_product_index().by_brand_line(brand, line):
         master_row = master_index.get(p.cigar_id or "") if p.cigar_id else None
         if not _wrapper_filter_matches(wrapper, p, master_row):
             continue
@@ -2605,42 +2984,18 @@ def price_history(
     if not matching_cids:
         return {"days": 0, "retailers": {}}
 
-    hist_db_path = Path("data/historical_prices.db")
-    if not hist_db_path.exists():
-        return {"days": 0, "retailers": {}}
-
-    conn = sqlite3.connect(str(hist_db_path))
-    cur = conn.cursor()
-
-    placeholders = ",".join("?" for _ in matching_cids)
-    cur.execute(f"""
-        SELECT retailer, date, price
-        FROM price_history
-        WHERE cigar_id IN ({placeholders}) AND price > 0
-        ORDER BY date ASC
-    """, list(matching_cids))
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
+    if not HISTORICAL_DB_PATH.exists():
         return {"days": 0, "retailers": {}}
 
-    # Drop per-day outliers (bogus $59 homepage scrapes, $8499 typos) before charting.
-    from collections import defaultdict as _dd
-    by_date: dict[str, list[tuple[str, float]]] = _dd(list)
-    for retailer_key, date_str, price in rows:
-        by_date[date_str].append((retailer_key, float(price)))
-
-    filtered_rows: list[tuple[str, str, float]] = []
-    for date_str, peers in by_date.items():
-        if len(peers) < 3:
-            filtered_rows.extend((rk, date_str, p) for rk, p in peers)
-            continue
-        peer_median = _median_price([p for _, p in peers])
-        for retailer_key, price in peers:
-            if not _price_history_is_outlier(price, peer_median):
-                filtered_rows.append((retailer_key, date_str, price))
-    rows = filtered_rows
+    cids = sorted(matching_cids)
+    try:
+        if resolution not in ("day", "week", "month"):
+            resolution = _price_history_resolution(cids)
+        rows = _price_history_series(cids, resolution)
+    except sqlite3.OperationalError:
+        # DB built before the series tables existed.
+        resolution = "day"
+        rows = _price_history_rows_legacy(cids)
 
     if not rows:
         return {"days": 0, "retailers": {}}
@@ -2707,6 +3062,7 @@ def price_history(
         "high_retailer": high_retailer,
         "retailers": filtered_series,
         "recommendation": recommendation,
+        "resolution": resolution,
     }
 
 
@@ -2753,67 +3109,174 @@ STATIC_SITEMAP_PAGES = [
 ]
 
 
-@app.get("/sitemap.xml", response_class=PlainTextResponse)
-async def sitemap_index():
-    base_url = "https://cigarpricescout.com"
-    today = datetime.now().strftime("%Y-%m-%d")
-    lines = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
-        f'  <sitemap><loc>{base_url}/sitemap-static.xml</loc><lastmod>{today}</lastmod></sitemap>',
-    ]
+SITEMAP_BASE_URL = "https://cigarpricescout.com"
+# sitemaps.org limit per file; the cigar map is split into numbered shards
+# beyond this.
+SITEMAP_MAX_URLS = 50000
+SITEMAP_CACHE_CONTROL = "public, max-age=3600"
+# Static pages whose content moves with prices; their lastmod follows the
+# newest price/stock change instead of the HTML file's mtime.
+_SITEMAP_PRICE_DRIVEN_PAGES = {"/", "/deals.html", "/cigar-price-history"}
+
+# Sitemap bodies by filename, rebuilt once per product-cache generation.
+# A file whose bytes did not change keeps its CachedBody (and Last-Modified).
+_sitemap_cache = {"products": None, "files": {}}
+
+
+def _sitemap_lastmod_by_line(products) -> Dict[tuple, str]:
+    """Newest real price/stock change date per (brand_slug, line_slug).
+
+    Reads ``price_changes`` / ``stock_changes`` from historical_prices.db.
+    Lines with no recorded change get no entry (and so no <lastmod>).
+    """
+    latest_by_cid: Dict[str, str] = {}
     try:
-        if _get_sorted_cigar_sitemap_pairs():
-            lines.append(f'  <sitemap><loc>{base_url}/sitemap-cigars.xml</loc><lastmod>{today}</lastmod></sitemap>')
-    except Exception as e:
-        print(f"[sitemap] Error listing cigar pages for index: {e}")
-    lines.append("</sitemapindex>")
-    return "\n".join(lines) + "\n"
+        for table in ("price_changes", "stock_changes"):
+            for cid, day in _historical_fetchall(
+                f"SELECT cigar_id, MAX(date) FROM {table} GROUP BY cigar_id"
+            ):
+                if day and day > latest_by_cid.get(cid, ""):
+                    latest_by_cid[cid] = day
+    except sqlite3.Error as e:
+        print(f"[sitemap] Could not read change history: {e}")
+        return {}
+
+    lastmod: Dict[tuple, str] = {}
+    for p in products:
+        day = latest_by_cid.get(p.cigar_id)
+        if not day or not p.brand or not p.line:
+            continue
+        key = (_landing_brand_slug(p.brand), normalize_line_slug(p.line))
+        if day > lastmod.get(key, ""):
+            lastmod[key] = day[:10]
+    return lastmod
 
 
-@app.get("/sitemap-static.xml", response_class=PlainTextResponse)
-async def sitemap_static():
-    base_url = "https://cigarpricescout.com"
-    today = datetime.now().strftime("%Y-%m-%d")
+def _sitemap_urlset(entries) -> str:
     parts = [
         '<?xml version="1.0" encoding="UTF-8"?>',
         '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
     ]
-    for page in STATIC_SITEMAP_PAGES:
-        parts.extend([
-            "  <url>",
-            f'    <loc>{base_url}{page["url"]}</loc>',
-            f'    <lastmod>{today}</lastmod>',
-            f'    <changefreq>{page["changefreq"]}</changefreq>',
-            f'    <priority>{page["priority"]}</priority>',
-            "  </url>",
-        ])
+    for loc, lastmod, changefreq, priority in entries:
+        parts.append("  <url>")
+        parts.append(f"    <loc>{SITEMAP_BASE_URL}{loc}</loc>")
+        if lastmod:
+            parts.append(f"    <lastmod>{lastmod}</lastmod>")
+        parts.append(f"    <changefreq>{changefreq}</changefreq>")
+        parts.append(f"    <priority>{priority}</priority>")
+        parts.append("  </url>")
     parts.append("</urlset>")
     return "\n".join(parts) + "\n"
 
 
-@app.get("/sitemap-cigars.xml", response_class=PlainTextResponse)
-async def sitemap_cigars():
-    base_url = "https://cigarpricescout.com"
-    today = datetime.now().strftime("%Y-%m-%d")
-    parts = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
-    ]
+def _build_sitemaps() -> Dict[str, str]:
+    """All sitemap XML documents, keyed by filename."""
+    products = load_all_products()
+    files: Dict[str, str] = {}
+    index_entries = []
+
+    cigar_entries = []
     try:
+        lastmod_by_line = _sitemap_lastmod_by_line(products)
         for brand_slug, line_slug in _get_sorted_cigar_sitemap_pairs():
-            parts.extend([
-                "  <url>",
-                f"    <loc>{base_url}/cigars/{brand_slug}/{line_slug}</loc>",
-                f"    <lastmod>{today}</lastmod>",
-                "    <changefreq>weekly</changefreq>",
-                "    <priority>0.8</priority>",
-                "  </url>",
-            ])
+            cigar_entries.append((
+                f"/cigars/{brand_slug}/{line_slug}",
+                lastmod_by_line.get((brand_slug, line_slug)),
+                "weekly",
+                "0.8",
+            ))
     except Exception as e:
         print(f"[sitemap] Error building cigar sitemap: {e}")
-    parts.append("</urlset>")
-    return "\n".join(parts) + "\n"
+    latest_change = max((e[1] for e in cigar_entries if e[1]), default=None)
+
+    static_entries = []
+    for page in STATIC_SITEMAP_PAGES:
+        if page["url"] in _SITEMAP_PRICE_DRIVEN_PAGES:
+            lastmod = latest_change
+        else:
+            html_file = Path(STATIC_PATH) / page["url"].lstrip("/")
+            lastmod = (
+                datetime.fromtimestamp(html_file.stat().st_mtime).strftime("%Y-%m-%d")
+                if html_file.is_file() else None
+            )
+        static_entries.append((page["url"], lastmod, page["changefreq"], page["priority"]))
+    files["sitemap-static.xml"] = _sitemap_urlset(static_entries)
+    index_entries.append((
+        "sitemap-static.xml",
+        max((e[1] for e in static_entries if e[1]), default=None),
+    ))
+
+    if len(cigar_entries) <= SITEMAP_MAX_URLS:
+        shards = [("sitemap-cigars.xml", cigar_entries)] if cigar_entries else []
+        if not cigar_entries:
+            files["sitemap-cigars.xml"] = _sitemap_urlset([])
+    else:
+        shards = [
+            (f"sitemap-cigars-{n}.xml", cigar_entries[i:i + SITEMAP_MAX_URLS])
+            for n, i in enumerate(range(0, len(cigar_entries), SITEMAP_MAX_URLS), start=1)
+        ]
+        # Keep the old URL valid for crawlers that already know it.
+        files["sitemap-cigars.xml"] = _sitemap_urlset(shards[0][1])
+    for name, entries in shards:
+        files[name] = _sitemap_urlset(entries)
+        index_entries.append((name, max((e[1] for e in entries if e[1]), default=None)))
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+    ]
+    for name, lastmod in index_entries:
+        lastmod_tag = f"<lastmod>{lastmod}</lastmod>" if lastmod else ""
+        lines.append(f"  <sitemap><loc>{SITEMAP_BASE_URL}/{name}</loc>{lastmod_tag}</sitemap>")
+    lines.append("</sitemapindex>")
+    files["sitemap.xml"] = "\n".join(lines) + "\n"
+    return files
+
+
+def get_sitemap(name: str) -> Optional[CachedBody]:
+    """Cached sitemap file for the current product-cache generation."""
+    products = load_all_products()
+    c = _sitemap_cache
+    if c["products"] is not products:
+        prev = c["files"]
+        files = {}
+        for fname, xml in _build_sitemaps().items():
+            body = xml.encode("utf-8")
+            old = prev.get(fname)
+            files[fname] = (
+                old if old is not None and old.body == body
+                else CachedBody(body, "application/xml", last_modified=time.time())
+            )
+        c["files"] = files
+        c["products"] = products
+    return c["files"].get(name)
+
+
+def _sitemap_response(request: Request, name: str) -> Response:
+    body = get_sitemap(name)
+    if body is None:
+        return Response(status_code=404)
+    return body.respond(request, cache_control=SITEMAP_CACHE_CONTROL)
+
+
+@app.get("/sitemap.xml")
+def sitemap_index(request: Request):
+    return _sitemap_response(request, "sitemap.xml")
+
+
+@app.get("/sitemap-static.xml")
+def sitemap_static(request: Request):
+    return _sitemap_response(request, "sitemap-static.xml")
+
+
+@app.get("/sitemap-cigars.xml")
+def sitemap_cigars(request: Request):
+    return _sitemap_response(request, "sitemap-cigars.xml")
+
+
+@app.get("/sitemap-cigars-{shard:int}.xml")
+def sitemap_cigars_shard(shard: int, request: Request):
+    return _sitemap_response(request, f"sitemap-cigars-{shard}.xml")
 
 # SEO: robots.txt (serve from file, but ensure it exists)
 @app.get("/robots.txt", response_class=PlainTextResponse)
@@ -3121,8 +3584,17 @@ def add_tracking_params(
         return url
 
 
+# Rendered /cigars/{brand}/{line} pages, one product-cache generation at a
+# time. "prev" holds the previous generation so a page whose HTML did not
+# change keeps its ETag / Last-Modified (crawlers keep getting 304s).
+_landing_page_cache = {"products": None, "day": None, "pages": {}, "prev": {}}
+_landing_warm_lock = threading.Lock()
+
+LANDING_PAGE_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+
+
 @app.get("/cigars/{brand}/{line}", response_class=HTMLResponse)
-async def cigar_landing_page(brand: str, line: str):
+async def cigar_landing_page(brand: str, line: str, request: Request):
     """
     SEO-friendly landing page for specific cigar brands/lines
     URL format: /cigars/padron/1964-anniversary-series
@@ -3135,18 +3607,103 @@ async def cigar_landing_page(brand: str, line: str):
             url=f"/cigars/{brand}/{normalized_line}",
             status_code=301  # Permanent redirect for SEO
         )
-    
+
+    page = get_landing_page(brand, line)
+    if isinstance(page, CachedBody):
+        return page.respond(request, cache_control=LANDING_PAGE_CACHE_CONTROL)
+    return page
+
+
+def get_landing_page(brand: str, line: str):
+    """Rendered landing page for the current product-cache generation.
+
+    Returns a ``CachedBody`` for pages that render (200) and the uncached
+    ``HTMLResponse`` otherwise (not found / temporarily unavailable), so
+    arbitrary slugs never grow the cache. Only lowercase slugs - the form
+    every link and the sitemap use - are cached.
+    """
+    products = load_all_products()
+    c = _landing_page_cache
+    # {{LAST_UPDATED}} shows today's date, so a new day is a new generation too.
+    today = datetime.now().strftime('%Y-%m-%d')
+    if c["products"] is not products or c["day"] != today:
+        c["prev"] = c["pages"] if c["day"] == today else {}
+        c["pages"] = {}
+        c["products"] = products
+        c["day"] = today
+        _start_landing_page_warm()
+
+    key = (brand, line)
+    page = c["pages"].get(key)
+    if page is not None:
+        return page
+
+    response = _render_landing_page(brand, line, get_product_index())
+    if response.status_code != 200:
+        return response
+    prev = c["prev"].get(key)
+    if prev is not None and prev.body == response.body:
+        page = prev
+    else:
+        page = CachedBody(response.body, "text/html", last_modified=time.time())
+    if brand == brand.lower() and line == line.lower():
+        c["pages"][key] = page
+    return page
+
+
+def _warm_landing_pages():
+    """Render every valid landing page into the cache (background thread)."""
+    try:
+        started = time.time()
+        pages = _get_valid_landing_pages()
+        for p in pages:
+            get_landing_page(p['brand_slug'], p['line_slug'])
+        logger.info(f"Warmed {len(pages)} landing pages in {time.time() - started:.1f}s")
+    except Exception as e:
+        logger.warning(f"Landing page warm-up failed: {e}")
+    finally:
+        _landing_warm_lock.release()
+
+
+def _start_landing_page_warm():
+    if os.getenv("LANDING_PAGE_WARM", "1") == "0":
+        return
+    if not _landing_warm_lock.acquire(blocking=False):
+        return  # a warm-up is already running; it picks up the new generation
+    threading.Thread(target=_warm_landing_pages, name="landing-warm", daemon=True).start()
+
+
+def export_landing_pages(out_dir) -> int:
+    """Write every valid landing page to ``out_dir/cigars/{brand}/{line}/index.html``.
+
+    A ``.gz`` twin is written next to each file so a static server (nginx
+    ``gzip_static``, a CDN bucket) can serve the whole SEO surface without
+    Python. Returns the number of pages written.
+    """
+    import gzip
+
+    out_dir = Path(out_dir)
+    written = 0
+    for p in _get_valid_landing_pages():
+        page = get_landing_page(p['brand_slug'], p['line_slug'])
+        if not isinstance(page, CachedBody):
+            continue
+        target = out_dir / "cigars" / p['brand_slug'] / p['line_slug'] / "index.html"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(page.body)
+        with open(str(target) + ".gz", "wb") as f:
+            f.write(page.gzipped)
+        written += 1
+    return written
+
+
+def _render_landing_page(brand: str, line: str, product_index: ProductIndex) -> HTMLResponse:
     # Convert URL-friendly format back to display format
     brand_display = brand.replace('-', ' ').title()
     line_display = line.replace('-', ' ').title()
     
     try:
-        all_products = load_all_products()
-        matching_products = [
-            p for p in all_products 
-            if p.brand.lower().replace(' ', '-').replace('&', 'and') == brand.lower()
-            and normalize_line_slug(p.line) == line.lower()
-        ]
+        matching_products = list(product_index.by_landing_slug(brand, line))
         
         has_valid_variation = _line_has_comparable_variation(matching_products)
         
@@ -3211,7 +3768,7 @@ async def cigar_landing_page(brand: str, line: str):
         # The toggle button is only rendered when there are >= 2 qualifying siblings.
         canonical_brand = matching_products[0].brand
         sibling_html_button, sibling_html_section = _build_related_releases_html(
-            all_products=all_products,
+            all_products=product_index.by_brand(canonical_brand),
             canonical_brand=canonical_brand,
             current_line_slug=line.lower(),
             brand_slug=brand,
@@ -3446,7 +4003,7 @@ async def generate_landing_page_list():
     Utility endpoint to see what landing pages you should create
     Visit this in your browser to get a list
     """
-    brands = build_options_tree()
+    brands = get_options_tree()
     
     pages = []
     for brand in brands[:20]:  # Start with top 20 brands
@@ -3522,17 +4079,14 @@ def track_click(
         ip = request.client.host if request and request.client else ""
         ip_hash = hashlib.sha256(ip.encode()).hexdigest() if ip else None
 
-        conn = get_analytics_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO click_events (retailer, cid, target_url, ip_hash, user_agent)
-            VALUES (%s, %s, %s, %s, %s)
-            """,
-            (retailer, cid, url, ip_hash, ua),
+        analytics_sink.record(
+            "click_events",
+            retailer=retailer,
+            cid=cid,
+            target_url=url,
+            ip_hash=ip_hash,
+            user_agent=ua,
         )
-        conn.commit()
-        conn.close()
     except Exception as e:
         print(f"[analytics] Click log failed: {e}")
 
@@ -3551,19 +4105,14 @@ def log_click(retailer: str, cid: str, request: Request):
         # Get user agent
         user_agent = request.headers.get("User-Agent", "unknown")
 
-        # Connect to analytics DB
-        conn = get_analytics_conn()
-        cur = conn.cursor()
-
-        # Insert record
-        cur.execute("""
-            INSERT INTO click_events (retailer, cid, ip_hash, user_agent)
-            VALUES (%s, %s, %s, %s);
-        """, (retailer, cid, ip_hash, user_agent))
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Queue the record; the analytics sink batch-inserts it
+        analytics_sink.record(
+            "click_events",
+            retailer=retailer,
+            cid=cid,
+            ip_hash=ip_hash,
+            user_agent=user_agent,
+        )
 
         return {"status": "ok"}
 
@@ -3659,6 +4208,13 @@ async def analytics_health(request: Request):
 
         conn.close()
 
+        # In-process queue in front of search_events/click_events: non-zero
+        # dropped_* counters mean events were lost before reaching Postgres.
+        report["analytics_sink"] = analytics_sink.stats()
+        # Shared connection pool: timeouts > 0 or a high wait_max_ms means
+        # ANALYTICS_DB_POOL_MAX is too small for the request load.
+        report["db_pool"] = db_pool.pool_stats()
+
         report["generated_at"] = datetime.utcnow().isoformat() + "Z"
         report["ga4_measurement_id"] = "G-QV9XYRECFK"
         report["notes"] = [
@@ -4046,11 +4602,10 @@ def get_best_deals(limit: int = Query(50, description="Max number of deals to re
         
         # Calculate prices for all offerings
         prices = []
-        for p in products:
+        for p, (promo_price_cents, promo_code, promo_discount) in zip(products, apply_promotions(products)):
             base_cents = p.price_cents  # Advertised price
             
             # Check if promo applies
-            promo_price_cents, promo_code, promo_discount = apply_promotion(base_cents, p.retailer_key)
             has_promo = promo_price_cents and promo_price_cents != base_cents
             
             # Use promo price if available, otherwise base price for comparison
@@ -4328,6 +4883,26 @@ class CommunityPriceSubmission(BaseModel):
     size: str = ""
     box_qty: int = 20
 
+
+def _log_community_price_history(cid: str, retailer_name: str, url: str, price: float) -> None:
+    hist_db = Path("data/historical_prices.db")
+    if not hist_db.exists():
+        return
+    hist_conn = sqlite3.connect(str(hist_db))
+    try:
+        today = datetime.now().strftime("%Y-%m-%d")
+        hist_conn.execute(
+            "INSERT INTO price_history (cigar_id, retailer, url, price, in_stock, date) VALUES (?, ?, ?, ?, ?, ?)",
+            (cid, retailer_name.lower().replace(" ", ""), url, price, 1, today),
+        )
+        # Never escalate to a full backfill inside a request; the nightly
+        # history writer rebuilds empty series tables.
+        refresh_price_series(hist_conn, [(cid, today)], commit=False, backfill=False)
+        hist_conn.commit()
+    finally:
+        hist_conn.close()
+
+
 @app.post("/api/community-price")
 async def submit_community_price(request: Request):
     """Accept a community-submitted retailer price for a known CID."""
@@ -4358,10 +4933,7 @@ async def submit_community_price(request: Request):
 
         # Match to existing products to fill in size and CID if missing
         if brand and line and (not size or not cid):
-            all_prods = load_all_products()
-            for p in all_prods:
-                if p.brand.lower() != brand.lower() or p.line.lower() != line.lower():
-                    continue
+            for p in get_product_index().by_brand_line(brand, line):
                 if wrapper and p.wrapper.lower() != wrapper.lower():
                     continue
                 if vitola and p.vitola.lower() != vitola.lower():
@@ -4399,18 +4971,12 @@ async def submit_community_price(request: Request):
         conn.commit()
         conn.close()
 
-        # Also log to local historical DB if available
+        # Also log to local historical DB if available (SQLite write + series
+        # refresh, so off the event loop)
         try:
-            hist_db = Path("data/historical_prices.db")
-            if hist_db.exists():
-                hist_conn = sqlite3.connect(str(hist_db))
-                today = datetime.now().strftime("%Y-%m-%d")
-                hist_conn.execute(
-                    "INSERT INTO price_history (cigar_id, retailer, url, price, in_stock, date) VALUES (?, ?, ?, ?, ?, ?)",
-                    (cid, retailer_name.lower().replace(" ", ""), url, price_cents / 100, 1, today),
-                )
-                hist_conn.commit()
-                hist_conn.close()
+            await asyncio.to_thread(
+                _log_community_price_history, cid, retailer_name, url, price_cents / 100
+            )
         except Exception as hist_err:
             logger.warning(f"Could not write community price to local history: {hist_err}")
 
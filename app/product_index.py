@@ -0,0 +1,148 @@
+"""
+Keyed lookup tables over the in-memory ``Product`` list.
+
+``load_all_products()`` returns a flat list of every CSV / observed /
+operator-approved / community row (tens of thousands of objects once the
+catalog passes 2,300 master CIDs across 50+ retailers). The hot endpoints
+(/compare, /api/price-history, /cigars/{brand}/{line} and the consumer
+popup's per-CID comparison) only ever need one small slice of it, but
+used to find that slice with a linear scan that lowercased brand/line on
+every row for every request.
+
+``ProductIndex`` is built once per product-cache refresh (see
+``app.main.get_product_index``) and answers those lookups with dict gets.
+Every bucket preserves the original list order, so callers that relied on
+"first matching product wins" semantics behave exactly as before.
+
+This module deliberately has zero non-stdlib dependencies so it stays
+importable from the FastAPI app, the extension routers and offline tools.
+
+Public surface (every lookup returns a read-only Sequence[Product]):
+    ProductIndex(products, brand_slug=..., line_slug=..., canonical_cid=...)
+      .by_brand_line(brand, line)
+      .by_variation(brand, line, wrapper, vitola, box_qty)
+      .by_cigar_id(cid)
+      .by_landing_slug(brand_slug, line_slug)
+      .by_brand(brand)
+      .by_retailer(retailer_key)
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from app.main import Product
+
+# Returned for misses; a tuple, so an accidental append can't leak between keys.
+_EMPTY: tuple = ()
+
+
+def _norm(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+def _default_brand_slug(brand: str) -> str:
+    return brand.lower().replace(" ", "-").replace("&", "and")
+
+
+def _default_line_slug(line: str) -> str:
+    return line.lower().strip().replace(" ", "-").replace("&", "and").replace("/", "-")
+
+
+class ProductIndex:
+    """Dict-of-lists views over one immutable product snapshot.
+
+    Lookups return the shared bucket list — callers must treat it as
+    read-only (copy before sorting / filtering in place).
+    """
+
+    def __init__(
+        self,
+        products: Iterable,
+        *,
+        brand_slug: Callable[[str], str] = _default_brand_slug,
+        line_slug: Callable[[str], str] = _default_line_slug,
+        canonical_cid: Optional[Callable[[str], str]] = None,
+    ):
+        self.products = products
+        if canonical_cid is None:
+            canonical_cid = lambda cid: (cid or "").strip()  # noqa: E731
+        self._canonical_cid = canonical_cid
+
+        self._brand_line: Dict[Tuple[str, str], List] = {}
+        self._variation: Dict[Tuple[str, str, str, str, int], List] = {}
+        self._cid: Dict[str, List] = {}
+        self._landing: Dict[Tuple[str, str], List] = {}
+        self._brand: Dict[str, List] = {}
+        self._retailer: Dict[str, List] = {}
+
+        # Slugging is the most expensive per-row step; brand/line strings
+        # repeat heavily across retailers so memoize per distinct value.
+        brand_slugs: Dict[str, str] = {}
+        line_slugs: Dict[str, str] = {}
+        canon_cids: Dict[str, str] = {}
+
+        for p in products:
+            brand = p.brand or ""
+            line = p.line or ""
+            b = brand.lower()
+            l = line.lower()
+
+            self._brand_line.setdefault((b, l), []).append(p)
+            self._brand.setdefault(b, []).append(p)
+            vkey = (b, l, _norm(p.wrapper), _norm(p.vitola), p.box_qty)
+            self._variation.setdefault(vkey, []).append(p)
+            self._retailer.setdefault(p.retailer_key or "", []).append(p)
+
+            raw_cid = p.cigar_id or ""
+            if raw_cid:
+                canon = canon_cids.get(raw_cid)
+                if canon is None:
+                    canon = canon_cids[raw_cid] = canonical_cid(raw_cid)
+                if canon:
+                    self._cid.setdefault(canon, []).append(p)
+
+            if brand and line:
+                bs = brand_slugs.get(brand)
+                if bs is None:
+                    bs = brand_slugs[brand] = brand_slug(brand)
+                ls = line_slugs.get(line)
+                if ls is None:
+                    ls = line_slugs[line] = line_slug(line)
+                self._landing.setdefault((bs, ls), []).append(p)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def by_brand_line(self, brand: str, line: str) -> Sequence[Product]:
+        """Rows whose brand and line match case-insensitively."""
+        return self._brand_line.get(((brand or "").lower(), (line or "").lower()), _EMPTY)
+
+    def by_variation(
+        self, brand: str, line: str, wrapper: str, vitola: str, box_qty: int,
+    ) -> Sequence[Product]:
+        """Rows for one exact (brand, line, wrapper, vitola, box_qty) variation."""
+        key = ((brand or "").lower(), (line or "").lower(), _norm(wrapper), _norm(vitola), box_qty)
+        return self._variation.get(key, _EMPTY)
+
+    def by_cigar_id(self, cid: str) -> Sequence[Product]:
+        """Rows whose canonical CID equals the canonical form of ``cid``."""
+        canon = self._canonical_cid(cid or "")
+        if not canon:
+            return _EMPTY
+        return self._cid.get(canon, _EMPTY)
+
+    def by_landing_slug(self, brand_slug: str, line_slug: str) -> Sequence[Product]:
+        """Rows that render on ``/cigars/{brand_slug}/{line_slug}``."""
+        return self._landing.get(((brand_slug or "").lower(), (line_slug or "").lower()), _EMPTY)
+
+    def by_brand(self, brand: str) -> Sequence[Product]:
+        """Every row for one brand, across all lines."""
+        return self._brand.get((brand or "").lower(), _EMPTY)
+
+    def by_retailer(self, retailer_key: str) -> Sequence[Product]:
+        return self._retailer.get(retailer_key or "", _EMPTY)
+
+    def brand_lines(self) -> Dict[Tuple[str, str], List]:
+        """All ``(brand_lower, line_lower) -> rows`` buckets."""
+        return self._brand_line
@@ -0,0 +1,322 @@
+"""
+Fixed-memory rate limiting for the public community endpoints.
+
+Each ``RateLimiter`` allows ``cap`` hits per ``window_s`` per key using
+GCRA (generic cell rate algorithm). The only state per key is its
+theoretical arrival time (TAT), one float, where the old limiter kept a
+deque of up to ``cap`` timestamps (5,000 for the per-day windows). A
+fresh key may burst ``cap`` hits; after that it earns one hit every
+``window_s / cap`` seconds, so the sustained rate is the same as before.
+
+In-process state is an LRU of at most ``max_keys`` keys. A key whose TAT
+has passed is indistinguishable from a new key, so those are dropped as
+they reach the cold end, and the least recently used keys go first once
+the bound is hit.
+
+Each Uvicorn worker would otherwise enforce its own copy of the limit.
+``COMMUNITY_RATE_LIMIT_BACKEND`` selects a shared store instead:
+
+    memory           per-process (default)
+    sqlite[:PATH]    one SQLite file shared by the workers on this host
+                     (default data/community_rate_limits.db)
+    postgres         table community_rate_limits in the analytics DB
+
+A hit against a shared store is one atomic upsert. If the store errors,
+the limiter falls back to its in-process state, so a database hiccup
+neither rejects every request nor lifts the limit.
+
+    _obs_minute = RateLimiter("observe_minute", 60, 60)
+    if not await _obs_minute.allow_async(observer_id):
+        return JSONResponse({"error": "rate_limited"}, status_code=429)
+
+``allow()`` blocks on the shared store's I/O; ``async def`` routes call
+``allow_async()``, which runs the store hit in a worker thread.
+``allow_n()`` / ``allow_n_async()`` charge a batch of hits in one store
+round trip and report how many fit.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SQLITE_PATH = PROJECT_ROOT / "data" / "community_rate_limits.db"
+
+DEFAULT_MAX_KEYS = 50_000
+# Expired rows are deleted from a shared store every this many hits.
+_PRUNE_EVERY = 1_000
+# Float slack so exactly ``cap`` burst hits always fit in the window.
+_EPSILON = 1e-6
+
+
+def _grantable(tat: Optional[float], now: float, interval: float, limit: float, n: int) -> int:
+    """How many of ``n`` hits fit before GCRA state ``tat`` exceeds ``limit``."""
+    base = max(tat if tat is not None else now, now)
+    room = int((limit - (base - now)) // interval) if interval > 0 else n
+    return max(0, min(n, room))
+
+
+class _SQLiteStore:
+    """GCRA state in a SQLite file; safe across processes on one host."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS community_rate_limits (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    tat REAL NOT NULL,
+                    PRIMARY KEY (scope, key)
+                ) WITHOUT ROWID
+            """)
+            self._local.conn = conn
+        return conn
+
+    def hit(self, scope: str, key: str, now: float, interval: float, limit: float) -> bool:
+        row = self._conn().execute("""
+            INSERT INTO community_rate_limits (scope, key, tat) VALUES (?, ?, ?)
+            ON CONFLICT (scope, key) DO UPDATE SET tat = MAX(tat, ?) + ?
+                WHERE MAX(tat, ?) + ? - ? <= ?
+            RETURNING tat
+        """, (scope, key, now + interval, now, interval, now, interval, now, limit)).fetchone()
+        return row is not None
+
+    def hit_n(self, scope: str, key: str, now: float, interval: float, limit: float, n: int) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tat FROM community_rate_limits WHERE scope = ? AND key = ?", (scope, key)
+            ).fetchone()
+            tat = row[0] if row else None
+            granted = _grantable(tat, now, interval, limit, n)
+            if granted:
+                conn.execute("""
+                    INSERT INTO community_rate_limits (scope, key, tat) VALUES (?, ?, ?)
+                    ON CONFLICT (scope, key) DO UPDATE SET tat = excluded.tat
+                """, (scope, key, max(tat if tat is not None else now, now) + granted * interval))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return granted
+
+    def prune(self, now: float) -> None:
+        self._conn().execute("DELETE FROM community_rate_limits WHERE tat < ?", (now,))
+
+
+class _PostgresStore:
+    """GCRA state in the analytics DB; shared by every worker and host."""
+
+    def __init__(self):
+        self._ready = False
+
+    def _conn(self):
+        # Imported here to avoid a circular import with app.main.
+        from app.main import get_analytics_conn  # type: ignore
+
+        conn = get_analytics_conn()
+        if not self._ready:
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS community_rate_limits (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    tat DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (scope, key)
+                )
+            """)
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def hit(self, scope: str, key: str, now: float, interval: float, limit: float) -> bool:
+        conn = self._conn()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO community_rate_limits (scope, key, tat) VALUES (%s, %s, %s)
+                ON CONFLICT (scope, key) DO UPDATE
+                    SET tat = GREATEST(community_rate_limits.tat, %s) + %s
+                    WHERE GREATEST(community_rate_limits.tat, %s) + %s - %s <= %s
+                RETURNING tat
+            """, (scope, key, now + interval, now, interval, now, interval, now, limit))
+            allowed = cur.fetchone() is not None
+            conn.commit()
+            return allowed
+        finally:
+            conn.close()
+
+    def hit_n(self, scope: str, key: str, now: float, interval: float, limit: float, n: int) -> int:
+        conn = self._conn()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT tat FROM community_rate_limits WHERE scope = %s AND key = %s FOR UPDATE",
+                (scope, key),
+            )
+            row = cur.fetchone()
+            tat = row[0] if row else None
+            granted = _grantable(tat, now, interval, limit, n)
+            if granted:
+                new_tat = max(tat if tat is not None else now, now) + granted * interval
+                # A first hit racing in between the SELECT and this upsert
+                # simply moves the TAT forward by the granted hits.
+                cur.execute("""
+                    INSERT INTO community_rate_limits (scope, key, tat) VALUES (%s, %s, %s)
+                    ON CONFLICT (scope, key) DO UPDATE
+                        SET tat = GREATEST(community_rate_limits.tat, %s) + %s
+                """, (scope, key, new_tat, now, granted * interval))
+            conn.commit()
+            return granted
+        finally:
+            conn.close()
+
+    def prune(self, now: float) -> None:
+        conn = self._conn()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM community_rate_limits WHERE tat < %s", (now,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _shared_store():
+    """The configured shared store, or None for per-process limiting."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                spec = (os.getenv("COMMUNITY_RATE_LIMIT_BACKEND") or "memory").strip()
+                kind, _, arg = spec.partition(":")
+                kind = kind.lower()
+                if kind == "sqlite":
+                    _store = _SQLiteStore(Path(arg) if arg else DEFAULT_SQLITE_PATH)
+                elif kind in ("postgres", "postgresql"):
+                    _store = _PostgresStore()
+                else:
+                    if kind != "memory":
+                        logger.warning("Unknown COMMUNITY_RATE_LIMIT_BACKEND %r; using memory", spec)
+                    _store = False
+    return _store or None
+
+
+class RateLimiter:
+    """``cap`` hits per ``window_s`` seconds per key (GCRA)."""
+
+    def __init__(self, scope: str, window_s: float, cap: int, max_keys: int = DEFAULT_MAX_KEYS):
+        self.scope = scope
+        self.window_s = float(window_s)
+        self.cap = int(cap)
+        self.interval = self.window_s / max(1, self.cap)
+        self.max_keys = max_keys
+        self._limit = self.window_s + _EPSILON
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._store_failed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def _uses_store(self, now: float):
+        store = _shared_store()
+        # After a store error, stay in-process for a minute before retrying.
+        if store is not None and now - self._store_failed_at > 60:
+            return store
+        return None
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Record a hit for ``key``; False (and not recorded) when over the limit."""
+        now = time.time() if now is None else now
+        store = self._uses_store(now)
+        if store is not None:
+            try:
+                allowed = store.hit(self.scope, key, now, self.interval, self._limit)
+                self._hits += 1
+                if self._hits % _PRUNE_EVERY == 0:
+                    store.prune(now)
+                return allowed
+            except Exception as e:
+                self._store_failed_at = now
+                logger.warning("rate limit store failed (%s); limiting in-process", e)
+        return self._allow_local(key, now)
+
+    async def allow_async(self, key: str, now: Optional[float] = None) -> bool:
+        """``allow()`` for ``async def`` routes: the shared-store round trip
+        runs in a worker thread; the in-process check stays inline."""
+        now = time.time() if now is None else now
+        if self._uses_store(now) is None:
+            return self._allow_local(key, now)
+        return await asyncio.to_thread(self.allow, key, now)
+
+    def allow_n(self, key: str, n: int, now: Optional[float] = None) -> int:
+        """Record up to ``n`` hits for ``key`` at once; returns how many fit.
+
+        Hits past the limit are not recorded, so a batch of ``n`` items
+        keeps its first ``allow_n(...)`` items and rejects the rest.
+        """
+        now = time.time() if now is None else now
+        if n <= 0:
+            return 0
+        store = self._uses_store(now)
+        if store is not None:
+            try:
+                granted = store.hit_n(self.scope, key, now, self.interval, self._limit, n)
+                self._hits += 1
+                if self._hits % _PRUNE_EVERY == 0:
+                    store.prune(now)
+                return granted
+            except Exception as e:
+                self._store_failed_at = now
+                logger.warning("rate limit store failed (%s); limiting in-process", e)
+        return self._allow_local_n(key, now, n)
+
+    async def allow_n_async(self, key: str, n: int, now: Optional[float] = None) -> int:
+        """``allow_n()`` with the shared-store round trip in a worker thread."""
+        now = time.time() if now is None else now
+        if self._uses_store(now) is None:
+            return self._allow_local_n(key, now, n)
+        return await asyncio.to_thread(self.allow_n, key, n, now)
+
+    def _allow_local(self, key: str, now: float) -> bool:
+        return self._allow_local_n(key, now, 1) == 1
+
+    def _allow_local_n(self, key: str, now: float, n: int) -> int:
+        if n <= 0:
+            return 0
+        with self._lock:
+            tats = self._tats
+            tat = tats.get(key)
+            granted = _grantable(tat, now, self.interval, self._limit, n)
+            if granted:
+                tats[key] = max(tat if tat is not None else now, now) + granted * self.interval
+            if key in tats:
+                tats.move_to_end(key)
+            while tats:
+                cold_key, cold_tat = next(iter(tats.items()))
+                if cold_tat > now and len(tats) <= self.max_keys:
+                    break
+                del tats[cold_key]
+            return granted
@@ -3,6 +3,18 @@ Shared daily CSV price updater for Shopify-backed retailers.
 
 Reads static/data/<retailer_key>.csv, syncs metadata from data/master_cigars.csv,
 fetches price/stock via the retailer extractor (Shopify JSON path), writes CSV back.
+
+Bulk mode (default): the store's whole /products.json catalog is paged once up
+front (250 products per request) and the extractors resolve every CSV row from
+that snapshot. Only handles missing from the catalog listing cost a
+per-product request.
+
+An extractor that can only ever reach the network through
+``fetch_shopify_product`` (which answers snapshot handles from memory) marks
+itself with ``snapshot_aware = True``; rows it resolves from the catalog skip
+the ``delay_s`` pause. Any other extractor may still make its own request
+(e.g. an HTML fallback when no box variant matches), so every row stays
+paced for it.
 """
 
 from __future__ import annotations
@@ -14,9 +26,15 @@ import time
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
 
 import pandas as pd
 
+try:
+    from rate_limiter import DailyCapExceeded
+except ImportError:
+    from tools.price_monitoring.retailers.rate_limiter import DailyCapExceeded
+
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 STATIC_DATA = PROJECT_ROOT / "static" / "data"
 MASTER_CSV = PROJECT_ROOT / "data" / "master_cigars.csv"
@@ -83,13 +101,41 @@ def _normalize_extract(
     return price, instock, box_qty
 
 
+def _load_bulk_catalogs(urls: List[str]) -> Optional[Callable[[str], Optional[dict]]]:
+    """Page each store's catalog once; returns the snapshot lookup (or None)."""
+    try:
+        from shopify_json_extract import catalog_product, load_catalog_snapshot
+    except ImportError:
+        from tools.price_monitoring.retailers.shopify_json_extract import (
+            catalog_product,
+            load_catalog_snapshot,
+        )
+
+    stores: Dict[str, str] = {}
+    for url in urls:
+        if "/products/" in url.lower():
+            stores.setdefault(urlparse(url).netloc.lower(), url)
+    loaded = 0
+    for host, sample_url in stores.items():
+        count = load_catalog_snapshot(sample_url)
+        print(f"[INFO] Bulk catalog {host}: {count} products")
+        loaded += count
+    return catalog_product if loaded else None
+
+
 def run_shopify_retailer_update(
     retailer_key: str,
     extract_fn: Callable[[str], Dict[str, Any]],
     delay_s: float = 1.0,
+    bulk: bool = True,
 ) -> int:
     """
     Run price update for one retailer. Returns process exit code (0 = ok).
+
+    ``bulk`` resolves rows from a /products.json catalog snapshot; rows
+    whose handle isn't in it (or every row, if the catalog endpoint is
+    closed) fall back to per-URL extraction paced by ``delay_s``. The pause
+    is skipped for snapshot rows only when ``extract_fn.snapshot_aware``.
     """
     csv_path = STATIC_DATA / f"{retailer_key}.csv"
     if not csv_path.exists():
@@ -114,14 +160,28 @@ def run_shopify_retailer_update(
 
     ok = 0
     fail = 0
+    from_catalog = 0
 
     print("=" * 70)
     print(f"{retailer_key.upper()} PRICE UPDATE — {datetime.now():%Y-%m-%d %H:%M:%S}")
     print("=" * 70)
 
+    snapshot_aware = bool(getattr(extract_fn, "snapshot_aware", False))
+    catalog_lookup = None
+    capped = None
+    if bulk:
+        try:
+            catalog_lookup = _load_bulk_catalogs([(r.get("url") or "").strip() for r in rows])
+        except DailyCapExceeded as e:
+            capped = e
+
     updated: List[Dict[str, Any]] = []
     for i, row in enumerate(rows):
         row = dict(row)
+        if capped is not None:
+            # Daily request budget spent: keep the remaining rows as they are.
+            updated.append(row)
+            continue
         url = (row.get("url") or "").strip()
         cid = (row.get("cigar_id") or "").strip()
         label = (cid[:48] + "...") if len(cid) > 48 else (cid or "(no cid)")
@@ -136,7 +196,12 @@ def run_shopify_retailer_update(
             continue
 
         try:
-            time.sleep(delay_s)
+            in_catalog = catalog_lookup is not None and catalog_lookup(url) is not None
+            if in_catalog:
+                from_catalog += 1
+            if not (in_catalog and snapshot_aware):
+                # The extractor may still hit the network for this row.
+                time.sleep(delay_s)
             raw = extract_fn(url)
             price, instock, box_from_ex = _normalize_extract(raw)
             if price is not None:
@@ -150,6 +215,8 @@ def run_shopify_retailer_update(
                 fail += 1
                 err = (raw or {}).get("error", "no price")
                 print(f"  [FAIL] {err}")
+        except DailyCapExceeded as e:
+            capped = e
         except Exception as e:
             fail += 1
             print(f"  [FAIL] {e}")
@@ -163,8 +230,12 @@ def run_shopify_retailer_update(
             w.writerow(row)
 
     print("\n" + "=" * 70)
+    if capped is not None:
+        print(f"[STOPPED] {capped}; {len(rows) - ok - fail} rows left unchanged")
     print(f"Successful updates: {ok}")
     print(f"Failed updates: {fail}")
+    if bulk:
+        print(f"Resolved from catalog: {from_catalog} / per-URL fallback: {len(rows) - from_catalog}")
     print("=" * 70)
     return 0 if ok > 0 or fail == 0 else 0
 
@@ -0,0 +1,77 @@
+"""
+Aho-Corasick automaton over whole tokens.
+
+Patterns and text are sequences of space-separated tokens (already
+normalized by the caller). ``matches()`` walks the text once and returns
+every pattern that occurs as a contiguous run of whole tokens, so the
+cost depends on the text and the number of hits, not on how many
+patterns were compiled in.
+
+    ac = TokenAutomaton(["arturo fuente", "fuente", "hemingway"])
+    ac.matches("arturo fuente hemingway short story".split())
+    # {"arturo fuente", "fuente", "hemingway"}
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+
+class TokenAutomaton:
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[str, ...]] = [()]
+        for pattern in patterns:
+            tokens = pattern.split()
+            if not tokens:
+                continue
+            state = 0
+            for tok in tokens:
+                nxt = goto[state].get(tok)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][tok] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            key = " ".join(tokens)
+            if key not in out[state]:
+                out[state] += (key,)
+
+        # Breadth-first failure links; each state's output also carries
+        # the patterns that end at its failure state (proper suffixes).
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for tok, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and tok not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(tok, 0) if state else 0
+                fail[nxt] = target
+                if out[target]:
+                    out[nxt] += out[target]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def matches(self, tokens: Sequence[str]) -> Set[str]:
+        """Every compiled pattern occurring in ``tokens`` as whole tokens."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[str] = set()
+        state = 0
+        for tok in tokens:
+            while state and tok not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(tok, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
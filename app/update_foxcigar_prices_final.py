@@ -21,7 +21,8 @@ tools_path = os.path.join(project_root, 'tools', 'price_monitoring')
 sys.path.append(tools_path)
 
 try:
-    from retailers.fox_cigar import extract_fox_cigar_data
+    from retailers.fetch_engine import adapt_extract_function
+    from retailers.fox_cigar import extract_fox_cigar_data, fetch_fox_cigar_page, parse_fox_cigar_page
 except ImportError:
     print("[ERROR] Could not import extract_fox_cigar_data. Make sure the extractor is in tools/price_monitoring/retailers/fox_cigar.py")
     sys.exit(1)
@@ -42,6 +43,7 @@ class FoxCigarCSVUpdater:
         self.backup_path = None
         self.master_df = None
         self.dry_run = dry_run
+        self.prefetched: Dict[str, Dict] = {}
         
     def load_master_file(self) -> bool:
         """Load the master cigars file"""
@@ -189,7 +191,7 @@ class FoxCigarCSVUpdater:
     def update_pricing_data(self, url: str) -> Dict:
         """Extract live pricing data from Fox Cigar"""
         try:
-            result = extract_fox_cigar_data(url)
+            result = self.prefetched.pop(url, None) or extract_fox_cigar_data(url)
             
             if result['success']:
                 return {
@@ -225,6 +227,14 @@ class FoxCigarCSVUpdater:
         
         # Backup disabled - historical prices tracked in historical_prices.db
         
+        # Download every page up front: only the HTTP call holds the per-host
+        # slot, so the next page is downloading while this one is parsed.
+        if not self.dry_run:
+            urls = [row.get('url', '') for row in data]
+            print(f"Fetching {len([u for u in urls if u])} product pages...")
+            extractor = adapt_extract_function(fetch=fetch_fox_cigar_page, parse=parse_fox_cigar_page)
+            self.prefetched = extractor.extract_many(urls)
+        
         # Update each product
         successful_updates = 0
         failed_updates = 0
@@ -25,9 +25,12 @@ import subprocess
 import time
 import glob
 import smtplib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 import logging
 
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -42,6 +45,11 @@ from email.mime.multipart import MIMEMultipart
 
 from email_env import apply_email_env_overrides
 
+try:
+    import psutil  # optional: enables the CPU/memory caps on Windows too
+except ImportError:
+    psutil = None
+
 
 class AutomatedCigarPriceSystem:
     def __init__(self, project_root: Optional[str] = None):
@@ -66,6 +74,7 @@ class AutomatedCigarPriceSystem:
         self.historical_db_path = self.data_dir / 'historical_prices.db'
         self.log_dir = self.automation_dir / 'logs'  # Logs in automation folder
         self.config_file = self.automation_dir / 'automation_config.json'  # Config in automation folder
+        self.scraper_runtime_config_file = self.data_dir / 'scraper_runtime_config.json'
         
         # Ensure directories exist
         self.log_dir.mkdir(exist_ok=True)
@@ -131,7 +140,10 @@ class AutomatedCigarPriceSystem:
             "price_update_settings": {
                 "timeout_minutes": 30,
                 "retry_failed_retailers": True,
-                "delay_between_retailers": 2
+                "delay_between_retailers": 2,
+                "max_parallel_retailers": 4,
+                "max_cpu_percent": 85,
+                "min_free_memory_mb": 512
             },
             "historical_tracking": {
                 "enabled": True,
@@ -377,21 +389,28 @@ class AutomatedCigarPriceSystem:
         return retailers
 
     def capture_pre_update_state(self, retailers: Dict) -> Dict:
-        """Capture current state before updates for comparison"""
+        """Capture current state before updates for comparison
+
+        Only each row's raw price / in_stock text is kept (see
+        price_history_db.price_fingerprint); the diff itself happens per
+        retailer as its updater finishes.
+        """
         self.logger.info("Capturing pre-update state for historical tracking...")
-        
+
         pre_state = {}
-        
+        if not self.config['historical_tracking']['enabled']:
+            return pre_state
+        from tools.historical.price_history_db import price_fingerprint
+
         for retailer_name, config in retailers.items():
             try:
                 csv_path = config['csv_path']
                 if csv_path.exists():
-                    df = pd.read_csv(csv_path)
-                    pre_state[retailer_name] = df.to_dict('records')
+                    pre_state[retailer_name] = price_fingerprint(csv_path)
             except Exception as e:
                 self.logger.warning(f"Failed to capture pre-state for {retailer_name}: {e}")
-                pre_state[retailer_name] = []
-        
+                pre_state[retailer_name] = {}
+
         return pre_state
 
     def run_retailer_update(self, retailer_name: str, config: Dict) -> Dict:
@@ -466,56 +485,200 @@ class AutomatedCigarPriceSystem:
                 'error': str(e)
             }
 
-    def track_changes(self, retailer_name: str, pre_state: List, post_state: List):
-        """Track price and stock changes to historical database"""
-        if not self.config['historical_tracking']['enabled']:
-            return
+    def load_scraper_runtime_config(self) -> Dict:
+        """Load data/scraper_runtime_config.json (politeness limits shared with the extractors)"""
+        try:
+            with open(self.scraper_runtime_config_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Could not read {self.scraper_runtime_config_file.name}: {e}")
+            return {}
 
+    def _retailer_host(self, retailer_name: str, config: Dict) -> str:
+        """Host a retailer's updater talks to, from the first URL in its CSV.
+
+        Falls back to the retailer key, which is one host per retailer for
+        every updater we ship today.
+        """
         try:
-            from tools.historical.price_history_db import record_daily_price_history
+            with open(config['csv_path'], 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    host = urlparse((row.get('url') or '').strip()).netloc.lower()
+                    if host:
+                        return host[4:] if host.startswith('www.') else host
+        except Exception:
+            pass
+        return retailer_name
+
+    def _resources_available(self) -> bool:
+        """True when CPU and free memory are inside the configured caps"""
+        settings = self.config['price_update_settings']
+        max_cpu = settings.get('max_cpu_percent', 85)
+        min_free_mb = settings.get('min_free_memory_mb', 512)
+
+        if psutil is not None:
+            cpu = psutil.cpu_percent(interval=None)
+            free_mb = psutil.virtual_memory().available / (1024 * 1024)
+        else:
+            try:
+                cpu = os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+            except (AttributeError, OSError):
+                return True  # no load average (Windows without psutil): no cap
+            free_mb = None
+            try:
+                with open('/proc/meminfo', 'r') as f:
+                    for line in f:
+                        if line.startswith('MemAvailable:'):
+                            free_mb = int(line.split()[1]) / 1024
+                            break
+            except OSError:
+                pass
+
+        if max_cpu and cpu > max_cpu:
+            return False
+        if min_free_mb and free_mb is not None and free_mb < min_free_mb:
+            return False
+        return True
 
-            now_iso = datetime.now().isoformat(timespec="seconds")
-            enriched_post = []
-            for row in post_state:
-                enriched = dict(row)
-                enriched.setdefault("source", "csv")
-                enriched.setdefault("source_updated_at", now_iso)
-                enriched_post.append(enriched)
+    def run_retailer_updates(self, retailers: Dict, on_done=None) -> Dict:
+        """Run every retailer updater, several at a time.
 
-            conn = sqlite3.connect(self.historical_db_path, detect_types=0)
-            record_daily_price_history(
+        Up to ``max_parallel_retailers`` updaters run concurrently, but never
+        more than ``concurrency_per_host`` (scraper_runtime_config.json) against
+        the same host. New updaters are only launched while CPU and free
+        memory are within ``max_cpu_percent`` / ``min_free_memory_mb``; one is
+        always allowed to run so the cycle can't stall. ``delay_between_retailers``
+        now staggers launches instead of padding a serial loop.
+
+        ``on_done(name, config)`` runs on this thread as each updater
+        finishes (see history_recorder).
+
+        Returns results keyed by retailer in discovery order, so run_results
+        and retailer_runs rows come out exactly as the serial loop produced.
+        """
+        settings = self.config['price_update_settings']
+        max_parallel = max(1, int(settings.get('max_parallel_retailers', 4)))
+        delay = settings.get('delay_between_retailers', 0)
+        per_host = max(1, int(self.load_scraper_runtime_config().get('concurrency_per_host', 1)))
+
+        pending = [
+            (name, config, self._retailer_host(name, config))
+            for name, config in retailers.items()
+        ]
+        results: Dict[str, Dict] = {}
+        host_active: Dict[str, int] = {}
+        running = {}
+        last_launch = 0.0
+
+        self.logger.info(
+            f"Scheduling {len(pending)} retailers: up to {max_parallel} at a time, "
+            f"{per_host} per host"
+        )
+
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='retailer') as pool:
+            while pending or running:
+                timeout = 1.0
+                if len(running) < max_parallel and (not running or self._resources_available()):
+                    for i, (name, config, host) in enumerate(pending):
+                        if host_active.get(host, 0) >= per_host:
+                            continue
+                        wait_s = delay - (time.monotonic() - last_launch)
+                        if running and wait_s > 0:
+                            timeout = wait_s
+                            break
+                        del pending[i]
+                        host_active[host] = host_active.get(host, 0) + 1
+                        running[pool.submit(self.run_retailer_update, name, config)] = (name, host)
+                        last_launch = time.monotonic()
+                        timeout = 0
+                        break
+
+                if not running:
+                    continue
+                # Wake on the first finished updater, or re-check caps/stagger.
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, host = running.pop(future)
+                    host_active[host] -= 1
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:  # run_retailer_update already catches; belt and braces
+                        results[name] = {
+                            'success': False, 'duration': 0, 'products_updated': 0,
+                            'products_failed': 0, 'error': str(e),
+                        }
+                    if on_done is not None:
+                        on_done(name, retailers[name])
+
+        return {name: results[name] for name in retailers if name in results}
+
+    def track_changes(self, retailer_name: str, config: Dict, pre_fingerprint: Dict,
+                      conn, series_groups: set):
+        """Track price and stock changes to historical database
+
+        Streams the retailer's CSV against its pre-update fingerprint on
+        the shared history connection; the price_daily / rollup refresh
+        for the groups it writes is left to history_recorder.
+        """
+        try:
+            from tools.historical.price_history_db import record_csv_price_history
+
+            csv_path = config['csv_path']
+            if not csv_path.exists():
+                return
+            groups = record_csv_price_history(
                 conn,
                 retailer_name,
-                pre_state,
-                enriched_post,
+                csv_path,
+                pre_fingerprint,
                 track_price_changes=self.config["historical_tracking"]["track_price_changes"],
                 track_stock_changes=self.config["historical_tracking"]["track_stock_changes"],
+                refresh_series=False,
             )
-            conn.close()
+            series_groups.update(groups)
 
         except Exception as e:
             self.logger.error(f"Failed to track changes for {retailer_name}: {e}")
 
-    def capture_post_update_state(self, retailers: Dict, pre_state: Dict):
-        """Capture post-update state and track changes"""
-        self.logger.info("Capturing post-update state and tracking changes...")
-        
-        for retailer_name, config in retailers.items():
+    @contextmanager
+    def history_recorder(self, pre_state: Dict):
+        """Yield an ``on_done(name, config)`` hook for run_retailer_updates.
+
+        Each retailer's changes are captured as soon as its updater
+        finishes and its fingerprint is dropped right after, so only one
+        retailer's rows are in memory at a time. Everything goes through
+        one WAL connection, and price_daily / price_rollup are refreshed
+        once at the end: a CID carried by many retailers is recomputed
+        once instead of once per retailer. Yields None when historical
+        tracking is disabled.
+        """
+        if not self.config['historical_tracking']['enabled']:
+            yield None
+            return
+        from tools.historical.price_history_db import history_writer, refresh_price_series
+
+        series_groups: set = set()
+        busy = [0.0]
+
+        def on_done(retailer_name: str, config: Dict):
+            started = time.time()
+            self.track_changes(
+                retailer_name, config, pre_state.pop(retailer_name, {}), conn, series_groups,
+            )
+            busy[0] += time.time() - started
+
+        with history_writer(self.historical_db_path) as conn:
+            yield on_done
+            started = time.time()
             try:
-                csv_path = config['csv_path']
-                if csv_path.exists():
-                    df = pd.read_csv(csv_path)
-                    post_state = df.to_dict('records')
-                    
-                    # Track changes
-                    self.track_changes(
-                        retailer_name, 
-                        pre_state.get(retailer_name, []), 
-                        post_state
-                    )
-                    
+                refreshed = refresh_price_series(conn, series_groups)
+                self.logger.info(
+                    "Price history recorded: %d (cigar_id, day) series refreshed in %.1fs "
+                    "(+%.1fs capturing changes)",
+                    refreshed, time.time() - started, busy[0],
+                )
             except Exception as e:
-                self.logger.warning(f"Failed to capture post-state for {retailer_name}: {e}")
+                self.logger.error(f"Failed to refresh price series: {e}")
 
     def process_extension_approvals(self) -> int:
         """Drain extension_staged_approvals (Chrome extension) into local CSVs.
@@ -958,6 +1121,27 @@ class AutomatedCigarPriceSystem:
             self.logger.error(f"Error applying promotions: {e}")
             return False
 
+    def build_catalog_snapshot(self) -> bool:
+        """Compile data/catalog_snapshot.bin so web workers start without parsing CSVs"""
+        try:
+            self.logger.info("Compiling catalog snapshot...")
+            result = subprocess.run(
+                [sys.executable, "-m", "app.catalog_snapshot"],
+                capture_output=True,
+                text=True,
+                timeout=300,
+                cwd=self.project_root
+            )
+            if result.returncode == 0:
+                if result.stdout:
+                    self.logger.info(result.stdout.strip().splitlines()[-1])
+                return True
+            self.logger.error(f"Catalog snapshot failed: {result.stderr}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error compiling catalog snapshot: {e}")
+            return False
+
     def run_full_automation(self) -> bool:
         """Run the complete automation cycle"""
         start_time = datetime.now()
@@ -1016,26 +1200,27 @@ class AutomatedCigarPriceSystem:
             # 3. Run all retailer updates
             self.logger.info(f"Running updates for {len(retailers)} retailers...")
             
-            for retailer_name, config in retailers.items():
-                result = self.run_retailer_update(retailer_name, config)
+            # 4. Price / stock changes are captured per retailer as soon as
+            # its updater finishes (history_recorder).
+            with self.history_recorder(pre_state) as on_done:
+                results = self.run_retailer_updates(retailers, on_done=on_done)
+            for retailer_name, result in results.items():
                 self.run_results[retailer_name] = result
                 
                 if not result['success']:
                     errors.append(f"{retailer_name}: {result['error']}")
-                
-                # Delay between retailers
-                delay = self.config['price_update_settings']['delay_between_retailers']
-                if delay > 0 and len(retailers) > 1:
-                    time.sleep(delay)
-            
-            # 4. Capture post-update state and track changes
-            self.capture_post_update_state(retailers, pre_state)
 
             # 4.5. Apply promotional discounts  ← ADD THIS
             promo_success = self.apply_promotions()
             if not promo_success:
                 errors.append("Promotional processing failed")
 
+            # 4.6. Compile the catalog snapshot from the final CSVs. Not
+            # critical: the web app parses CSVs whenever the snapshot is
+            # missing or older than them.
+            if not self.build_catalog_snapshot():
+                self.logger.warning("Catalog snapshot not updated (non-critical)")
+
             # 5. Git commit and push
             git_success = self.git_commit_and_push()
             if not git_success:
@@ -45,7 +45,10 @@ def setup_configuration():
             "price_update_settings": {
                 "timeout_minutes": 30,
                 "retry_failed_retailers": True,
-                "delay_between_retailers": 2
+                "delay_between_retailers": 2,
+                "max_parallel_retailers": 4,
+                "max_cpu_percent": 85,
+                "min_free_memory_mb": 512
             },
             "historical_tracking": {
                 "enabled": True,
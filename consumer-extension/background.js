@@ -4,7 +4,8 @@
 //   1. On install, open consent.html (one-time).
 //   2. On any tab activate/update, scrape the page and (if the user has
 //      opted in and the URL passes all gates) post an anonymous price
-//      observation to /api/community/observe.
+//      observation (queued and sent in batches to
+//      /api/community/observe-batch).
 //   3. Maintain a short-lived per-tab cache of the public url-status
 //      response so the popup opens instantly with the right state.
 //
@@ -339,20 +339,46 @@ export async function scrapeActiveTab(tabId) {
 // ── Fire-and-forget observation post ──────────────────────────────────
 // Gated by hasConsented() at every call site. Failures swallowed because
 // passive observation must never break a user's browsing.
+//
+// Observations are queued and sent to /api/community/observe-batch, so
+// a burst of tabs (category page opened into many product tabs) costs
+// one request instead of one per page. The queue flushes after a short
+// quiet period or as soon as it holds a full batch; both are well inside
+// the service worker's ~30s idle eviction.
+
+const OBSERVE_BATCH_MAX = 50;          // server-side _OBSERVE_BATCH_MAX
+const OBSERVE_FLUSH_MS = 2000;
+let observeQueue = [];
+let observeFlushTimer = null;
+
+async function flushObservations() {
+  if (observeFlushTimer) {
+    clearTimeout(observeFlushTimer);
+    observeFlushTimer = null;
+  }
+  while (observeQueue.length) {
+    const batch = observeQueue.splice(0, OBSERVE_BATCH_MAX);
+    try {
+      const observerId = await getObserverId();
+      await fetch(API_BASE + "/api/community/observe-batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ observer_id: observerId, observations: batch }),
+        keepalive: true,
+      });
+    } catch (_) {
+      /* swallow */
+    }
+  }
+}
 
 export async function postObservation(payload) {
   if (!(await hasConsented())) return;
-  try {
-    const observerId = await getObserverId();
-    const body = { observer_id: observerId, observer_source: "consumer", ...payload };
-    await fetch(API_BASE + "/api/community/observe", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(body),
-      keepalive: true,
-    });
-  } catch (_) {
-    /* swallow */
+  observeQueue.push({ observer_source: "consumer", ...payload });
+  if (observeQueue.length >= OBSERVE_BATCH_MAX) {
+    await flushObservations();
+  } else if (!observeFlushTimer) {
+    observeFlushTimer = setTimeout(() => { flushObservations(); }, OBSERVE_FLUSH_MS);
   }
 }
 
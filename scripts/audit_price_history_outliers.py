@@ -1,7 +1,9 @@
 """Find and remove price_history rows that are extreme outliers vs peers.
 
 Targets bogus homepage scrapes ($59–$70 on $300+ boxes) and obvious typos
-($8499, $1300 on $110 boxes), not legitimate premium retailers.
+($8499, $1300 on $110 boxes), not legitimate premium retailers. Rows the
+prune script moved to data/price_archive/ are audited too; --apply drops
+flagged archived rows from their month file.
 
 Usage:
   python scripts/audit_price_history_outliers.py              # dry-run summary
@@ -12,10 +14,15 @@ from __future__ import annotations
 
 import argparse
 import sqlite3
+import sys
 from collections import defaultdict
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tools.historical.price_archive import ARCHIVE_DIR, query_price_history, remove_archived_rows  # noqa: E402
+
 DB = ROOT / "data" / "historical_prices.db"
 
 MIN_PEER_COUNT = 2
@@ -53,20 +60,15 @@ def main() -> int:
     ap.add_argument("--apply", action="store_true", help="Delete flagged rows")
     ap.add_argument("--verbose", action="store_true", help="Print every flagged row")
     ap.add_argument("--db", default=str(DB))
+    ap.add_argument("--archive-dir", default=str(ARCHIVE_DIR))
     args = ap.parse_args()
 
     conn = sqlite3.connect(args.db)
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT rowid, retailer, cigar_id, date, price
-        FROM price_history
-        WHERE price > 0
-        ORDER BY cigar_id, date, retailer
-        """
-    )
-    rows = cur.fetchall()
-    print(f"Scanned {len(rows)} price_history rows in {args.db}")
+    archive_dir = Path(args.archive_dir)
+    rows = [r[:5] for r in query_price_history(conn, priced_only=True, archive_dir=archive_dir)]
+    archived = sum(1 for r in rows if r[0] is None)
+    print(f"Scanned {len(rows)} price_history rows in {args.db} ({archived} from {archive_dir})")
 
     by_cigar_date: dict[tuple[str, str], list[tuple]] = defaultdict(list)
     for row in rows:
@@ -111,9 +113,11 @@ def main() -> int:
         conn.close()
         return 0
 
-    cur.executemany("DELETE FROM price_history WHERE rowid = ?", [(r[0],) for r in flagged])
+    live = [(r[0],) for r in flagged if r[0] is not None]
+    cur.executemany("DELETE FROM price_history WHERE rowid = ?", live)
     conn.commit()
-    print(f"\nDeleted {len(flagged)} outlier row(s) from price_history.")
+    dropped = remove_archived_rows([r[1:4] for r in flagged if r[0] is None], archive_dir)
+    print(f"\nDeleted {len(live)} outlier row(s) from price_history and {dropped} from the archive.")
     conn.close()
     return 0
 
@@ -0,0 +1,45 @@
+"""Export every /cigars/{brand}/{line} landing page as static HTML.
+
+Writes ``<out>/cigars/{brand}/{line}/index.html`` plus a pre-compressed
+``index.html.gz`` for each page that currently renders, using the same
+renderer and product data as the live site. Point nginx (``try_files`` +
+``gzip_static on``) or a CDN bucket at the output directory to serve the
+SEO surface without the Python app.
+
+Usage (PowerShell):
+  python scripts/export_landing_pages.py
+  python scripts/export_landing_pages.py --out build/static-site
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--out",
+        default=str(PROJECT_ROOT / "build" / "static-site"),
+        help="output directory (default: build/static-site)",
+    )
+    args = parser.parse_args()
+
+    # Rendering synchronously below; no background warm-up needed.
+    os.environ.setdefault("LANDING_PAGE_WARM", "0")
+    from app.main import export_landing_pages
+
+    started = time.time()
+    written = export_landing_pages(args.out)
+    print(f"Exported {written} landing pages to {args.out} in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,20 +5,40 @@ file exceeds 100 MB, ``git push`` is rejected (GH001) and the whole daily job
 fails — even though CSV scrapes succeeded. This script keeps a rolling window
 of price_history (and related change tables) and VACUUMs the file.
 
+Before price_history rows are deleted they are copied into the compressed
+monthly archive under data/price_archive/ (tools/historical/price_archive.py),
+so the DB stays bounded without losing long-range history; /api/price-history
+and the audit script read both tiers. With archiving the cutoff is rounded
+down to a month start, so only closed months move and each month file is
+written (and committed) once. The price_daily series table is trimmed
+with price_history; the small weekly/monthly price_rollup table is kept,
+and the cutoff is recorded so later series refreshes never recompute a
+rollup period from its partially pruned days.
+
 Usage:
   python scripts/prune_historical_prices_db.py              # dry-run stats
   python scripts/prune_historical_prices_db.py --apply      # prune + vacuum
   python scripts/prune_historical_prices_db.py --apply --keep-days 120
+  python scripts/prune_historical_prices_db.py --apply --no-archive   # delete outright
 """
 from __future__ import annotations
 
 import argparse
 import os
 import sqlite3
+import sys
 from datetime import date, timedelta
 from pathlib import Path
+from typing import Optional
 
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tools.historical.price_archive import (  # noqa: E402
+    ARCHIVE_DIR, archive_boundary, archive_price_history,
+)
+from tools.historical.price_history_db import mark_pruned_before  # noqa: E402
+
 DEFAULT_DB = ROOT / "data" / "historical_prices.db"
 # Leave headroom under GitHub's hard 100 MB limit for a few days of growth.
 TARGET_BYTES = 70 * 1024 * 1024
@@ -34,6 +54,8 @@ def _stats(conn: sqlite3.Connection) -> dict:
     out = {}
     for table in (
         "price_history",
+        "price_daily",
+        "price_rollup",
         "price_changes",
         "stock_changes",
         "automation_runs",
@@ -52,13 +74,28 @@ def _stats(conn: sqlite3.Connection) -> dict:
     return out
 
 
-def prune(db_path: Path, keep_days: int, apply: bool) -> int:
+def _cutoff(keep_days: int, archive_dir: Optional[Path]) -> str:
+    """Oldest date kept; with archiving, rounded down to a month start so
+    each archive month is written once, complete."""
+    cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+    return archive_boundary(cutoff) if archive_dir is not None else cutoff
+
+
+def _archive(conn: sqlite3.Connection, cutoff: str, archive_dir: Optional[Path]) -> None:
+    """Copy price_history rows older than ``cutoff`` into the monthly archive."""
+    if archive_dir is None:
+        return
+    copied = archive_price_history(conn, cutoff, archive_dir)
+    print(f"  archived price_history rows to {archive_dir}: {copied}")
+
+
+def prune(db_path: Path, keep_days: int, apply: bool, archive_dir: Optional[Path] = ARCHIVE_DIR) -> int:
     if not db_path.exists():
         print(f"[ERROR] missing {db_path}")
         return 2
 
     before = db_path.stat().st_size
-    cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+    cutoff = _cutoff(keep_days, archive_dir)
     print(f"DB: {db_path}")
     print(f"Size before: {_mb(before)}")
     print(f"Keep last {keep_days} days (cutoff date < {cutoff})")
@@ -72,9 +109,12 @@ def prune(db_path: Path, keep_days: int, apply: bool) -> int:
         conn.close()
         return 0
 
+    # Archive first: if it fails nothing has been deleted yet.
+    _archive(conn, cutoff, archive_dir)
     cur = conn.cursor()
     deletes = [
         ("price_history", "DELETE FROM price_history WHERE date < ?", (cutoff,)),
+        ("price_daily", "DELETE FROM price_daily WHERE day < ?", (cutoff,)),
         ("price_changes", "DELETE FROM price_changes WHERE date < ?", (cutoff,)),
         ("stock_changes", "DELETE FROM stock_changes WHERE date < ?", (cutoff,)),
         (
@@ -94,6 +134,7 @@ def prune(db_path: Path, keep_days: int, apply: bool) -> int:
             print(f"  deleted from {name}: {cur.rowcount}")
         except sqlite3.Error as e:
             print(f"  skip {name}: {e}")
+    mark_pruned_before(conn, cutoff)
     conn.commit()
 
     # Free pages on disk (this rewrites the file).
@@ -107,12 +148,13 @@ def prune(db_path: Path, keep_days: int, apply: bool) -> int:
     # If still too large, tighten the window further.
     if after > TARGET_BYTES:
         tighter = max(60, keep_days // 2)
-        tighter_cutoff = (date.today() - timedelta(days=tighter)).isoformat()
+        tighter_cutoff = _cutoff(tighter, archive_dir)
         print(
             f"Still above target {_mb(TARGET_BYTES)}; "
             f"tightening to {tighter} days (cutoff {tighter_cutoff})"
         )
         conn = sqlite3.connect(str(db_path))
+        _archive(conn, tighter_cutoff, archive_dir)
         cur = conn.cursor()
         for name, sql, _ in deletes:
             try:
@@ -120,6 +162,7 @@ def prune(db_path: Path, keep_days: int, apply: bool) -> int:
                 print(f"  deleted from {name}: {cur.rowcount}")
             except sqlite3.Error as e:
                 print(f"  skip {name}: {e}")
+        mark_pruned_before(conn, tighter_cutoff)
         conn.commit()
         print("VACUUM...")
         conn.execute("VACUUM")
@@ -143,8 +186,11 @@ def main() -> int:
     ap.add_argument("--db", default=str(DEFAULT_DB))
     ap.add_argument("--keep-days", type=int, default=DEFAULT_KEEP_DAYS)
     ap.add_argument("--apply", action="store_true")
+    ap.add_argument("--archive-dir", default=str(ARCHIVE_DIR))
+    ap.add_argument("--no-archive", action="store_true", help="Delete old rows without archiving them")
     args = ap.parse_args()
-    return prune(Path(args.db), args.keep_days, args.apply)
+    archive_dir = None if args.no_archive else Path(args.archive_dir)
+    return prune(Path(args.db), args.keep_days, args.apply, archive_dir)
 
 
 if __name__ == "__main__":
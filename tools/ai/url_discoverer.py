@@ -57,6 +57,10 @@ MASTER_CSV = PROJECT_ROOT / "data" / "master_cigars.csv"
 MASTER_DB = PROJECT_ROOT / "data" / "master_cigars.db"
 AI_DIR = Path(__file__).resolve().parent
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from app.cid_matcher import CidTokenIndex  # noqa: E402  (stdlib-only module)
+
 STAGED_FILE = AI_DIR / "staged_matches.csv"
 PENDING_FILE = AI_DIR / "pending_review.csv"
 FEEDBACK_FILE = AI_DIR / "feedback_history.json"
@@ -893,14 +897,20 @@ def run_discovery(
 
         print(f"  Found {len(product_urls)} product URLs in sitemap")
 
-        # Pass 1: Programmatic pre-filtering to find strong candidates
-        candidates_by_cid = {}
-        for c in cids_for_retailer:
-            scored = []
-            for url in product_urls:
-                score, details = programmatic_score(c, url)
+        # Pass 1: Programmatic pre-filtering to find strong candidates.
+        # Wrapper + box quantity top out at 0.2, so only CIDs with a brand,
+        # line or vitola word in the slug can reach 0.3; the token index
+        # finds those per URL instead of scoring every CID x URL pair.
+        index = CidTokenIndex(cids_for_retailer)
+        scored_by_pos = [[] for _ in cids_for_retailer]
+        for url in product_urls:
+            slug = slug_from_url(url)
+            for pos in sorted(index.anchored(slug)):
+                score, details = programmatic_score(cids_for_retailer[pos], url)
                 if score >= 0.3:
-                    scored.append((url, score, details))
+                    scored_by_pos[pos].append((url, score, details))
+        candidates_by_cid = {}
+        for c, scored in zip(cids_for_retailer, scored_by_pos):
             scored.sort(key=lambda x: x[1], reverse=True)
             candidates_by_cid[c["raw"]] = scored[:10]
 
@@ -18,7 +18,6 @@ import json
 import os
 import re
 import sys
-import time
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
@@ -233,11 +232,23 @@ def load_monitored_cids() -> dict[str, set]:
 # Shopify Detection & Catalog Harvesting
 # ---------------------------------------------------------------------------
 
+def _rate_limiter():
+    """Shared per-host limiter (same buckets and state DB as the extractors)."""
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+    from tools.price_monitoring.retailers.rate_limiter import get_rate_limiter
+
+    return get_rate_limiter()
+
+
 def detect_shopify(domain: str) -> bool:
     """Check if a domain is a Shopify store by probing /products.json."""
     url = f"https://{domain}/products.json?limit=1"
+    limiter = _rate_limiter()
     try:
+        limiter.acquire(url, fallback_interval=0.5)
         resp = requests.get(url, headers=HEADERS, timeout=10)
+        limiter.record_response(url, resp.status_code, resp.headers.get("Retry-After"))
         if resp.status_code == 200:
             data = resp.json()
             if "products" in data:
@@ -252,11 +263,14 @@ def harvest_shopify_catalog(domain: str, retailer_key: str) -> list[dict]:
     products = []
     page = 1
     base_url = f"https://{domain}/products.json?limit=250&page="
+    limiter = _rate_limiter()
 
     while True:
         url = f"{base_url}{page}"
         try:
+            limiter.acquire(url, platform="Shopify", fallback_interval=1.0)
             resp = requests.get(url, headers=HEADERS, timeout=15)
+            limiter.record_response(url, resp.status_code, resp.headers.get("Retry-After"))
             resp.raise_for_status()
             data = resp.json()
             batch = data.get("products", [])
@@ -299,7 +313,6 @@ def harvest_shopify_catalog(domain: str, retailer_key: str) -> list[dict]:
 
         print(f"    Page {page}: {len(batch)} products")
         page += 1
-        time.sleep(1.0)
 
     return products
 
@@ -996,7 +1009,6 @@ def main():
         print(f"  {key:25s} {domain:40s} {status}")
         if is_shopify:
             shopify_retailers[key] = domain
-        time.sleep(0.5)
 
     print(f"\nShopify retailers found: {len(shopify_retailers)} / {len(dict(retailers_to_check))}")
 
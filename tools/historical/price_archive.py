@@ -0,0 +1,460 @@
+"""Compressed monthly archive of price_history rows older than the live window.
+
+``scripts/prune_historical_prices_db.py`` keeps data/historical_prices.db
+small by trimming price_history to a rolling window. Before it deletes, the
+rows are folded into one file per calendar month under
+``data/price_archive/`` so long-range history survives the trim while the
+DB stays bounded. Only whole months are archived (``archive_boundary``), so
+a month file is written once, when the live window moves past that month,
+rather than rewritten by every nightly prune.
+
+Layout of ``YYYY-MM.pha``::
+
+    b"PHARCH\\0\\0" | uint32 format | uint32 header length | header JSON | blobs
+
+The header maps each cigar_id to the byte range of its blob, so a query
+for a few CIDs reads and inflates only those. A blob is a zlib-compressed
+JSON list with one entry per retailer (JSON rather than marshal so files
+stay readable across Python versions):
+
+    (retailer, days, prices, missing, in_stock, urls, sources)
+
+``days`` and ``prices`` (integer cents) are delta-encoded from the first
+value, ``missing`` lists the positions whose price was NULL, and
+``in_stock`` / ``urls`` / ``sources`` are run-length encoded as flat
+``[value, count, value, count, ...]`` lists. Prices are stored to the cent;
+``id``, ``created_at`` and ``source_updated_at`` are not archived.
+
+``query_price_history`` unions the live table with the archive, the live
+row winning when both hold the same (retailer, cigar_id, date):
+
+    rows = query_price_history(conn, ["AF-HEM-SS"], start="2024-01-01")
+    for rowid, retailer, cigar_id, day, price, in_stock in rows:
+        ...  # rowid is None for archived rows
+
+``python -m tools.historical.price_archive`` prints a per-month summary.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from tools.historical.price_history_db import _daily_rows
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+ARCHIVE_DIR = PROJECT_ROOT / "data" / "price_archive"
+
+MAGIC = b"PHARCH\0\0"
+# Bump whenever the blob layout changes.
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+SUFFIX = ".pha"
+
+# (retailer, cigar_id, date, price, in_stock, url, source)
+ArchiveRow = Tuple[str, str, str, Optional[float], Optional[bool], Optional[str], Optional[str]]
+
+
+def _month(day: str) -> str:
+    return str(day)[:7]
+
+
+def archive_boundary(cutoff: str) -> str:
+    """First day of ``cutoff``'s month: rows before it form closed months."""
+    return date.fromisoformat(str(cutoff)[:10]).replace(day=1).isoformat()
+
+
+def _partition_path(archive_dir: Path, month: str) -> Path:
+    return Path(archive_dir) / f"{month}{SUFFIX}"
+
+
+def archive_months(archive_dir: Path = ARCHIVE_DIR) -> List[str]:
+    """Archived months (``YYYY-MM``), oldest first."""
+    archive_dir = Path(archive_dir)
+    if not archive_dir.exists():
+        return []
+    return sorted(p.stem for p in archive_dir.glob(f"*{SUFFIX}"))
+
+
+# ── Encoding ───────────────────────────────────────────────────────────
+
+def _deltas(values: List[int]) -> List[int]:
+    return [v - values[i - 1] if i else v for i, v in enumerate(values)]
+
+
+def _undeltas(deltas: List[int]) -> List[int]:
+    out, acc = [], 0
+    for d in deltas:
+        acc += d
+        out.append(acc)
+    return out
+
+
+def _rle(values: Sequence[Any]) -> List[Any]:
+    out: List[Any] = []
+    for v in values:
+        if out and out[-2] == v:
+            out[-1] += 1
+        else:
+            out += [v, 1]
+    return out
+
+
+def _unrle(runs: List[Any]) -> List[Any]:
+    out: List[Any] = []
+    for i in range(0, len(runs), 2):
+        out.extend([runs[i]] * runs[i + 1])
+    return out
+
+
+def _stock(value: Any) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+
+def _encode_series(retailer: str, rows: List[tuple]) -> tuple:
+    """rows: (day-of-month, price, in_stock, url, source) sorted by day."""
+    prices = [r[1] for r in rows]
+    cents = [round(float(p) * 100) if p is not None else 0 for p in prices]
+    return (
+        retailer,
+        _deltas([r[0] for r in rows]),
+        _deltas(cents),
+        [i for i, p in enumerate(prices) if p is None],
+        _rle([_stock(r[2]) for r in rows]),
+        _rle([r[3] for r in rows]),
+        _rle([r[4] for r in rows]),
+    )
+
+
+def _decode_series(month: str, cigar_id: str, entry: tuple) -> Iterator[ArchiveRow]:
+    retailer, days, prices, missing, stock, urls, sources = entry
+    missing = set(missing)
+    for i, (day, cents, in_stock, url, source) in enumerate(zip(
+        _undeltas(days), _undeltas(prices), _unrle(stock), _unrle(urls), _unrle(sources),
+    )):
+        price = None if i in missing else cents / 100
+        yield (retailer, cigar_id, f"{month}-{day:02d}", price, in_stock, url, source)
+
+
+# ── Reader ─────────────────────────────────────────────────────────────
+
+class ArchivePartition:
+    """One month file's index; ``rows()`` reads and inflates only the requested CIDs.
+
+    No file handle is kept between calls, so the file can be replaced
+    (``os.replace``) while a reader holds this object, on Windows too.
+    Decoded series for requested CIDs are kept in a small process-wide LRU
+    keyed by the file's signature, so repeated queries skip the inflate.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.month = self.path.stem
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.signature = (str(self.path), st.st_ino, st.st_mtime_ns, st.st_size)
+            magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a price archive")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{self.path} has format {version}, expected {FORMAT_VERSION}")
+            self.header = json.loads(f.read(header_len))
+        self._base = _PREAMBLE.size + header_len
+
+    def cigar_ids(self) -> List[str]:
+        return list(self.header["series"])
+
+    def _read_blobs(self, cigar_ids: List[str]) -> List[Tuple[str, bytes]]:
+        series = self.header["series"]
+        blobs = []
+        with open(self.path, "rb") as f:
+            for cid in cigar_ids:
+                offset, length = series[cid]
+                f.seek(self._base + offset)
+                blobs.append((cid, f.read(length)))
+        return blobs
+
+    def _decode(self, cid: str, blob: bytes) -> Iterator[ArchiveRow]:
+        for entry in json.loads(zlib.decompress(blob)):
+            yield from _decode_series(self.month, cid, entry)
+
+    def rows(self, cigar_ids: Optional[Iterable[str]] = None) -> Iterator[ArchiveRow]:
+        series = self.header["series"]
+        if cigar_ids is None:
+            # Whole-file reads (prune merges/removals) bypass the cache.
+            for cid, blob in self._read_blobs(list(series)):
+                yield from self._decode(cid, blob)
+            return
+        wanted = [c for c in cigar_ids if c in series]
+        decoded: Dict[str, Tuple[ArchiveRow, ...]] = {}
+        with _partition_lock:
+            for cid in wanted:
+                hit = _decoded_cache.get((self.signature, cid))
+                if hit is not None:
+                    _decoded_cache.move_to_end((self.signature, cid))
+                    decoded[cid] = hit
+        missing = [c for c in wanted if c not in decoded]
+        if missing:
+            fresh = {cid: tuple(self._decode(cid, blob)) for cid, blob in self._read_blobs(missing)}
+            decoded.update(fresh)
+            with _partition_lock:
+                for cid, rows in fresh.items():
+                    _decoded_cache[(self.signature, cid)] = rows
+                while len(_decoded_cache) > _DECODED_CACHE_SIZE:
+                    _decoded_cache.popitem(last=False)
+        for cid in wanted:
+            yield from decoded[cid]
+
+
+_partition_cache: Dict[str, tuple] = {}
+_partition_lock = threading.Lock()
+# (partition signature, cigar_id) -> decoded rows; one entry is one CID-month.
+_DECODED_CACHE_SIZE = 512
+_decoded_cache: "OrderedDict[tuple, Tuple[ArchiveRow, ...]]" = OrderedDict()
+
+
+def open_partition(path: Path) -> Optional[ArchivePartition]:
+    """The process-wide index of ``path``, re-read when the file is replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = str(path)
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _partition_lock:
+        cached = _partition_cache.get(key)
+        if cached is None or cached[0] != signature:
+            try:
+                partition = ArchivePartition(path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("price archive %s unusable: %s", path, e)
+                partition = None
+            cached = (signature, partition)
+            _partition_cache[key] = cached
+        return cached[1]
+
+
+def read_archive(
+    cigar_ids: Optional[Iterable[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    archive_dir: Path = ARCHIVE_DIR,
+) -> Iterator[ArchiveRow]:
+    """Archived rows for ``cigar_ids`` (all when None) with start <= date < end.
+
+    Only the month files overlapping the range are opened.
+    """
+    cids = None if cigar_ids is None else sorted(set(cigar_ids))
+    for month in archive_months(archive_dir):
+        if (start and month < _month(start)) or (end and month > _month(end)):
+            continue
+        partition = open_partition(_partition_path(archive_dir, month))
+        if partition is None:
+            continue
+        for row in partition.rows(cids):
+            if (start and row[2] < start) or (end and row[2] >= end):
+                continue
+            yield row
+
+
+# ── Writer (prune script) ──────────────────────────────────────────────
+
+def _evict(path: Path) -> None:
+    with _partition_lock:
+        _partition_cache.pop(str(path), None)
+
+
+def _write_partition(path: Path, rows: Iterable[ArchiveRow]) -> int:
+    """Write one month's rows atomically; removes the file when there are none."""
+    by_series: Dict[str, Dict[str, List[tuple]]] = defaultdict(lambda: defaultdict(list))
+    count = 0
+    for retailer, cid, day, price, in_stock, url, source in rows:
+        by_series[cid][retailer].append((int(day[8:10]), price, in_stock, url, source))
+        count += 1
+    if not count:
+        _evict(path)
+        path.unlink(missing_ok=True)
+        return 0
+
+    series: Dict[str, List[int]] = {}
+    blobs: List[bytes] = []
+    offset = 0
+    for cid in sorted(by_series):
+        entries = [
+            _encode_series(retailer, sorted(items, key=lambda r: r[0]))
+            for retailer, items in sorted(by_series[cid].items())
+        ]
+        blob = zlib.compress(json.dumps(entries, separators=(",", ":")).encode("utf-8"), 9)
+        series[cid] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps(
+        {"month": path.stem, "rows": count, "series": series},
+        sort_keys=True, separators=(",", ":"),
+    ).encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(b"".join([_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)), header, *blobs]))
+    _evict(path)
+    os.replace(tmp, path)
+    return count
+
+
+def _merge_partition(path: Path, fresh: Iterable[ArchiveRow]) -> int:
+    """Fold ``fresh`` rows into the month file; they replace archived duplicates."""
+    merged: Dict[Tuple[str, str, str], ArchiveRow] = {}
+    existing = open_partition(path)
+    if existing is None and path.exists():
+        # Never overwrite a month we can't read (e.g. a newer format).
+        raise ValueError(f"{path} exists but is not a readable price archive")
+    if existing is not None:
+        for row in existing.rows():
+            merged[row[:3]] = row
+    for row in fresh:
+        merged[row[:3]] = row
+    return _write_partition(path, merged.values())
+
+
+def archive_price_history(
+    conn: sqlite3.Connection,
+    before: str,
+    archive_dir: Path = ARCHIVE_DIR,
+) -> int:
+    """Copy every price_history row dated before ``before`` into the archive.
+
+    Pass a month boundary (``archive_boundary``) so each month is archived
+    once, complete. Rows are not deleted; the caller does that once this
+    returns. Running
+    it again over rows already archived rewrites them in place, so an
+    interrupted prune can simply be re-run. Returns the rows copied.
+    """
+    by_month: Dict[str, List[ArchiveRow]] = defaultdict(list)
+    for retailer, cid, day, price, in_stock, url, source in conn.execute(
+        """
+        SELECT retailer, cigar_id, date, price, in_stock, url, source
+        FROM price_history WHERE date < ?
+        """,
+        (before,),
+    ):
+        day = str(day)[:10]
+        by_month[_month(day)].append((retailer, cid, day, price, _stock(in_stock), url, source))
+
+    copied = 0
+    for month, rows in sorted(by_month.items()):
+        _merge_partition(_partition_path(archive_dir, month), rows)
+        copied += len(rows)
+    return copied
+
+
+def remove_archived_rows(
+    keys: Iterable[Tuple[str, str, str]],
+    archive_dir: Path = ARCHIVE_DIR,
+) -> int:
+    """Drop archived rows by (retailer, cigar_id, date). Returns rows removed."""
+    by_month: Dict[str, set] = defaultdict(set)
+    for retailer, cid, day in keys:
+        by_month[_month(day)].add((retailer, cid, str(day)[:10]))
+
+    removed = 0
+    for month, drop in by_month.items():
+        path = _partition_path(archive_dir, month)
+        partition = open_partition(path)
+        if partition is None:
+            continue
+        kept = [row for row in partition.rows() if row[:3] not in drop]
+        removed += partition.header["rows"] - len(kept)
+        _write_partition(path, kept)
+    return removed
+
+
+# ── Tiered queries ─────────────────────────────────────────────────────
+
+def query_price_history(
+    conn: sqlite3.Connection,
+    cigar_ids: Optional[Iterable[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    *,
+    priced_only: bool = False,
+    archive_dir: Path = ARCHIVE_DIR,
+) -> List[Tuple[Optional[int], str, str, str, Optional[float], Optional[bool]]]:
+    """price_history rows from the live table and the archive, by date.
+
+    Rows are ``(rowid, retailer, cigar_id, date, price, in_stock)``; rowid
+    is None for rows that only exist in the archive.
+    """
+    cids = None if cigar_ids is None else sorted(set(cigar_ids))
+    where, params = [], []
+    if cids is not None:
+        where.append(f"cigar_id IN ({','.join('?' for _ in cids)})")
+        params += cids
+    if start:
+        where.append("date >= ?")
+        params.append(start)
+    if end:
+        where.append("date < ?")
+        params.append(end)
+    if priced_only:
+        where.append("price > 0")
+    sql = "SELECT rowid, retailer, cigar_id, date, price, in_stock FROM price_history"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    rows: Dict[Tuple[str, str, str], tuple] = {}
+    for rowid, retailer, cid, day, price, in_stock in conn.execute(sql, params):
+        day = str(day)[:10]
+        rows[(retailer, cid, day)] = (rowid, retailer, cid, day, price, _stock(in_stock))
+    for retailer, cid, day, price, in_stock, _url, _source in read_archive(cids, start, end, archive_dir):
+        if priced_only and not (price and price > 0):
+            continue
+        rows.setdefault((retailer, cid, day), (None, retailer, cid, day, price, in_stock))
+    return sorted(rows.values(), key=lambda r: (r[3], r[2], r[1]))
+
+
+def archived_daily_rows(
+    cigar_ids: Iterable[str],
+    before: Optional[str] = None,
+    archive_dir: Path = ARCHIVE_DIR,
+) -> List[tuple]:
+    """price_daily-shaped rows rebuilt from the archive for days before ``before``.
+
+    ``(cigar_id, day, retailer, price, peer_median, peer_count, is_outlier)``,
+    with the same peer-median outlier flag the live table carries.
+    """
+    by_group: Dict[Tuple[str, str], List[Tuple[str, float]]] = defaultdict(list)
+    for retailer, cid, day, price, _in_stock, _url, _source in read_archive(cigar_ids, None, before, archive_dir):
+        if price and price > 0:
+            by_group[(cid, day)].append((retailer, price))
+    out: List[tuple] = []
+    for (cid, day), rows in sorted(by_group.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        out.extend(_daily_rows(cid, day, rows))
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+
+    archive = Path(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_DIR
+    total_rows = total_bytes = 0
+    for m in archive_months(archive):
+        p = _partition_path(archive, m)
+        part = open_partition(p)
+        if part is None:
+            print(f"{m}: unreadable, skipped", file=sys.stderr)
+            continue
+        size = p.stat().st_size
+        total_rows += part.header["rows"]
+        total_bytes += size
+        print(f"{m}: {part.header['rows']:>8} rows  {len(part.cigar_ids()):>6} CIDs  {size / 1024:8.1f} KB")
+    print(f"total: {total_rows} rows, {total_bytes / 1024 / 1024:.2f} MB in {archive}")
@@ -1,19 +1,117 @@
-"""Shared helpers for data/historical_prices.db schema and daily snapshots."""
+"""Shared helpers for data/historical_prices.db schema and daily snapshots.
+
+Besides the raw ``price_history`` snapshots this module maintains the
+derived tables /api/price-history reads:
+
+  price_daily   one row per (cigar_id, day, retailer) with the day's peer
+                median / peer count across retailers for that cigar_id and
+                a precomputed outlier flag
+  price_rollup  per (cigar_id, period, period_start, retailer) min/avg/max
+                of the non-outlier daily prices, period 'week' (Monday
+                start) or 'month'
+
+Both are WITHOUT ROWID tables keyed by cigar_id first, so a chart request
+is an index range read per CID. ``record_daily_price_history`` refreshes
+the (cigar_id, day) groups it writes; ``rebuild_price_series`` backfills.
+"""
 from __future__ import annotations
 
+import csv
 import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import date, datetime
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Fewer retailers than this on a day -> no peer median, nothing is flagged.
+MIN_PEERS_FOR_OUTLIER = 3
+
+ROLLUP_PERIODS = {
+    # SQLite date modifiers mapping a day to the start of its period.
+    "week": ("weekday 0", "-6 days"),
+    "month": ("start of month",),
+}
+
+
+def median_price(values: List[float]) -> float:
+    s = sorted(values)
+    n = len(s)
+    if n % 2:
+        return s[n // 2]
+    return (s[n // 2 - 1] + s[n // 2]) / 2
+
+
+def is_price_outlier(price: float, peer_median: float) -> bool:
+    """Bogus homepage scrapes and obvious typos that charts should drop."""
+    if peer_median < 100:
+        return False
+    if price <= 75 and peer_median >= 150:
+        return True
+    if price < peer_median * 0.25:
+        return True
+    if price > 2000:
+        return True
+    if price > peer_median * 5 and price > 500:
+        return True
+    return False
 
 
 def migrate_price_history_schema(conn: sqlite3.Connection) -> None:
-    """Add source provenance columns to existing databases."""
+    """Add source provenance columns and the (cigar_id, date) index to existing databases."""
     cur = conn.cursor()
     cols = {row[1] for row in cur.execute("PRAGMA table_info(price_history)")}
     if "source" not in cols:
         cur.execute("ALTER TABLE price_history ADD COLUMN source TEXT")
     if "source_updated_at" not in cols:
         cur.execute("ALTER TABLE price_history ADD COLUMN source_updated_at TEXT")
+    # refresh_price_series reads price_history per (cigar_id, date); the
+    # UNIQUE(retailer, cigar_id, date) index can't serve that.
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_price_history_cigar_date ON price_history(cigar_id, date)"
+    )
+
+
+_schema_ready: set = set()
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema_once(conn: sqlite3.Connection) -> None:
+    """Run the migrations once per database file per process."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if path and path in _schema_ready:
+        return
+    with _schema_lock:
+        migrate_price_history_schema(conn)
+        ensure_price_series_schema(conn)
+        if path:
+            _schema_ready.add(path)
+
+
+@contextmanager
+def history_writer(db_path) -> Iterator[sqlite3.Connection]:
+    """Connection for a batch of ``record_daily_price_history`` calls.
+
+    Runs in WAL mode with ``synchronous=NORMAL`` so the per-retailer
+    commits don't each wait on an fsync. On exit the database goes back
+    to the default rollback journal, which checkpoints the WAL into the
+    main file, so the committed DB stays a single self-contained file
+    that read-only openers can use as-is.
+    """
+    conn = sqlite3.connect(str(Path(db_path)), detect_types=0)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        yield conn
+        conn.commit()
+    finally:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
 
 
 def _normalize_source(raw: Optional[str]) -> str:
@@ -23,11 +121,15 @@ def _normalize_source(raw: Optional[str]) -> str:
     return "csv"
 
 
-def _source_updated_at(row: Dict[str, Any]) -> str:
+def _source_updated_at(row: Dict[str, Any], default: str) -> str:
     ts = row.get("source_updated_at")
     if ts:
         return str(ts)
-    return datetime.now().isoformat(timespec="seconds")
+    return default
+
+
+def _in_stock_flag(value: Any) -> bool:
+    return str(value).lower() not in ("false", "0", "no", "")
 
 
 def record_daily_price_history(
@@ -39,109 +141,431 @@ def record_daily_price_history(
     snapshot_date: Optional[date] = None,
     track_price_changes: bool = True,
     track_stock_changes: bool = True,
-) -> None:
-    """Insert today's price_history rows and optional change tables."""
-    migrate_price_history_schema(conn)
-    cursor = conn.cursor()
+    refresh_series: bool = True,
+    unchanged_cids: Iterable[str] = (),
+) -> List[Tuple[str, date]]:
+    """Insert today's price_history rows and optional change tables.
+
+    The pre/post diff is computed in one pass over the post rows and each
+    table is written with a single ``executemany``, all in one transaction.
+    ``unchanged_cids`` are known to have the same price and stock as before
+    and are not diffed (their pre rows may be left out of ``pre_state``).
+    Returns the (cigar_id, day) groups written. When recording several
+    retailers back to back, pass ``refresh_series=False`` and hand the
+    collected groups to ``refresh_price_series`` once at the end.
+    """
+    _ensure_schema_once(conn)
     today = snapshot_date or datetime.now().date()
+    now_iso = datetime.now().isoformat(timespec="seconds")
+
+    history_rows = [
+        (
+            retailer_key,
+            row.get("cigar_id", ""),
+            today,
+            float(row.get("price")),
+            bool(row.get("in_stock", True)),
+            row.get("url", ""),
+            _normalize_source(row.get("source")),
+            _source_updated_at(row, now_iso),
+        )
+        for row in post_state
+        if row.get("cigar_id") and row.get("price") is not None
+    ]
 
     pre_lookup = {row.get("cigar_id", ""): row for row in pre_state if row.get("cigar_id")}
     post_lookup = {row.get("cigar_id", ""): row for row in post_state if row.get("cigar_id")}
 
-    for row in post_state:
-        cigar_id = row.get("cigar_id", "")
-        price = row.get("price")
-        in_stock = row.get("in_stock", True)
-        url = row.get("url", "")
-        if cigar_id and price is not None:
-            cursor.execute(
+    unchanged = set(unchanged_cids)
+    price_rows = []
+    stock_rows = []
+    for cigar_id, post_row in post_lookup.items():
+        if cigar_id in unchanged:
+            continue
+        pre_row = pre_lookup.get(cigar_id)
+        post_price = post_row.get("price")
+        if pre_row is None:
+            if track_price_changes and post_price is not None:
+                post_price = float(post_price)
+                price_rows.append((retailer_key, cigar_id, today, None, post_price, post_price, "new"))
+            continue
+        if track_price_changes:
+            pre_price = pre_row.get("price")
+            if pre_price is not None and post_price is not None:
+                pre_price = float(pre_price)
+                post_price = float(post_price)
+                if abs(pre_price - post_price) > 0.01:
+                    price_change = post_price - pre_price
+                    change_type = "increase" if price_change > 0 else "decrease"
+                    price_rows.append(
+                        (retailer_key, cigar_id, today, pre_price, post_price, price_change, change_type)
+                    )
+        if track_stock_changes:
+            pre_stock = _in_stock_flag(pre_row.get("in_stock", True))
+            post_stock = _in_stock_flag(post_row.get("in_stock", True))
+            if pre_stock != post_stock:
+                change_type = "in_stock" if post_stock else "out_of_stock"
+                stock_rows.append((retailer_key, cigar_id, today, pre_stock, post_stock, change_type))
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO price_history
+            (retailer, cigar_id, date, price, in_stock, url, source, source_updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            history_rows,
+        )
+        if price_rows:
+            conn.executemany(
                 """
-                INSERT OR IGNORE INTO price_history
-                (retailer, cigar_id, date, price, in_stock, url, source, source_updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO price_changes
+                (retailer, cigar_id, date, old_price, new_price, price_change, change_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 """,
-                (
-                    retailer_key,
-                    cigar_id,
-                    today,
-                    float(price),
-                    bool(in_stock),
-                    url,
-                    _normalize_source(row.get("source")),
-                    _source_updated_at(row),
-                ),
+                price_rows,
             )
+        if stock_rows:
+            conn.executemany(
+                """
+                INSERT INTO stock_changes
+                (retailer, cigar_id, date, old_stock, new_stock, change_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                stock_rows,
+            )
+        groups = [(r[1], today) for r in history_rows]
+        if refresh_series:
+            refresh_price_series(conn, groups, commit=False)
+    return groups
 
-    if track_price_changes:
-        for cigar_id, post_row in post_lookup.items():
-            if cigar_id in pre_lookup:
-                pre_price = pre_lookup[cigar_id].get("price")
-                post_price = post_row.get("price")
-                if pre_price is not None and post_price is not None:
-                    pre_price = float(pre_price)
-                    post_price = float(post_price)
-                    if abs(pre_price - post_price) > 0.01:
-                        price_change = post_price - pre_price
-                        change_type = "increase" if price_change > 0 else "decrease"
-                        cursor.execute(
-                            """
-                            INSERT INTO price_changes
-                            (retailer, cigar_id, date, old_price, new_price, price_change, change_type)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                retailer_key,
-                                cigar_id,
-                                today,
-                                pre_price,
-                                post_price,
-                                price_change,
-                                change_type,
-                            ),
-                        )
-            else:
-                post_price = post_row.get("price")
-                if post_price is not None:
-                    cursor.execute(
-                        """
-                        INSERT INTO price_changes
-                        (retailer, cigar_id, date, old_price, new_price, price_change, change_type)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            retailer_key,
-                            cigar_id,
-                            today,
-                            None,
-                            float(post_price),
-                            float(post_price),
-                            "new",
-                        ),
-                    )
 
-    if track_stock_changes:
-        for cigar_id, post_row in post_lookup.items():
-            if cigar_id in pre_lookup:
-                pre_stock = pre_lookup[cigar_id].get("in_stock", True)
-                post_stock = post_row.get("in_stock", True)
-                pre_stock = str(pre_stock).lower() not in ("false", "0", "no", "")
-                post_stock = str(post_stock).lower() not in ("false", "0", "no", "")
-                if pre_stock != post_stock:
-                    change_type = "in_stock" if post_stock else "out_of_stock"
-                    cursor.execute(
-                        """
-                        INSERT INTO stock_changes
-                        (retailer, cigar_id, date, old_stock, new_stock, change_type)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            retailer_key,
-                            cigar_id,
-                            today,
-                            pre_stock,
-                            post_stock,
-                            change_type,
-                        ),
-                    )
+def _csv_price(raw: str) -> Optional[float]:
+    try:
+        return float(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def _csv_in_stock(raw: str) -> bool:
+    # Blank counts as in stock, as it did when the CSVs went through pandas.
+    return raw.strip().lower() not in ("false", "0", "no")
+
+
+def price_fingerprint(csv_path) -> Dict[str, Tuple[str, str]]:
+    """cigar_id -> raw (price, in_stock) text of a retailer CSV.
+
+    Taken before the updaters run and compared with the rewritten CSV by
+    ``record_csv_price_history``. Plain strings, so a whole fleet's worth
+    is a small fraction of the parsed rows it replaces.
+    """
+    out: Dict[str, Tuple[str, str]] = {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            cid = row.get("cigar_id")
+            if cid:
+                out[cid] = (row.get("price") or "", row.get("in_stock") or "")
+    return out
+
+
+def record_csv_price_history(
+    conn: sqlite3.Connection,
+    retailer_key: str,
+    csv_path,
+    pre_fingerprint: Dict[str, Tuple[str, str]],
+    **kwargs,
+) -> List[Tuple[str, date]]:
+    """``record_daily_price_history`` straight from a retailer CSV.
+
+    Rows whose raw price / in_stock text matches ``pre_fingerprint`` can't
+    have changed, so only the others are parsed and diffed against their
+    pre values. Keyword arguments are passed through.
+    """
+    now_iso = datetime.now().isoformat(timespec="seconds")
+    post_state: List[Dict[str, Any]] = []
+    post_raw: Dict[str, Tuple[str, str]] = {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            cid = row.get("cigar_id")
+            if not cid:
+                continue
+            raw = (row.get("price") or "", row.get("in_stock") or "")
+            post_raw[cid] = raw
+            post_state.append({
+                "cigar_id": cid,
+                "price": _csv_price(raw[0]),
+                "in_stock": _csv_in_stock(raw[1]),
+                "url": row.get("url") or None,
+                "source": row.get("source") or "csv",
+                "source_updated_at": row.get("source_updated_at") or now_iso,
+            })
+
+    unchanged = []
+    pre_state = []
+    for cid, raw in post_raw.items():
+        before = pre_fingerprint.get(cid)
+        if before is None:
+            continue
+        if before == raw:
+            unchanged.append(cid)
+        else:
+            pre_state.append({
+                "cigar_id": cid,
+                "price": _csv_price(before[0]),
+                "in_stock": _csv_in_stock(before[1]),
+            })
+    return record_daily_price_history(
+        conn, retailer_key, pre_state, post_state, unchanged_cids=unchanged, **kwargs,
+    )
+
+
+def ensure_price_series_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_daily (
+            cigar_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            retailer TEXT NOT NULL,
+            price REAL NOT NULL,
+            peer_median REAL,
+            peer_count INTEGER NOT NULL,
+            is_outlier INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cigar_id, day, retailer)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_rollup (
+            cigar_id TEXT NOT NULL,
+            period TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            retailer TEXT NOT NULL,
+            min_price REAL NOT NULL,
+            avg_price REAL NOT NULL,
+            max_price REAL NOT NULL,
+            days INTEGER NOT NULL,
+            PRIMARY KEY (cigar_id, period, period_start, retailer)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS price_series_meta (key TEXT PRIMARY KEY, value TEXT)"
+    )
+
+
+def _pruned_before(conn: sqlite3.Connection) -> Optional[str]:
+    row = conn.execute("SELECT value FROM price_series_meta WHERE key = 'pruned_before'").fetchone()
+    return row[0] if row else None
+
+
+def mark_pruned_before(conn: sqlite3.Connection, cutoff: str) -> None:
+    """Record that daily rows before ``cutoff`` were pruned (prune script).
+
+    Rollup periods starting before it still aggregate the pruned days, so
+    refreshes and rebuilds keep their existing rows instead of recomputing
+    them from the partial daily data that is left.
+    """
+    ensure_price_series_schema(conn)
+    current = _pruned_before(conn)
+    if current is None or cutoff > current:
+        conn.execute(
+            "INSERT OR REPLACE INTO price_series_meta (key, value) VALUES ('pruned_before', ?)",
+            (cutoff,),
+        )
+
+
+def _first_full_period(pruned_before: str, period: str) -> str:
+    """Start of the first period with no pruned days."""
+    start = _period_start(pruned_before, period)
+    return start if start == pruned_before[:10] else _period_end(start, period)
+
+
+def _price_series_empty(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM price_daily LIMIT 1").fetchone() is None
+
+
+def _period_start(day: str, period: str) -> str:
+    d = date.fromisoformat(day[:10])
+    if period == "week":
+        return date.fromordinal(d.toordinal() - d.weekday()).isoformat()
+    return d.replace(day=1).isoformat()
+
+
+def refresh_price_series(
+    conn: sqlite3.Connection,
+    groups: Iterable[Tuple[str, Any]],
+    *,
+    commit: bool = True,
+    backfill: bool = True,
+) -> int:
+    """Recompute price_daily and the touched rollups for (cigar_id, day) groups.
+
+    Every retailer's row for a group is rewritten, because one new price can
+    move the peer median and flip another retailer's outlier flag. A DB
+    whose series tables are still empty is backfilled in full instead; with
+    ``backfill=False`` (request paths) it is left alone for the nightly
+    writer, since a partial refresh would mark the tables as populated.
+    Returns the number of groups refreshed.
+    """
+    ensure_price_series_schema(conn)
+    if _price_series_empty(conn):
+        return rebuild_price_series(conn, commit=commit) if backfill else 0
+    keys = {(cid, str(day)[:10]) for cid, day in groups if cid and day}
+    if not keys:
+        return 0
+
+    # Set-based: stage the keys in temp tables and let one join per step
+    # do the work, instead of a handful of statements per cigar_id.
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_days (cigar_id TEXT, day TEXT)")
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS refresh_periods "
+        "(cigar_id TEXT, period TEXT, period_start TEXT, period_end TEXT)"
+    )
+    conn.execute("DELETE FROM refresh_days")
+    conn.execute("DELETE FROM refresh_periods")
+    conn.executemany("INSERT INTO refresh_days VALUES (?, ?)", keys)
+
+    by_group: Dict[Tuple[str, str], List[Tuple[str, float]]] = {key: [] for key in keys}
+    for cid, day, retailer, price in conn.execute(
+        """
+        SELECT k.cigar_id, k.day, p.retailer, p.price
+        FROM refresh_days k
+        JOIN price_history p ON p.cigar_id = k.cigar_id AND p.date = k.day
+        WHERE p.price > 0
+        """
+    ):
+        by_group[(cid, day)].append((retailer, price))
+    conn.execute(
+        "DELETE FROM price_daily WHERE (cigar_id, day) IN (SELECT cigar_id, day FROM refresh_days)"
+    )
+    conn.executemany(
+        """
+        INSERT INTO price_daily
+        (cigar_id, day, retailer, price, peer_median, peer_count, is_outlier)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (row for (cid, day), rows in by_group.items() for row in _daily_rows(cid, day, rows)),
+    )
+
+    periods = {
+        (cid, period, _period_start(day, period))
+        for cid, day in keys
+        for period in ROLLUP_PERIODS
+    }
+    conn.executemany(
+        "INSERT INTO refresh_periods VALUES (?, ?, ?, ?)",
+        [(cid, period, start, _period_end(start, period)) for cid, period, start in periods],
+    )
+    # Periods that straddle the prune cutoff keep their rows (which still
+    # include the pruned days); only rows missing there are filled in.
+    conn.execute(
+        """
+        DELETE FROM price_rollup
+        WHERE (cigar_id, period, period_start) IN
+              (SELECT cigar_id, period, period_start FROM refresh_periods
+               WHERE period_start >= ?)
+        """,
+        (_pruned_before(conn) or "",),
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO price_rollup
+        (cigar_id, period, period_start, retailer, min_price, avg_price, max_price, days)
+        SELECT d.cigar_id, k.period, k.period_start, d.retailer,
+               MIN(d.price), AVG(d.price), MAX(d.price), COUNT(*)
+        FROM refresh_periods k
+        JOIN price_daily d
+          ON d.cigar_id = k.cigar_id AND d.day >= k.period_start AND d.day < k.period_end
+        WHERE d.is_outlier = 0
+        GROUP BY d.cigar_id, k.period, k.period_start, d.retailer
+        """
+    )
+    if commit:
+        conn.commit()
+    return len(keys)
+
+
+def _daily_rows(cid: str, day: str, rows: List[Tuple[str, float]]):
+    prices = [float(p) for _, p in rows]
+    peer_median = median_price(prices) if len(prices) >= MIN_PEERS_FOR_OUTLIER else None
+    for retailer, price in rows:
+        price = float(price)
+        outlier = peer_median is not None and is_price_outlier(price, peer_median)
+        yield (cid, day, retailer, price, peer_median, len(prices), int(outlier))
+
+
+def _period_end(start: str, period: str) -> str:
+    """Start of the following period (periods end where the next one starts)."""
+    d = date.fromisoformat(start)
+    if period == "week":
+        return date.fromordinal(d.toordinal() + 7).isoformat()
+    return (d.replace(year=d.year + 1, month=1) if d.month == 12 else d.replace(month=d.month + 1)).isoformat()
+
+
+def rebuild_price_series(conn: sqlite3.Connection, *, commit: bool = True) -> int:
+    """Backfill price_daily / price_rollup from everything in price_history.
+
+    Rollup periods older than the oldest remaining price_history day are
+    left alone: the prune script trims the daily tables but keeps rollups,
+    so long-range charts survive pruning. A period that straddles the prune
+    cutoff (see mark_pruned_before) keeps its existing rows too, since they
+    still cover the pruned days; only missing rows are added.
+    """
+    ensure_price_series_schema(conn)
+    by_group: Dict[Tuple[str, str], List[Tuple[str, float]]] = defaultdict(list)
+    for cid, day, retailer, price in conn.execute(
+        "SELECT cigar_id, date, retailer, price FROM price_history WHERE price > 0"
+    ):
+        by_group[(cid, str(day)[:10])].append((retailer, price))
+
+    conn.execute("DELETE FROM price_daily")
+    for (cid, day), rows in by_group.items():
+        conn.executemany(
+            """
+            INSERT INTO price_daily
+            (cigar_id, day, retailer, price, peer_median, peer_count, is_outlier)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            _daily_rows(cid, day, rows),
+        )
+
+    if by_group:
+        oldest = min(day for _, day in by_group)
+        pruned_before = _pruned_before(conn)
+        for period, modifiers in ROLLUP_PERIODS.items():
+            start = _period_start(oldest, period)
+            full_from = start
+            if pruned_before is not None:
+                full_from = max(start, _first_full_period(pruned_before, period))
+            conn.execute(
+                "DELETE FROM price_rollup WHERE period = ? AND period_start >= ?",
+                (period, full_from),
+            )
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO price_rollup
+                (cigar_id, period, period_start, retailer, min_price, avg_price, max_price, days)
+                SELECT cigar_id, ?, date(day, {", ".join("?" for _ in modifiers)}) AS ps, retailer,
+                       MIN(price), AVG(price), MAX(price), COUNT(*)
+                FROM price_daily
+                WHERE is_outlier = 0 AND day >= ?
+                GROUP BY cigar_id, ps, retailer
+                """,
+                (period, *modifiers, start),
+            )
+    if commit:
+        conn.commit()
+    return len(by_group)
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
 
-    conn.commit()
+    db = Path(sys.argv[1]) if len(sys.argv) > 1 else (
+        Path(__file__).resolve().parents[2] / "data" / "historical_prices.db"
+    )
+    _conn = sqlite3.connect(str(db))
+    print(f"Rebuilt price series for {rebuild_price_series(_conn)} (cigar_id, day) groups in {db}")
+    _conn.close()
@@ -6,7 +6,11 @@ can be migrated incrementally but are not required to use it.
 
 Provides:
 - Session management with standard headers
-- Rate limiting between requests
+- Host-aware rate limiting (shared token buckets, see rate_limiter.py)
+- Conditional GET (ETag/Last-Modified) with parsed-result reuse on 304
+- Structured-data fast path (JSON-LD, OpenGraph, Shopify/WooCommerce JSON)
+  read from raw bytes before any DOM is built (see structured_data.py)
+- extract_many(urls): concurrent batch extraction (see fetch_engine.py)
 - Retry logic with exponential backoff
 - Price parsing utilities
 - Stock detection helpers
@@ -17,14 +21,30 @@ Provides:
 import requests
 from bs4 import BeautifulSoup
 import re
+import threading
 import time
 import logging
 from typing import Dict, Optional, Tuple, List
 from abc import ABC, abstractmethod
 
+try:
+    from .rate_limiter import get_rate_limiter
+    from .http_cache import canonical_url, get_http_cache
+    from .fetch_engine import DEFAULT_WORKERS, host_gate, run_many, run_many_async
+    from .structured_data import READERS, extract_structured, make_soup
+except ImportError:
+    from rate_limiter import get_rate_limiter
+    from http_cache import canonical_url, get_http_cache
+    from fetch_engine import DEFAULT_WORKERS, host_gate, run_many, run_many_async
+    from structured_data import READERS, extract_structured, make_soup
+
 logger = logging.getLogger(__name__)
 
 
+class NotModified(Exception):
+    """Raised by fetch_page/fetch_html on a 304 for the URL being extracted."""
+
+
 class BaseExtractor(ABC):
     """
     Base class for retailer-specific price extractors.
@@ -35,9 +55,24 @@ class BaseExtractor(ABC):
         - extract_product_data(url): Core extraction logic
 
     Subclasses may override:
-        - RATE_LIMIT_SECONDS: Delay between requests (default 1.5)
+        - PLATFORM: "Shopify", "WooCommerce", ... selects the per-platform
+          rates in data/scraper_runtime_config.json (looked up from
+          brand_retailer_matrix.json when unset)
+        - RATE_LIMIT_SECONDS: Delay between requests when the platform is
+          unknown (default 1.5)
         - REQUEST_TIMEOUT: HTTP timeout in seconds (default 15)
         - MAX_RETRIES: Number of retry attempts (default 2)
+        - CONDITIONAL_GET: Send ETag/Last-Modified validators and reuse the
+          last parsed result on 304 (default True)
+        - STRUCTURED_DATA: Structured-data readers to try before
+          extract_product_data, in priority order, from "json_ld",
+          "opengraph", "shopify", "woocommerce" (default: none). When they
+          yield every STRUCTURED_DATA_REQUIRES field and a valid price,
+          that result is used and no DOM is built; otherwise
+          extract_product_data runs and its fetch_page/fetch_html reuse
+          the already downloaded page.
+        - STRUCTURED_DATA_REQUIRES: Fields the fast path must supply
+          (default price and in_stock)
         - USER_AGENT: Browser user agent string
         - VALID_PRICE_RANGE: (min, max) tuple for price sanity checks
         - VALID_BOX_QTY_RANGE: (min, max) tuple for box quantity checks
@@ -46,10 +81,14 @@ class BaseExtractor(ABC):
     RETAILER_NAME: str = ""
     RETAILER_KEY: str = ""
     BASE_URL: str = ""
+    PLATFORM: Optional[str] = None
 
     RATE_LIMIT_SECONDS: float = 1.5
     REQUEST_TIMEOUT: int = 15
     MAX_RETRIES: int = 2
+    CONDITIONAL_GET: bool = True
+    STRUCTURED_DATA: Tuple[str, ...] = ()
+    STRUCTURED_DATA_REQUIRES: Tuple[str, ...] = ('price', 'in_stock')
 
     USER_AGENT: str = (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -69,7 +108,14 @@ class BaseExtractor(ABC):
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
         })
-        self._last_request_time = 0.0
+        unknown = set(self.STRUCTURED_DATA) - set(READERS)
+        if unknown:
+            raise ValueError(f"{type(self).__name__}.STRUCTURED_DATA: unknown readers {sorted(unknown)}")
+        self._rate_limiter = get_rate_limiter()
+        self._http_cache = get_http_cache() if self.CONDITIONAL_GET else None
+        # Per-extract() request state; thread-local so extract_many() can run
+        # several extract() calls on one instance concurrently.
+        self._req = threading.local()
 
     # ── Core interface ──────────────────────────────────────────────
 
@@ -99,13 +145,32 @@ class BaseExtractor(ABC):
         Returns the standardized format expected by all update scripts:
             {success, price, box_quantity, in_stock, discount_percent, error}
         """
-        self._rate_limit()
-
         last_error = None
         for attempt in range(1, self.MAX_RETRIES + 1):
+            req = self._req
+            req.url = url
+            req.validators = None
+            req.not_modified = False
+            req.page = None
             try:
-                raw = self.extract_product_data(url)
+                self._rate_limit(url)
+                raw = self._extract_structured(url) if self.STRUCTURED_DATA else None
+                if raw is None:
+                    raw = self.extract_product_data(url)
+                if req.not_modified:
+                    # Subclass caught NotModified in its own try/except.
+                    raise NotModified(url)
+                self._rate_limiter.record_response(url, 200)
+                if req.validators is not None and raw.get('error') is None:
+                    self._http_cache.store(url, self._cache_namespace, req.validators, raw)
                 return self._normalize_output(raw)
+            except NotModified:
+                self._rate_limiter.record_response(url, 304)
+                cached = self._http_cache.cached_result(url, self._cache_namespace)
+                if cached is not None:
+                    return self._normalize_output(cached)
+                last_error = "304 Not Modified with no cached result"
+                break
             except requests.exceptions.Timeout:
                 last_error = f"Request timed out (attempt {attempt}/{self.MAX_RETRIES})"
                 logger.warning(f"[{self.RETAILER_NAME}] {last_error}: {url}")
@@ -115,9 +180,15 @@ class BaseExtractor(ABC):
                 status = e.response.status_code if e.response is not None else "unknown"
                 last_error = f"HTTP {status} (attempt {attempt}/{self.MAX_RETRIES})"
                 logger.warning(f"[{self.RETAILER_NAME}] {last_error}: {url}")
-                if status in (429, 503) and attempt < self.MAX_RETRIES:
+                if e.response is not None:
+                    # 429/403 slow the host's bucket down; the next
+                    # _rate_limit() call then waits accordingly.
+                    self._rate_limiter.record_response(
+                        url, status, e.response.headers.get('Retry-After'),
+                    )
+                if status == 503 and attempt < self.MAX_RETRIES:
                     time.sleep(2 ** attempt)
-                else:
+                elif status != 429 or attempt >= self.MAX_RETRIES:
                     break
             except Exception as e:
                 last_error = str(e)
@@ -133,30 +204,104 @@ class BaseExtractor(ABC):
             'error': last_error,
         }
 
+    def extract_many(self, urls: List[str], max_workers: int = DEFAULT_WORKERS) -> Dict[str, Dict]:
+        """
+        Extract a batch of URLs concurrently. Returns {url: extract(url)}.
+
+        Requests stay within the host's concurrency_per_host and rate
+        limits; parsing overlaps with the next download.
+        """
+        return run_many(urls, self.extract, max_workers=max_workers)
+
+    async def extract_many_async(self, urls: List[str], max_workers: int = DEFAULT_WORKERS) -> Dict[str, Dict]:
+        """extract_many() for callers already running an event loop."""
+        return await run_many_async(urls, self.extract, max_workers=max_workers)
+
     # ── HTTP helpers ────────────────────────────────────────────────
 
+    @property
+    def _cache_namespace(self) -> str:
+        return type(self).__name__
+
+    def _get(self, url: str) -> requests.Response:
+        """
+        GET with conditional headers when ``url`` is the page extract() is
+        working on. Raises NotModified on 304 so extract() can reuse the
+        stored result; remembers fresh validators for extract() to persist.
+        """
+        req = self._req
+        current = getattr(req, 'url', None)
+        headers = None
+        is_primary = (
+            self._http_cache is not None
+            and current is not None
+            and canonical_url(url) == canonical_url(current)
+        )
+        if is_primary:
+            headers = self._http_cache.conditional_headers(url, self._cache_namespace) or None
+        # Only the network round trip holds the host slot; parsing happens
+        # after it is released so extract_many() pipelines fetch and parse.
+        with host_gate(url):
+            response = self.session.get(url, timeout=self.REQUEST_TIMEOUT, headers=headers)
+        if response.status_code == 304 and headers:
+            req.not_modified = True
+            raise NotModified(url)
+        response.raise_for_status()
+        if is_primary:
+            req.validators = response.headers
+        return response
+
+    def _page_response(self, url: str) -> requests.Response:
+        """The response the structured-data pass already downloaded, else _get()."""
+        page = getattr(self._req, 'page', None)
+        if page is not None and page[0] == canonical_url(url):
+            return page[1]
+        return self._get(url)
+
     def fetch_page(self, url: str) -> BeautifulSoup:
         """
-        Fetch a URL and return parsed BeautifulSoup.
+        Fetch a URL and return parsed BeautifulSoup (lxml when installed).
         Raises on HTTP errors so the retry loop in extract() can handle them.
         """
-        response = self.session.get(url, timeout=self.REQUEST_TIMEOUT)
-        response.raise_for_status()
-        return BeautifulSoup(response.content, 'html.parser')
+        return make_soup(self._page_response(url).content)
 
     def fetch_html(self, url: str) -> str:
         """Fetch a URL and return raw HTML string."""
-        response = self.session.get(url, timeout=self.REQUEST_TIMEOUT)
-        response.raise_for_status()
-        return response.text
+        return self._page_response(url).text
 
-    def _rate_limit(self):
-        """Enforce minimum delay between requests."""
-        now = time.time()
-        elapsed = now - self._last_request_time
-        if elapsed < self.RATE_LIMIT_SECONDS:
-            time.sleep(self.RATE_LIMIT_SECONDS - elapsed)
-        self._last_request_time = time.time()
+    def fetch_structured(self, url: str) -> Dict:
+        """
+        Fetch a URL and return whatever the STRUCTURED_DATA readers find:
+        price, in_stock, title, msrp, box_quantity (missing = not published).
+        Box quantity falls back to the title via extract_box_quantity().
+        """
+        response = self._page_response(url)
+        self._req.page = (canonical_url(url), response)
+        data = extract_structured(response.content, self.STRUCTURED_DATA, url=url)
+        if data.get('box_quantity') is None and data.get('title'):
+            data['box_quantity'] = self.extract_box_quantity(data['title'])
+        return data
+
+    def _extract_structured(self, url: str) -> Optional[Dict]:
+        """Fast-path result for extract(), or None to run extract_product_data."""
+        data = self.fetch_structured(url)
+        if any(data.get(field) is None for field in self.STRUCTURED_DATA_REQUIRES):
+            return None
+        if not self.is_valid_price(data.get('price')):
+            return None
+        msrp = data.get('msrp')
+        if msrp and msrp > data['price']:
+            data['discount_percent'] = round((1 - data['price'] / msrp) * 100, 1)
+        data['error'] = None
+        return data
+
+    def _rate_limit(self, url: Optional[str] = None):
+        """Wait for the host's shared token bucket before a request."""
+        self._rate_limiter.acquire(
+            url or self.BASE_URL or self.RETAILER_KEY,
+            platform=self.PLATFORM,
+            fallback_interval=self.RATE_LIMIT_SECONDS,
+        )
 
     # ── Price parsing utilities ─────────────────────────────────────
 
@@ -354,6 +499,7 @@ def create_extract_function(extractor_class):
     The returned function has the signature:
         extract_my_retailer_data(url: str, **kwargs) -> Dict
     and returns the standardized {success, price, box_quantity, in_stock, ...} format.
+    Batch callers can use extract_my_retailer_data.extract_many(urls).
     """
     _instance = None
 
@@ -363,6 +509,13 @@ def create_extract_function(extractor_class):
             _instance = extractor_class()
         return _instance.extract(url)
 
+    def extract_many(urls: List[str], **kwargs) -> Dict[str, Dict]:
+        nonlocal _instance
+        if _instance is None:
+            _instance = extractor_class()
+        return _instance.extract_many(urls, **kwargs)
+
     extract_fn.__doc__ = f"Extract product data from {extractor_class.RETAILER_NAME}"
     extract_fn.__name__ = f"extract_{extractor_class.RETAILER_KEY}_data"
+    extract_fn.extract_many = extract_many
     return extract_fn
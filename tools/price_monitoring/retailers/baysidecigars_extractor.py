@@ -13,6 +13,12 @@ import re
 import time
 from typing import Dict, Optional, Tuple
 
+try:
+    from .rate_limiter import DailyCapExceeded
+except ImportError:
+    from rate_limiter import DailyCapExceeded
+
+
 class BaysideCigarsExtractor:
     def __init__(self):
         self.session = requests.Session()
@@ -167,6 +173,9 @@ def extract_bayside_cigars_data(url: str) -> Dict:
                     "discount_percent": shop.get("discount_percent"),
                     "error": None,
                 }
+        except DailyCapExceeded:
+            # Out of budget for this host: the HTML fallback must not run either.
+            raise
         except Exception:
             pass
 
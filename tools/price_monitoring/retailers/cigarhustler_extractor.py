@@ -17,6 +17,11 @@ import time
 from typing import Dict, List, Optional
 from datetime import datetime
 
+try:
+    from .structured_data import json_ld_product, make_soup, opengraph_product
+except ImportError:
+    from structured_data import json_ld_product, make_soup, opengraph_product
+
 class CigarHustlerExtractor:
     def __init__(self):
         self.session = requests.Session()
@@ -41,9 +46,13 @@ class CigarHustlerExtractor:
             
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
             page_html = response.text
+
+            structured = self._extract_structured(response.content, url, page_html)
+            if structured is not None:
+                return structured
+
+            soup = make_soup(response.content)
             
             # Extract box quantity FIRST — _extract_price uses it to sanity-check
             # candidate prices via per-stick math (rejects single-stick / 5-pack
@@ -78,6 +87,42 @@ class CigarHustlerExtractor:
                 'error': str(e)
             }
     
+    # Markup that means the DOM rules are needed: sale / strikethrough
+    # prices feed _calculate_discount and the sale branch of _extract_price.
+    _DOM_ONLY_MARKERS = re.compile(rb'[Ss]ave\s*:|<s>|<del\b|<strike\b|line-through')
+
+    def _extract_structured(self, content: bytes, url: str, page_html: str) -> Optional[Dict]:
+        """
+        Box offer from JSON-LD (OpenGraph fills gaps) read off the raw bytes,
+        or None to run the DOM rules. Only plain box pages qualify: no
+        CH_DATA option prices, no 5-pack URL, no sale markup, a box count
+        in the product name and a per-stick-sane price.
+        """
+        url_lower = (url or '').lower()
+        if '5-pack' in url_lower or '5_pack' in url_lower:
+            return None
+        if self._parse_ch_data(page_html) or self._DOM_ONLY_MARKERS.search(content):
+            return None
+        data = json_ld_product(content)
+        og = opengraph_product(content)
+        for key in ('price', 'in_stock'):
+            if data.get(key) is None and og.get(key) is not None:
+                data[key] = og[key]
+        match = re.search(r'[Bb]ox [Oo]f (\d+)|(\d+)\s*[Cc]t\b', data.get('title') or '')
+        box_qty = int(match.group(1) or match.group(2)) if match else None
+        price = data.get('price')
+        if price is None or data.get('in_stock') is None or not box_qty or not 5 <= box_qty <= 100:
+            return None
+        if not self._is_sane_box_price(price, box_qty):
+            return None
+        return {
+            'box_price': round(price, 2),
+            'box_qty': box_qty,
+            'in_stock': data['in_stock'],
+            'discount_percent': None,
+            'error': None
+        }
+
     def _extract_box_quantity(self, soup: BeautifulSoup, url: str = '') -> Optional[int]:
         """Extract box/pack quantity from product page."""
         url_lower = (url or '').lower()
@@ -669,7 +714,7 @@ def test_cigarhustler_offline_box_price():
     for case in cases:
         name, html, expected, box_qty = case[:4]
         url = case[4] if len(case) > 4 else ''
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = make_soup(html)
         got = ext._extract_price(soup, box_qty=box_qty, url=url, page_html=html)
         ok = (got is None and expected is None) or (
             got is not None and expected is not None and abs(got - expected) < 0.01
@@ -0,0 +1,192 @@
+"""
+asyncio fetch engine behind ``BaseExtractor.extract_many()``.
+
+Updater scripts walk their CSV and call one ``extract_*_data(url)`` at a
+time, so every URL pays rate-limit wait + network round trip + HTML parse
+back to back. ``run_many()`` schedules a whole URL list on an event loop
+instead:
+
+  * the blocking work (``requests`` I/O and BeautifulSoup parsing) runs in
+    a bounded thread pool, never on the event loop itself
+  * a per-host gate (``concurrency_per_host`` from
+    scraper_runtime_config.json) caps in-flight *requests* per host;
+    BaseExtractor only holds it around the HTTP call, so page N is parsed
+    while page N+1 is already downloading
+  * the shared rate limiter still spaces requests per host, so pipelining
+    never makes a crawl less polite than before
+
+Existing module-level extractors plug in through ``adapt_extract_function``.
+Give it the extractor's separate ``fetch(url)`` / ``parse(url, page)``
+halves and only the fetch is gated, exactly as in BaseExtractor:
+
+    from fox_cigar import fetch_fox_cigar_page, parse_fox_cigar_page
+    extractor = adapt_extract_function(fetch=fetch_fox_cigar_page, parse=parse_fox_cigar_page)
+    results = extractor.extract_many(urls)
+
+A single ``extract_*_data(url)`` function still works, but since it fetches
+and parses inside one call the gate has to cover all of it, which
+serializes a host back to one page at a time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    from .rate_limiter import host_of
+except ImportError:
+    from rate_limiter import host_of
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+RUNTIME_CONFIG = PROJECT_ROOT / "data" / "scraper_runtime_config.json"
+
+DEFAULT_WORKERS = 4
+
+_gates: Dict[str, threading.BoundedSemaphore] = {}
+_gates_lock = threading.Lock()
+_per_host: Optional[int] = None
+
+
+def concurrency_per_host() -> int:
+    global _per_host
+    if _per_host is None:
+        try:
+            with open(RUNTIME_CONFIG, "r", encoding="utf-8") as f:
+                _per_host = max(1, int(json.load(f).get("concurrency_per_host", 1)))
+        except Exception:
+            _per_host = 1
+    return _per_host
+
+
+_held = threading.local()
+
+
+@contextmanager
+def host_gate(url: str):
+    """Hold one of the host's ``concurrency_per_host`` request slots.
+
+    Re-entrant per thread: an adapted function that gates its whole call
+    can still reach BaseExtractor._get(), which gates again.
+    """
+    host = host_of(url)
+    held = getattr(_held, "hosts", None)
+    if held is None:
+        held = _held.hosts = set()
+    if host in held:
+        yield
+        return
+    gate = _gates.get(host)
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.setdefault(host, threading.BoundedSemaphore(concurrency_per_host()))
+    with gate:
+        held.add(host)
+        try:
+            yield
+        finally:
+            held.discard(host)
+
+
+async def run_many_async(
+    urls: Iterable[str],
+    extract_one: Callable[[str], Dict],
+    *,
+    max_workers: int = DEFAULT_WORKERS,
+    gate_whole_call: bool = False,
+) -> Dict[str, Dict]:
+    """Run ``extract_one`` over ``urls`` in worker threads; results keyed by URL.
+
+    ``gate_whole_call`` holds the host gate for the entire call, for
+    extractors that do their own fetching. Exceptions become
+    ``{'success': False, 'error': ...}`` so one bad URL never sinks the batch.
+    """
+    unique: List[str] = list(dict.fromkeys(u for u in urls if u))
+    if not unique:
+        return {}
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="extract")
+
+    def _call(url: str) -> Dict:
+        try:
+            if gate_whole_call:
+                with host_gate(url):
+                    return extract_one(url)
+            return extract_one(url)
+        except Exception as e:
+            return {
+                'success': False, 'price': None, 'box_quantity': None,
+                'in_stock': False, 'discount_percent': None, 'error': str(e),
+            }
+
+    try:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, _call, u) for u in unique))
+    finally:
+        pool.shutdown(wait=False)
+    return dict(zip(unique, results))
+
+
+def run_many(urls: Iterable[str], extract_one: Callable[[str], Dict], **kwargs) -> Dict[str, Dict]:
+    """Synchronous wrapper for scripts; use run_many_async from async code."""
+    return asyncio.run(run_many_async(urls, extract_one, **kwargs))
+
+
+class FunctionExtractor:
+    """Adapter giving a legacy extractor ``extract_many``.
+
+    Either ``fn(url)`` (fetch + parse in one call, gated whole) or a
+    ``fetch(url)`` / ``parse(url, page)`` pair (only ``fetch`` gated).
+    """
+
+    def __init__(
+        self,
+        fn: Optional[Callable[..., Dict]] = None,
+        max_workers: int = DEFAULT_WORKERS,
+        *,
+        fetch: Optional[Callable[[str], Any]] = None,
+        parse: Optional[Callable[[str, Any], Dict]] = None,
+    ):
+        if fn is None and (fetch is None or parse is None):
+            raise ValueError("FunctionExtractor needs fn, or both fetch and parse")
+        self.fn = fn
+        self.fetch = fetch
+        self.parse = parse
+        self.max_workers = max_workers
+
+    @property
+    def _split(self) -> bool:
+        return self.fetch is not None and self.parse is not None
+
+    def _gated_extract(self, url: str) -> Dict:
+        with host_gate(url):
+            page = self.fetch(url)
+        return self.parse(url, page)
+
+    def extract(self, url: str) -> Dict:
+        if self.fn is not None:
+            return self.fn(url)
+        return self.parse(url, self.fetch(url))
+
+    def extract_many(self, urls: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, Dict]:
+        return asyncio.run(self.extract_many_async(urls, max_workers=max_workers))
+
+    async def extract_many_async(self, urls: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, Dict]:
+        workers = max_workers or self.max_workers
+        if self._split:
+            return await run_many_async(urls, self._gated_extract, max_workers=workers)
+        return await run_many_async(urls, self.fn, max_workers=workers, gate_whole_call=True)
+
+
+def adapt_extract_function(
+    fn: Optional[Callable[..., Dict]] = None,
+    max_workers: int = DEFAULT_WORKERS,
+    *,
+    fetch: Optional[Callable[[str], Any]] = None,
+    parse: Optional[Callable[[str, Any], Dict]] = None,
+) -> FunctionExtractor:
+    return FunctionExtractor(fn, max_workers=max_workers, fetch=fetch, parse=parse)
@@ -22,20 +22,18 @@ import requests
 from bs4 import BeautifulSoup
 import re
 from datetime import datetime
-import time
-
-
-def _ld_nodes(data):
-    """Flatten JSON-LD lists and @graph wrappers."""
-    if isinstance(data, list):
-        for item in data:
-            yield from _ld_nodes(item)
-        return
-    if isinstance(data, dict):
-        if "@graph" in data:
-            yield from _ld_nodes(data["@graph"])
-        else:
-            yield data
+
+try:
+    from .fetch_engine import host_gate
+    from .rate_limiter import DailyCapExceeded, get_rate_limiter
+    from .structured_data import json_ld_product, make_soup, opengraph_product
+except ImportError:
+    from fetch_engine import host_gate
+    from rate_limiter import DailyCapExceeded, get_rate_limiter
+    from structured_data import json_ld_product, make_soup, opengraph_product
+
+# Used when scraper_runtime_config.json has no WooCommerce rate.
+RATE_LIMIT_SECONDS = 1.0
 
 
 def _parse_money(text) -> float | None:
@@ -157,59 +155,53 @@ def _extract_from_co_variation_form(soup: BeautifulSoup, result: dict):
     return result
 
 
-def _parse_json_ld_product(soup: BeautifulSoup) -> dict:
-    """Read Product price/stock from schema.org JSON-LD when present."""
-    for script in soup.find_all("script", type="application/ld+json"):
-        raw = script.string or script.get_text()
-        if not raw or "Product" not in raw:
-            continue
-        try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
-            continue
-        for item in _ld_nodes(data):
-            if not isinstance(item, dict):
-                continue
-            types = item.get("@type")
-            type_list = types if isinstance(types, list) else [types]
-            if "Product" not in type_list:
-                continue
-            out: dict = {}
-            offers = item.get("offers")
-            if isinstance(offers, list):
-                offer = offers[0] if offers else {}
-            elif isinstance(offers, dict):
-                offer = offers
-            else:
-                offer = {}
-            # AggregateOffer.priceSpecification[0] is often the cheapest SKU (single).
-            # Box comparison should use highPrice when present.
-            price = offer.get("highPrice") or offer.get("price")
-            if price is None:
-                specs = offer.get("priceSpecification")
-                if specs and isinstance(specs, list) and specs[0].get("price"):
-                    price = specs[0].get("price")
-            if price is not None:
-                try:
-                    out["price"] = float(str(price).replace(",", ""))
-                except ValueError:
-                    pass
-            avail = str(offer.get("availability", "")).lower()
-            if avail:
-                out["in_stock"] = "instock" in avail and "outofstock" not in avail
-            name = item.get("name") or ""
-            m = re.search(r"(\d+)\s*ct\s+box", name, re.I) or re.search(
-                r"box\s+of\s+(\d+)", name, re.I
-            )
-            if m:
-                out["box_qty"] = int(m.group(1))
-            return out
-    return {}
+def _parse_json_ld_product(content: bytes) -> dict:
+    """Read Product price/stock from schema.org JSON-LD, straight from the raw page bytes."""
+    ld = json_ld_product(content)
+    out = {k: ld[k] for k in ("price", "in_stock") if k in ld}
+    name = ld.get("title") or ""
+    m = re.search(r"(\d+)\s*ct\s+box", name, re.I) or re.search(
+        r"box\s+of\s+(\d+)", name, re.I
+    )
+    if m:
+        out["box_qty"] = int(m.group(1))
+    return out
+
 
+# Any per-quantity markup (2026 co-variation rows, WooCommerce variation
+# forms, the older Cigar/Box Count sections) means product-level JSON-LD
+# and OpenGraph describe the product, not the box row: stock, sale price
+# and discount have to come from the row.
+_VARIATION_MARKERS = re.compile(
+    rb'co-var-row|co-variation-form|variations_form|data-product_variations|'
+    rb'Cigar\s+Count:|Box\s+Count:|AggregateOffer',
+    re.I,
+)
 
-def _extract_without_count_section(soup: BeautifulSoup, result: dict) -> dict:
+
+def _structured_box_offer(content: bytes) -> dict | None:
+    """Box price/stock/qty from JSON-LD (OpenGraph fills gaps), read off the raw bytes.
+
+    Only for simple product pages with a single Offer: pages with quantity
+    variations or an AggregateOffer (whose highPrice is only a guess at the
+    box) always go through the DOM rules. Only a complete answer for a box
+    (price, stock and a box count in the product name) is returned.
+    """
+    if _VARIATION_MARKERS.search(content):
+        return None
+    found = _parse_json_ld_product(content)
+    og = opengraph_product(content)
+    for key in ("price", "in_stock"):
+        if found.get(key) is None and og.get(key) is not None:
+            found[key] = og[key]
+    if found.get("price") is None or found.get("in_stock") is None or (found.get("box_qty") or 0) < 5:
+        return None
+    return found
+
+
+def _extract_without_count_section(soup: BeautifulSoup, result: dict, content: bytes) -> dict:
     """Fallback for redesigned Fox product pages (no Cigar/Box Count label)."""
-    ld = _parse_json_ld_product(soup)
+    ld = _parse_json_ld_product(content)
     quantity_options: list = []
     _extract_from_entire_page(soup, quantity_options, result)
 
@@ -371,11 +363,55 @@ def _extract_from_entire_page(soup, quantity_options, result):
     
     quantity_options[:] = unique_options  # Update the original list
 
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def _error_result(url, e):
+    import traceback
+    return {
+        'url': url,
+        'retailer': "Fox Cigar",
+        'extracted_at': datetime.now().isoformat(),
+        'success': False,
+        'error': str(e),
+        'error_details': traceback.format_exc(),
+        'price': None,
+        'in_stock': None,
+        'box_quantity': None
+    }
+
+
+def fetch_fox_cigar_page(url) -> bytes:
+    """Download a Fox Cigar product page (the network half of extract_fox_cigar_data).
+
+    Spaced by the shared per-host limiter, like BaseExtractor._rate_limit,
+    so concurrent extract_many() workers share one WooCommerce budget.
+    """
+    get_rate_limiter().acquire(url, platform="WooCommerce", fallback_interval=RATE_LIMIT_SECONDS)
+    with host_gate(url):
+        response = requests.get(url, headers=_HEADERS, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
 def extract_fox_cigar_data(url):
     """
     Extract price and stock data from Fox Cigar product pages
     Handles dynamic quantity selection and ensures box pricing extraction
     """
+    try:
+        content = fetch_fox_cigar_page(url)
+    except DailyCapExceeded:
+        raise
+    except Exception as e:
+        return _error_result(url, e)
+    return parse_fox_cigar_page(url, content)
+
+
+def parse_fox_cigar_page(url, content):
+    """Box price / stock / quantity from an already-downloaded product page (no I/O)."""
     
     def _process_quantity_option(qty_match, text, quantity_options, result):
         """Helper function to process a quantity option and extract stock status"""
@@ -411,18 +447,7 @@ def extract_fox_cigar_data(url):
                 'source_text': text
             })
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
-        # Rate limiting - 1 second for politeness
-        time.sleep(1)
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
         result = {
             'url': url,
             'retailer': "Fox Cigar",
@@ -436,6 +461,18 @@ def extract_fox_cigar_data(url):
             'debug_info': {}
         }
 
+        # Fast path: simple (box-only) product pages publish the box offer as
+        # JSON-LD, read straight from the bytes without building a DOM.
+        structured = _structured_box_offer(content)
+        if structured is not None:
+            result['price'] = structured['price']
+            result['in_stock'] = structured['in_stock']
+            result['box_quantity'] = structured['box_qty']
+            result['success'] = True
+            result['debug_info']['price_source'] = 'structured_data'
+            return result
+
+        soup = make_soup(content)
         co_result = _extract_from_co_variation_form(soup, result)
         if co_result is not None:
             return co_result
@@ -472,7 +509,7 @@ def extract_fox_cigar_data(url):
                     count_parent = count_elem.parent if hasattr(count_elem, 'parent') else None
         
         if not count_section:
-            return _extract_without_count_section(soup, result)
+            return _extract_without_count_section(soup, result, content)
         
         # Find the parent container for the count options
         # Find the parent container for the count options
@@ -746,19 +783,7 @@ def extract_fox_cigar_data(url):
         return result
         
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return {
-            'url': url,
-            'retailer': "Fox Cigar",
-            'extracted_at': datetime.now().isoformat(),
-            'success': False,
-            'error': str(e),
-            'error_details': error_details,
-            'price': None,
-            'in_stock': None,
-            'box_quantity': None
-        }
+        return _error_result(url, e)
 
 # Fox Cigar Retailer Configuration
 FOX_CIGAR_CONFIG = {
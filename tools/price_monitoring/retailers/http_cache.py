@@ -0,0 +1,196 @@
+"""
+On-disk HTTP validator cache for extractor fetches (conditional GET).
+
+``data/scraper_runtime_config.json`` lists ``persist_headers`` (ETag,
+Last-Modified). This module stores those validators per canonical URL in
+``data/extractor_http_cache.db`` (next to extractor_health.db), together
+with the last *parsed* result for that URL. The next fetch sends
+``If-None-Match`` / ``If-Modified-Since``; a ``304 Not Modified`` lets the
+caller reuse the stored result without downloading or re-parsing the page.
+
+Entries are namespaced by parser (e.g. the extractor class name) so two
+extractors that parse the same URL differently never share results, and a
+stored result is only reused for ``MAX_REUSE_DAYS`` — after that the page is
+fetched unconditionally once, so parser fixes reach every URL within a week.
+
+Only fetches that go through ``BaseExtractor.fetch_page``/``fetch_html`` or
+``shopify_json_extract.fetch_shopify_product`` use it today; the legacy
+module-level extractors still issue their own ``requests.get`` and are not
+covered until they move onto BaseExtractor.
+
+Usage (BaseExtractor and shopify_json_extract do this for you):
+
+    cache = get_http_cache()
+    headers = cache.conditional_headers(url, namespace)
+    resp = session.get(url, headers=headers)
+    if resp.status_code == 304:
+        result = cache.cached_result(url, namespace)
+    else:
+        result = parse(resp)
+        cache.store(url, namespace, resp.headers, result)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+RUNTIME_CONFIG = PROJECT_ROOT / "data" / "scraper_runtime_config.json"
+CACHE_DB = PROJECT_ROOT / "data" / "extractor_http_cache.db"
+
+MAX_REUSE_DAYS = 7
+
+_TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_cid", "mc_eid")
+
+
+def canonical_url(url: str) -> str:
+    """Lowercase scheme/host, drop fragment and tracking params.
+
+    Other query params are kept: Shopify ``?variant=`` URLs select
+    different products.
+    """
+    parts = urlsplit((url or "").strip())
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "https", parts.netloc.lower(), path, urlencode(query), ""))
+
+
+class HttpValidatorCache:
+    def __init__(self, db_path: Path = CACHE_DB, persist_headers=("ETag", "Last-Modified")):
+        self.db_path = Path(db_path)
+        self.persist_headers = {h.lower() for h in persist_headers}
+        self._local = threading.local()
+        self._disabled = not self.persist_headers
+        self.stats = {"conditional": 0, "not_modified": 0, "stored": 0}
+        if not self._disabled:
+            self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        try:
+            conn = self._conn()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_validators (
+                    url TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    result_json TEXT,
+                    fetched_at REAL,
+                    validated_at REAL,
+                    PRIMARY KEY (url, namespace)
+                )
+            """)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[http_cache] disabled, cannot open {self.db_path}: {e}")
+            self._disabled = True
+
+    def _row(self, url: str, namespace: str):
+        if self._disabled:
+            return None
+        try:
+            return self._conn().execute(
+                "SELECT etag, last_modified, result_json, fetched_at FROM http_validators "
+                "WHERE url = ? AND namespace = ?",
+                (canonical_url(url), namespace),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def conditional_headers(self, url: str, namespace: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since for ``url``, or {} when not reusable."""
+        row = self._row(url, namespace)
+        if not row:
+            return {}
+        etag, last_modified, result_json, fetched_at = row
+        if not result_json or (time.time() - (fetched_at or 0)) > MAX_REUSE_DAYS * 86400:
+            return {}
+        headers = {}
+        if etag and "etag" in self.persist_headers:
+            headers["If-None-Match"] = etag
+        if last_modified and "last-modified" in self.persist_headers:
+            headers["If-Modified-Since"] = last_modified
+        if headers:
+            self.stats["conditional"] += 1
+        return headers
+
+    def cached_result(self, url: str, namespace: str) -> Optional[Any]:
+        """Stored parsed result for a 304 response (and mark it revalidated)."""
+        row = self._row(url, namespace)
+        if not row or not row[2]:
+            return None
+        try:
+            self._conn().execute(
+                "UPDATE http_validators SET validated_at = ? WHERE url = ? AND namespace = ?",
+                (time.time(), canonical_url(url), namespace),
+            )
+            self._conn().commit()
+        except sqlite3.Error:
+            pass
+        self.stats["not_modified"] += 1
+        return json.loads(row[2])
+
+    def store(self, url: str, namespace: str, headers: Mapping[str, str], result: Any) -> None:
+        """Remember validators + parsed result from a 200 response."""
+        if self._disabled:
+            return
+        etag = headers.get("ETag") if "etag" in self.persist_headers else None
+        last_modified = headers.get("Last-Modified") if "last-modified" in self.persist_headers else None
+        if not etag and not last_modified:
+            return
+        try:
+            payload = json.dumps(result, default=str)
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("""
+                INSERT OR REPLACE INTO http_validators
+                    (url, namespace, etag, last_modified, result_json, fetched_at, validated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (canonical_url(url), namespace, etag, last_modified, payload, now, now))
+            conn.commit()
+            self.stats["stored"] += 1
+        except sqlite3.Error as e:
+            logger.warning(f"[http_cache] could not store {url}: {e}")
+
+
+_cache: Optional[HttpValidatorCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpValidatorCache:
+    """Process-wide cache configured from scraper_runtime_config.json."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                persist = ("ETag", "Last-Modified")
+                try:
+                    with open(RUNTIME_CONFIG, "r", encoding="utf-8") as f:
+                        persist = json.load(f).get("persist_headers", persist)
+                except Exception:
+                    pass
+                _cache = HttpValidatorCache(persist_headers=persist)
+    return _cache
@@ -13,6 +13,12 @@ import re
 import time
 from typing import Dict, Optional
 
+try:
+    from .rate_limiter import DailyCapExceeded
+except ImportError:
+    from rate_limiter import DailyCapExceeded
+
+
 def extract_moms_cigars_data(url: str, target_vitola: str = None, target_packaging: str = None) -> Dict:
     """
     Extract data from Mom's Cigars product pages.
@@ -56,6 +62,9 @@ def extract_moms_cigars_data(url: str, target_vitola: str = None, target_packagi
                             "available_products": [],
                             "error": None,
                         }
+        except DailyCapExceeded:
+            # Out of budget for this host: the HTML fallback must not run either.
+            raise
         except Exception:
             pass
 
@@ -0,0 +1,378 @@
+"""
+Host-aware token-bucket rate limiter shared by the extractors and harvesters.
+
+Politeness limits live in ``data/scraper_runtime_config.json``:
+
+    rates_rps      per-platform [min, max] requests/second
+    jitter_ms      [min, max] random spread applied to request spacing
+    daily_caps     per-platform request ceiling per host per day
+    retry.429_or_403.snooze_minutes / halve_rate   back-off policy
+
+Every host gets one bucket. Its rate starts at the platform maximum (or,
+if the host was still throttled when the previous run ended, the rate
+learned then) and adapts:
+
+  * success   -> after ``RAMP_EVERY`` consecutive successes the rate steps
+                 up by a tenth of the platform range, capped at the max
+  * 429 / 403 -> rate is halved (``halve_rate``), floored at a quarter of
+                 the platform minimum; a ``Retry-After`` header is honoured.
+                 Repeated strikes with no success in between walk the
+                 ``snooze_minutes`` ladder and pause the host entirely
+
+The learned rate and today's request count are persisted per host in
+``data/scraper_rate_state.db``. For hosts with a daily cap every request
+is counted in that DB as it is made, so separate updater processes share
+one cap, and the next nightly run starts at the speed the host tolerated.
+
+The platform comes from the caller (``platform="Shopify"``) or from the
+``domain -> platform`` table in ``data/brand_retailer_matrix.json``. The
+caller's ``fallback_interval`` (e.g. ``BaseExtractor.RATE_LIMIT_SECONDS``,
+``fetch_shopify_product``'s ``delay_s``) is a spacing the host is already
+known to tolerate: hosts with no known platform use it as their rate, and
+for known platforms it raises the ceiling when faster than the configured
+maximum. Either way no request goes out faster than the caller's delay.
+
+Usage:
+
+    from rate_limiter import get_rate_limiter
+    limiter = get_rate_limiter()
+    limiter.acquire(url, platform="Shopify")
+    resp = session.get(url)
+    limiter.record_response(url, resp.status_code, resp.headers.get("Retry-After"))
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+RUNTIME_CONFIG = PROJECT_ROOT / "data" / "scraper_runtime_config.json"
+RETAILER_MATRIX = PROJECT_ROOT / "data" / "brand_retailer_matrix.json"
+STATE_DB = PROJECT_ROOT / "data" / "scraper_rate_state.db"
+
+# Consecutive successes before the rate steps up.
+RAMP_EVERY = 20
+
+THROTTLE_STATUSES = (429, 403)
+
+
+class DailyCapExceeded(RuntimeError):
+    """The host has used up its ``daily_caps`` budget for today."""
+
+
+def host_of(url: str) -> str:
+    host = urlparse(url if "//" in url else f"//{url}").netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class _HostBucket:
+    __slots__ = ("host", "platform", "min_rps", "max_rps", "rps", "daily_cap",
+                 "next_at", "successes", "strikes", "snooze_until",
+                 "day", "requests", "dirty")
+
+    def __init__(self, host, platform, min_rps, max_rps, daily_cap):
+        self.host = host
+        self.platform = platform
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.rps = max_rps
+        self.daily_cap = daily_cap
+        self.next_at = 0.0
+        self.successes = 0
+        self.strikes = 0
+        self.snooze_until = 0.0  # wall clock, persisted
+        self.day = date.today().isoformat()
+        self.requests = 0
+        self.dirty = 0  # requests not yet added to the state DB
+
+
+class HostRateLimiter:
+    def __init__(
+        self,
+        config_path: Path = RUNTIME_CONFIG,
+        matrix_path: Path = RETAILER_MATRIX,
+        state_db: Optional[Path] = STATE_DB,
+    ):
+        cfg = self._load_json(config_path) or {}
+        self.rates: Dict[str, Tuple[float, float]] = {
+            k: (float(v[0]), float(v[1])) for k, v in (cfg.get("rates_rps") or {}).items()
+        }
+        self.daily_caps: Dict[str, int] = dict(cfg.get("daily_caps") or {})
+        jitter = cfg.get("jitter_ms") or [0, 0]
+        self.jitter_s = (jitter[0] / 1000.0, jitter[1] / 1000.0)
+        throttle = (cfg.get("retry") or {}).get("429_or_403") or {}
+        self.snooze_minutes = list(throttle.get("snooze_minutes") or [])
+        self.halve_rate = bool(throttle.get("halve_rate", True))
+
+        matrix = self._load_json(matrix_path) or {}
+        self.platform_by_host: Dict[str, str] = {
+            host_of(r["domain"]): r["platform"]
+            for r in matrix.get("retailers", [])
+            if r.get("domain") and r.get("platform")
+        }
+
+        self.state_db = state_db
+        self._buckets: Dict[str, _HostBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_json(path: Path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"[rate_limiter] could not read {path}: {e}")
+            return None
+
+    # ── persistence ────────────────────────────────────────────────
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self.state_db is None:
+            return None
+        try:
+            conn = sqlite3.connect(self.state_db, timeout=5)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_rate_state (
+                    host TEXT PRIMARY KEY,
+                    rps REAL,
+                    day TEXT,
+                    requests INTEGER,
+                    strikes INTEGER,
+                    snooze_until REAL
+                )
+            """)
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"[rate_limiter] state DB unavailable: {e}")
+            self.state_db = None
+            return None
+
+    def _load_state(self, b: _HostBucket) -> None:
+        conn = self._db()
+        if conn is None:
+            return
+        try:
+            row = conn.execute(
+                "SELECT rps, day, requests, strikes, snooze_until FROM host_rate_state WHERE host = ?",
+                (b.host,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return
+        rps, day, requests, strikes, snooze_until = row
+        b.strikes = int(strikes or 0)
+        b.snooze_until = float(snooze_until or 0.0)
+        # Only a host that was still being throttled keeps its backed-off
+        # rate; otherwise start at the fastest rate it is allowed.
+        if rps and (b.strikes or b.snooze_until > time.time()):
+            b.rps = min(max(float(rps), b.min_rps / 4), b.max_rps)
+        if day == b.day:
+            b.requests = int(requests or 0)
+
+    def _save_state(self, b: _HostBucket) -> None:
+        # Caller holds self._lock.
+        conn = self._db()
+        if conn is None:
+            return
+        try:
+            with conn:
+                # ``requests`` is added rather than overwritten so two
+                # processes hitting the same host still share one daily cap.
+                conn.execute("""
+                    INSERT INTO host_rate_state (host, rps, day, requests, strikes, snooze_until)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(host) DO UPDATE SET
+                        rps = excluded.rps,
+                        requests = CASE WHEN host_rate_state.day = excluded.day
+                                        THEN host_rate_state.requests + excluded.requests
+                                        ELSE excluded.requests END,
+                        day = excluded.day,
+                        strikes = excluded.strikes,
+                        snooze_until = excluded.snooze_until
+                """, (b.host, b.rps, b.day, b.dirty, b.strikes, b.snooze_until))
+        except sqlite3.Error as e:
+            logger.warning(f"[rate_limiter] could not persist state for {b.host}: {e}")
+        finally:
+            conn.close()
+        b.dirty = 0
+
+    def _reserve_request(self, b: _HostBucket) -> None:
+        """Count one request against a capped host in the shared state DB.
+
+        Caller holds self._lock. The count is re-read inside the write
+        transaction, so concurrent processes cannot overshoot the cap.
+        Raises DailyCapExceeded when it is used up. Without a state DB the
+        request is counted in-process only.
+        """
+        conn = self._db()
+        if conn is None:
+            if b.requests >= b.daily_cap:
+                raise DailyCapExceeded(f"{b.host}: daily cap of {b.daily_cap} requests reached")
+            b.requests += 1
+            b.dirty += 1
+            return
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT day, requests FROM host_rate_state WHERE host = ?", (b.host,)
+                ).fetchone()
+                used = int(row[1] or 0) if row and row[0] == b.day else 0
+                used += b.dirty
+                if used >= b.daily_cap:
+                    conn.execute("ROLLBACK")
+                    b.requests = used
+                    raise DailyCapExceeded(f"{b.host}: daily cap of {b.daily_cap} requests reached")
+                conn.execute("""
+                    INSERT INTO host_rate_state (host, rps, day, requests, strikes, snooze_until)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(host) DO UPDATE SET day = excluded.day, requests = excluded.requests
+                """, (b.host, b.rps, b.day, used + 1, b.strikes, b.snooze_until))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"[rate_limiter] could not count request for {b.host}: {e}")
+            b.requests += 1
+            b.dirty += 1
+            return
+        finally:
+            conn.close()
+        b.requests = used + 1
+        b.dirty = 0
+
+    # ── buckets ────────────────────────────────────────────────────
+
+    def _bucket(self, host: str, platform: Optional[str], fallback_interval: Optional[float]) -> _HostBucket:
+        b = self._buckets.get(host)
+        if b is not None:
+            # A later caller with a shorter known-good delay (per-product
+            # fetches after the catalog pages) lifts the ceiling.
+            if fallback_interval and fallback_interval > 0 and 1.0 / fallback_interval > b.max_rps:
+                b.max_rps = 1.0 / fallback_interval
+                if not b.strikes:
+                    b.rps = b.max_rps
+            return b
+        platform = platform or self.platform_by_host.get(host)
+        interval = fallback_interval if fallback_interval and fallback_interval > 0 else None
+        if platform in self.rates:
+            min_rps, max_rps = self.rates[platform]
+            if interval:
+                max_rps = max(max_rps, 1.0 / interval)
+        else:
+            rps = 1.0 / interval if interval else (self.rates.get("Legacy") or (0.1, 0.2))[1]
+            min_rps = max_rps = rps
+        b = _HostBucket(host, platform, min_rps, max_rps, self.daily_caps.get(platform))
+        self._load_state(b)
+        self._buckets[host] = b
+        return b
+
+    def acquire(self, url: str, platform: Optional[str] = None,
+                fallback_interval: Optional[float] = None) -> float:
+        """Block until a request to ``url``'s host is allowed. Returns seconds waited.
+
+        Raises DailyCapExceeded once the host's platform cap is used up.
+        """
+        host = host_of(url)
+        with self._lock:
+            b = self._bucket(host, platform, fallback_interval)
+            today = date.today().isoformat()
+            if b.day != today:
+                b.day, b.requests = today, 0
+            if b.daily_cap is not None:
+                self._reserve_request(b)
+
+            now = time.monotonic()
+            wait = max(0.0, b.next_at - now)
+            snooze = b.snooze_until - time.time()
+            if snooze > wait:
+                wait = snooze
+            interval = 1.0 / b.rps
+            # Spread requests so they aren't perfectly periodic, without
+            # letting the jitter change the average rate.
+            spread = min(random.uniform(*self.jitter_s), interval) / 2
+            b.next_at = now + wait + interval + random.uniform(-spread, spread)
+            if b.daily_cap is None:
+                b.requests += 1
+                b.dirty += 1
+            if b.dirty >= 10:
+                self._save_state(b)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_response(self, url: str, status: Optional[int], retry_after: Optional[str] = None) -> None:
+        """Feed a response status back so the host's rate adapts."""
+        host = host_of(url)
+        with self._lock:
+            b = self._buckets.get(host)
+            if b is None:
+                return
+            if status in THROTTLE_STATUSES:
+                b.successes = 0
+                b.strikes += 1
+                if self.halve_rate:
+                    b.rps = max(b.rps / 2, b.min_rps / 4)
+                pause = 0.0
+                if retry_after and retry_after.strip().isdigit():
+                    pause = float(retry_after.strip())
+                elif b.strikes > 1 and self.snooze_minutes:
+                    step = min(b.strikes - 2, len(self.snooze_minutes) - 1)
+                    pause = self.snooze_minutes[step] * 60.0
+                if pause:
+                    b.snooze_until = max(b.snooze_until, time.time() + pause)
+                logger.warning(
+                    f"[rate_limiter] {host} returned {status}: rate -> {b.rps:.3f} rps"
+                    + (f", pausing {pause:.0f}s" if pause else "")
+                )
+                self._save_state(b)
+            elif status is not None and 200 <= status < 400:
+                b.strikes = 0
+                b.successes += 1
+                if b.successes >= RAMP_EVERY and b.rps < b.max_rps:
+                    b.successes = 0
+                    step = max((b.max_rps - b.min_rps) / 10, b.max_rps / 20)
+                    b.rps = min(b.max_rps, b.rps + step)
+                    self._save_state(b)
+
+    def current_rate(self, url: str) -> Optional[float]:
+        b = self._buckets.get(host_of(url))
+        return b.rps if b else None
+
+    def flush(self) -> None:
+        """Persist pending request counts (called at interpreter exit)."""
+        with self._lock:
+            for b in self._buckets.values():
+                if b.dirty:
+                    self._save_state(b)
+
+
+_limiter: Optional[HostRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> HostRateLimiter:
+    """Process-wide limiter so every extractor in an updater shares host buckets."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                import atexit
+
+                _limiter = HostRateLimiter()
+                atexit.register(_limiter.flush)
+    return _limiter
@@ -30,3 +30,8 @@ def extract_shopify_store_data(url: str) -> Dict[str, Any]:
         "in_stock": shop.get("in_stock"),
         "error": None,
     }
+
+
+# Its only request is fetch_shopify_product, which answers catalog-snapshot
+# handles from memory and paces the rest through the shared rate limiter.
+extract_shopify_store_data.snapshot_aware = True
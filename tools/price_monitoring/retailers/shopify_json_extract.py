@@ -3,43 +3,156 @@ Shared helpers for Shopify storefront JSON API (/products/{handle}.json).
 
 Avoids HTML scraping and many bot challenges when the public JSON endpoint is enabled.
 Used by iHeart-style extractors and retailers that migrated to Shopify.
+
+Bulk mode: ``load_catalog_snapshot(url)`` pages the store's whole
+``/products.json?limit=250`` catalog once; afterwards ``fetch_shopify_product``
+answers any handle in that snapshot from memory and only falls back to the
+per-product endpoint for handles the catalog listing doesn't include.
 """
 
 from __future__ import annotations
 
 import re
-import time
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse
 
 import requests
 
+try:
+    from .rate_limiter import DailyCapExceeded, get_rate_limiter
+    from .http_cache import get_http_cache
+except ImportError:
+    from rate_limiter import DailyCapExceeded, get_rate_limiter
+    from http_cache import get_http_cache
+
 _DEFAULT_UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 )
 
 
+_CACHE_NAMESPACE = "shopify_product_json"
+
+CATALOG_PAGE_LIMIT = 250
+CATALOG_MAX_PAGES = 40  # 10k products; stops a misbehaving store paging forever
+
+# host -> {handle: product} from load_catalog_snapshot()
+_CATALOG_SNAPSHOTS: Dict[str, Dict[str, dict]] = {}
+
+
+def _host(url: str) -> str:
+    return urlparse(url if "//" in url else f"//{url}").netloc.lower()
+
+
+def fetch_shopify_catalog(url: str, max_pages: int = CATALOG_MAX_PAGES) -> Optional[Dict[str, dict]]:
+    """Page /products.json for the store hosting ``url``; returns {handle: product}.
+
+    Returns None when the store doesn't expose the catalog endpoint (or the
+    first page fails), so callers can fall back to per-product requests.
+    """
+    parsed = urlparse(url if "//" in url else f"https://{url}")
+    if not parsed.netloc:
+        return None
+    base = f"{parsed.scheme or 'https'}://{parsed.netloc}/products.json?limit={CATALOG_PAGE_LIMIT}&page="
+    limiter = get_rate_limiter()
+    products: Dict[str, dict] = {}
+    for page in range(1, max_pages + 1):
+        page_url = f"{base}{page}"
+        try:
+            limiter.acquire(page_url, platform="Shopify")
+            resp = requests.get(page_url, headers={"User-Agent": _DEFAULT_UA}, timeout=30)
+            limiter.record_response(page_url, resp.status_code, resp.headers.get("Retry-After"))
+            resp.raise_for_status()
+            batch = resp.json().get("products") or []
+        except DailyCapExceeded:
+            raise
+        except Exception as e:
+            if page == 1:
+                print(f"[WARN] Shopify catalog unavailable for {parsed.netloc}: {e}")
+                return None
+            # Keep what we have; the missing handles fall back per-URL.
+            print(f"[WARN] Shopify catalog page {page} failed for {parsed.netloc}: {e}")
+            break
+        for p in batch:
+            handle = (p.get("handle") or "").lower()
+            if handle:
+                products[handle] = p
+        if len(batch) < CATALOG_PAGE_LIMIT:
+            break
+    return products
+
+
+def load_catalog_snapshot(url: str) -> int:
+    """Fetch and register the catalog for ``url``'s store. Returns products loaded."""
+    host = _host(url)
+    if host in _CATALOG_SNAPSHOTS:
+        return len(_CATALOG_SNAPSHOTS[host])
+    catalog = fetch_shopify_catalog(url)
+    if catalog is None:
+        return 0
+    _CATALOG_SNAPSHOTS[host] = catalog
+    return len(catalog)
+
+
+def catalog_product(url: str) -> Optional[dict]:
+    """Product for ``url`` from a loaded catalog snapshot, or None."""
+    snapshot = _CATALOG_SNAPSHOTS.get(_host(url))
+    if not snapshot:
+        return None
+    handle = product_handle_from_url(url)
+    return snapshot.get(handle.lower()) if handle else None
+
+
+def clear_catalog_snapshots() -> None:
+    _CATALOG_SNAPSHOTS.clear()
+
+
 def product_handle_from_url(url: str) -> Optional[str]:
     m = re.search(r"/products/([^/?#]+)", url, re.I)
     return m.group(1) if m else None
 
 
 def fetch_shopify_product(url: str, delay_s: float = 0.25) -> Optional[dict]:
-    """GET .../products/{handle}.json and return the product dict, or None."""
-    if delay_s:
-        time.sleep(delay_s)
+    """GET .../products/{handle}.json and return the product dict, or None.
+
+    Paced by the shared per-host limiter at the Shopify rates from
+    scraper_runtime_config.json; ``delay_s=0`` skips the limiter entirely.
+    Sends stored ETag/Last-Modified validators and returns the cached product
+    on 304. Answers from a loaded catalog snapshot without any request.
+    Raises DailyCapExceeded once the host's daily budget is spent, so the
+    run stops instead of recording "no data" for every remaining row.
+    """
     parsed = urlparse(url)
     handle = product_handle_from_url(url)
     if not handle or not parsed.netloc:
         return None
+    snap = catalog_product(url)
+    if snap is not None:
+        return snap
     scheme = parsed.scheme or "https"
     json_url = f"{scheme}://{parsed.netloc}/products/{handle}.json"
+    limiter = get_rate_limiter() if delay_s else None
+    cache = get_http_cache()
+    headers = {"User-Agent": _DEFAULT_UA}
+    conditional = cache.conditional_headers(json_url, _CACHE_NAMESPACE)
+    headers.update(conditional)
     try:
-        resp = requests.get(json_url, headers={"User-Agent": _DEFAULT_UA}, timeout=15)
+        if limiter:
+            limiter.acquire(json_url, platform="Shopify", fallback_interval=delay_s)
+        resp = requests.get(json_url, headers=headers, timeout=15)
+        if limiter:
+            limiter.record_response(json_url, resp.status_code, resp.headers.get("Retry-After"))
+        if resp.status_code == 304 and conditional:
+            return cache.cached_result(json_url, _CACHE_NAMESPACE)
         resp.raise_for_status()
         data = resp.json()
-        return data.get("product") or None
+        product = data.get("product") or None
+        if product:
+            cache.store(json_url, _CACHE_NAMESPACE, resp.headers, product)
+        return product
+    except DailyCapExceeded as e:
+        print(f"[WARN] {e}; stopping requests to {parsed.netloc} for today")
+        raise
     except Exception:
         return None
 
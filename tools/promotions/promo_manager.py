@@ -1,93 +1,234 @@
+import copy
 import json
-from datetime import datetime
+import logging
+import os
+import time
+from datetime import date, datetime
 from pathlib import Path
 
 MIN_PROMO_PERCENT = 11
 
+PROMO_FILE = Path(__file__).parent / "promotions.json"
+
+# Scope scoring: more specific = higher priority
+SCOPE_SCORES = {
+    "cigar": 3, "line": 2, "brand": 1, "sitewide": 0
+}
+
+# The website's submit-deal form (and the root promotions.json) call a
+# store-wide code "site"; treat it the same as "sitewide".
+SCOPE_ALIASES = {"site": "sitewide"}
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class CompiledPromo:
+    """One promotions.json entry with its dates and scope pre-parsed."""
+
+    __slots__ = ("code", "discount", "scope", "scope_score", "start_date",
+                 "end_date", "brands", "excluded_brands", "brand", "lines", "raw")
+
+    def __init__(self, promo):
+        scope = promo.get('scope', 'sitewide')
+        scope = SCOPE_ALIASES.get(scope, scope)
+        self.raw = promo
+        self.code = promo.get('code', 'PROMO')
+        self.discount = promo.get('discount', 0)
+        self.scope = scope
+        self.scope_score = SCOPE_SCORES.get(scope, 0)
+        # Raises ValueError on malformed dates; the engine drops those promos.
+        self.start_date = _parse_date(promo['start_date']) if promo.get('start_date') else None
+        self.end_date = _parse_date(promo['end_date']) if promo.get('end_date') else None
+        self.brands = frozenset(promo.get('brands', []))
+        self.excluded_brands = frozenset(promo.get('excluded_brands', []))
+        self.brand = promo.get('brand')
+        self.lines = frozenset(promo.get('lines', []))
+
+    def is_live(self, today):
+        if self.start_date and today < self.start_date:
+            return False
+        if self.end_date and today > self.end_date:
+            return False
+        return True
+
+    def applies(self, brand, line):
+        """Check if promo applies to a product with this brand/line"""
+        if self.scope == 'sitewide':
+            return brand not in self.excluded_brands
+        elif self.scope == 'brand':
+            return brand in self.brands
+        elif self.scope == 'line':
+            return brand == self.brand and line in self.lines
+        return False
+
+    def discounted_cents(self, price_cents):
+        return price_cents - int(price_cents * (self.discount / 100))
+
+
+class PromotionEngine:
+    """Compiled, mtime-invalidated view of promotions.json.
+
+    The file is parsed once and re-read only when its mtime/size changes
+    (checked at most every ``check_interval`` seconds). Per-retailer rule
+    lists are filtered to the live date window once per day and kept sorted
+    by priority, so picking the best promo for a product is a short list
+    walk with no I/O. Only the current day's filtered lists are kept.
+    Shared by the web app (``app.main``) and ``apply_promos.py``.
+    """
+
+    def __init__(self, promo_file=PROMO_FILE, check_interval=1.0):
+        self.promo_file = Path(promo_file)
+        self.check_interval = check_interval
+        self._checked_at = 0.0
+        # (signature, raw, rules, active cache), replaced as one tuple so
+        # request threads never pair new rules with an old cache.
+        self._state = (None, {}, {}, {})
+        self._active_day = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        signature = self._state[0]
+        if signature is not None and (now - self._checked_at) < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            st = os.stat(self.promo_file)
+            current = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            current = (None, None)
+        if current == signature:
+            return
+        raw = self._read()
+        self._state = (current, raw, self._compile(raw), {})
+
+    def _read(self):
+        if not self.promo_file.exists():
+            logger.warning(f"Promotions file not found at {self.promo_file}")
+            return {}
+        try:
+            with open(self.promo_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load promotions: {e}")
+            return {}
+
+    @staticmethod
+    def _compile(promotions):
+        rules = {}
+        for retailer_key, promos in (promotions or {}).items():
+            compiled = []
+            for promo in promos or []:
+                if not promo.get('active', False):
+                    continue
+                try:
+                    compiled.append(CompiledPromo(promo))
+                except (ValueError, TypeError):
+                    continue
+            # Sort by scope priority, then discount amount (stable, so the
+            # file's order breaks ties exactly as before).
+            compiled.sort(key=lambda p: (-p.scope_score, -p.discount))
+            rules[retailer_key] = compiled
+        return rules
+
+    def promotions(self):
+        """Copy of the raw promotions.json contents as last loaded (inactive,
+        expired and malformed entries included; use ``active_promos`` for
+        live ones)."""
+        self._refresh()
+        return copy.deepcopy(self._state[1])
+
+    def active_promos(self, retailer_key, today=None, min_discount=0):
+        """Live promos for a retailer, best-first. The list is shared; don't mutate it."""
+        self._refresh()
+        _, _, rules, active_cache = self._state
+        if today is None:
+            today = date.today()
+        if today != self._active_day:
+            active_cache.clear()
+            self._active_day = today
+        key = (retailer_key, min_discount, today)
+        active = active_cache.get(key)
+        if active is None:
+            active = [
+                p for p in rules.get(retailer_key, ())
+                if p.discount >= min_discount and p.is_live(today)
+            ]
+            active_cache[key] = active
+        return active
+
+    def best_promo(self, retailer_key, brand=None, line=None, today=None, min_discount=0):
+        """Highest-priority live promo that applies to brand/line, or None."""
+        for promo in self.active_promos(retailer_key, today, min_discount):
+            if promo.applies(brand, line):
+                return promo
+        return None
+
+    def apply_best(self, prices_cents, retailer_keys, brands=None, lines=None,
+                   today=None, min_discount=0):
+        """Apply the best promo to N prices at once.
+
+        ``retailer_keys`` / ``brands`` / ``lines`` are parallel sequences (or
+        a single string applied to every price). Returns a list of
+        ``(promo_price_cents, code, discount)`` tuples; ``code`` and
+        ``discount`` are None where no promo applies.
+        """
+        n = len(prices_cents)
+        retailer_keys = [retailer_keys] * n if isinstance(retailer_keys, str) else retailer_keys
+        brands = [brands] * n if brands is None or isinstance(brands, str) else brands
+        lines = [lines] * n if lines is None or isinstance(lines, str) else lines
+        if today is None:
+            today = date.today()
+
+        best = {}
+        out = []
+        for price, rk, brand, line in zip(prices_cents, retailer_keys, brands, lines):
+            key = (rk, brand, line)
+            if key in best:
+                promo = best[key]
+            else:
+                promo = best[key] = self.best_promo(rk, brand, line, today, min_discount)
+            if promo is None:
+                out.append((price, None, None))
+            else:
+                out.append((promo.discounted_cents(price), promo.code, promo.discount))
+        return out
+
+
+ENGINE = PromotionEngine()
+
+
 def load_promotions():
     """Load promotions.json file"""
-    promo_file = Path(__file__).parent / "promotions.json"
-    with open(promo_file, 'r') as f:
-        return json.load(f)
+    return ENGINE.promotions()
 
 def get_active_promos(retailer_key, today=None):
     """Get active promos for a specific retailer"""
-    if today is None:
-        today = datetime.now().date()
-    
-    all_promos = load_promotions()
-    retailer_promos = all_promos.get(retailer_key, [])
-    
-    active = []
-    for promo in retailer_promos:
-        if not promo.get('active', False):
-            continue
-            
-        discount = promo.get('discount', 0)
-        if discount < MIN_PROMO_PERCENT:
-            continue
-        
-        end_date_str = promo.get('end_date')
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                if today > end_date:
-                    continue
-            except Exception as e:
-                continue
-        
-        active.append(promo)
-    
-    return active
+    return [p.raw for p in ENGINE.active_promos(retailer_key, today, MIN_PROMO_PERCENT)]
 
 def promo_applies(promo, product_row):
     """Check if promo applies to a specific product"""
-    scope = promo.get('scope', 'sitewide')
-    
-    if scope == 'sitewide':
-        # Check exclusions
-        excluded = promo.get('excluded_brands', [])
-        if product_row.get('brand') in excluded:
-            return False
-        return True
-    
-    elif scope == 'brand':
-        allowed_brands = promo.get('brands', [])
-        return product_row.get('brand') in allowed_brands
-    
-    elif scope == 'line':
-        promo_brand = promo.get('brand')
-        promo_lines = promo.get('lines', [])
-        return (product_row.get('brand') == promo_brand and 
-                product_row.get('line') in promo_lines)
-    
-    return False
+    try:
+        compiled = promo if isinstance(promo, CompiledPromo) else CompiledPromo(promo)
+    except (ValueError, TypeError):
+        return False
+    return compiled.applies(product_row.get('brand'), product_row.get('line'))
 
 def calculate_best_promo(retailer_key, product_row, today=None):
     """Calculate the best applicable promo for a product"""
-    promos = get_active_promos(retailer_key, today)
-    
-    candidates = []
-    for promo in promos:
-        if not promo_applies(promo, product_row):
-            continue
-        
-        # Scope scoring: more specific = higher priority
-        scope_scores = {
-            "cigar": 3, "line": 2, "brand": 1, "sitewide": 0
-        }
-        scope_score = scope_scores.get(promo.get('scope'), 0)
-        discount = promo.get('discount', 0)
-        
-        candidates.append((scope_score, discount, promo))
-    
-    if not candidates:
+    best_promo = ENGINE.best_promo(
+        retailer_key,
+        product_row.get('brand'),
+        product_row.get('line'),
+        today,
+        MIN_PROMO_PERCENT,
+    )
+    if best_promo is None:
         return ""
-    
-    # Sort by scope priority, then discount amount
-    candidates.sort(key=lambda x: (-x[0], -x[1]))
-    best_promo = candidates[0][2]
-    
+
     # Calculate discounted price
     try:
         price_value = product_row.get('price', 0)
@@ -96,9 +237,9 @@ def calculate_best_promo(retailer_key, product_row, today=None):
         original_price = float(price_value)
     except (ValueError, TypeError):
         return ""  # Skip products with invalid prices
-    
-    discount_percent = best_promo.get('discount', 0)
+
+    discount_percent = best_promo.discount
     discounted_price = original_price * (1 - discount_percent / 100.0)
-    
-    code = best_promo.get('code', 'PROMO')
+
+    code = best_promo.code
     return f"${discounted_price:.2f} [{int(discount_percent)}% off]|{code}"